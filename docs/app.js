@@ -1,5 +1,5 @@
-import { DATA_PATHS, ELEMENTS } from './utils/constants.js';
-import { showLoading, hideLoading, handleError } from './utils/helpers.js';
+import { DATA_PATHS, ELEMENTS, API_PAGE_SIZE, BUNDLE_VERSION } from './utils/constants.js';
+import { showLoading, hideLoading, handleError, decodeSearchIndex, loadScript } from './utils/helpers.js';
 import ChartComponent from './components/Chart.js';
 import GridComponent from './components/Grid.js';
 import SearchComponent from './components/Search.js';
@@ -7,6 +7,8 @@ import SearchComponent from './components/Search.js';
 class App {
     constructor() {
         this.data = [];
+        this.bundle = null;
+        this.searchIndex = null;
         this.chart = new ChartComponent();
         this.grid = new GridComponent();
         this.search = new SearchComponent(this.handleDataUpdate.bind(this));
@@ -17,16 +19,34 @@ class App {
         try {
             showLoading(ELEMENTS.LOADING);
             await this.loadData();
-            this.search.setData(this.data);
+            this.search.setData(this.data, this.searchIndex);
             hideLoading(ELEMENTS.LOADING);
         } catch (error) {
             handleError(error);
         }
     }
 
-    // Load data from Excel file
+    // Load agency totals from the API server, falling back to the data bundle and then the Excel file
     async loadData() {
         try {
+            this.data = await this.loadFromApi();
+            return;
+        } catch (error) {
+            console.warn('API unavailable, reading data bundle instead:', error);
+        }
+
+        try {
+            this.data = await this.loadFromBundle();
+            return;
+        } catch (error) {
+            console.warn('Data bundle unavailable, reading Excel file instead:', error);
+        }
+
+        try {
+            // SheetJS is only needed for this fallback, so it is fetched on demand
+            if (typeof XLSX === 'undefined') {
+                await loadScript(DATA_PATHS.XLSX_SCRIPT);
+            }
             const response = await fetch(DATA_PATHS.EXCEL_FILE);
             const arrayBuffer = await response.arrayBuffer();
             const workbook = XLSX.read(arrayBuffer, { type: 'array' });
@@ -50,6 +70,46 @@ class App {
         }
     }
 
+    // Load agency totals from the precomputed bundle written by scripts/data/dashboard_bundle.py
+    async loadFromBundle() {
+        const response = await fetch(DATA_PATHS.BUNDLE);
+        if (!response.ok) {
+            throw new Error(`Bundle request failed with status ${response.status}`);
+        }
+        const bundle = await response.json();
+        if (bundle.version !== BUNDLE_VERSION) {
+            throw new Error(`Unsupported bundle version ${bundle.version}`);
+        }
+        this.bundle = bundle;
+        this.searchIndex = decodeSearchIndex(bundle.search);
+
+        // Agency names are dictionary-encoded: ids index into bundle.agencies
+        return bundle.agencies
+            .map((agency, id) => ({ id, agency, wordCount: bundle.totals[id] }))
+            .filter(item => item.agency && item.wordCount);
+    }
+
+    // Load agency totals from scripts/server/api.py
+    async loadFromApi() {
+        const response = await fetch(`${DATA_PATHS.API_AGENCIES}?limit=${API_PAGE_SIZE}`);
+        if (!response.ok) {
+            throw new Error(`API request failed with status ${response.status}`);
+        }
+        const page = await response.json();
+        const data = page.items.map(item => ({ agency: item.agency, wordCount: item.wordCount }));
+
+        // Fetch any remaining pages
+        for (let offset = page.limit; offset < page.total; offset += page.limit) {
+            const next = await fetch(`${DATA_PATHS.API_AGENCIES}?limit=${API_PAGE_SIZE}&offset=${offset}`);
+            if (!next.ok) {
+                throw new Error(`API request failed with status ${next.status}`);
+            }
+            const nextPage = await next.json();
+            data.push(...nextPage.items.map(item => ({ agency: item.agency, wordCount: item.wordCount })));
+        }
+        return data.filter(item => item.agency);
+    }
+
     // Handle data updates from search/sort
     handleDataUpdate(filteredData) {
         this.chart.update(filteredData);
@@ -9,6 +9,7 @@ class SearchComponent {
         this.currentSort = SORT_TYPES.NAME;
         this.onDataUpdate = onDataUpdate;
         this.data = [];
+        this.searchIndex = null;
 
         this.initialize();
     }
@@ -34,9 +35,10 @@ class SearchComponent {
         }
     }
 
-    // Set initial data
-    setData(data) {
+    // Set initial data, with the bundle's name search index when available
+    setData(data, searchIndex = null) {
         this.data = data;
+        this.searchIndex = searchIndex;
         this.processData();
     }
 
@@ -71,7 +73,7 @@ class SearchComponent {
 
         // Apply search filter
         if (this.searchInput && this.searchInput.value) {
-            processedData = filterData(processedData, this.searchInput.value);
+            processedData = filterData(processedData, this.searchInput.value, this.searchIndex);
         }
 
         // Apply sorting
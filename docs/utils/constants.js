@@ -37,9 +37,21 @@ export const CHART_CONFIG = {
 
 // Data file paths
 export const DATA_PATHS = {
-    EXCEL_FILE: 'data/output_agency_words.xlsx'
+    API_AGENCIES: 'api/agencies',
+    BUNDLE: 'data/dashboard_bundle.json',
+    EXCEL_FILE: 'data/output_agency_words.xlsx',
+    XLSX_SCRIPT: 'https://cdnjs.cloudflare.com/ajax/libs/xlsx/0.18.5/xlsx.full.min.js'
 };
 
+// Layout version of the dashboard bundle (BUNDLE_VERSION in scripts/data/dashboard_bundle.py)
+export const BUNDLE_VERSION = 1;
+
+// Length of the substrings in the bundle's name search index (NGRAM in dashboard_bundle.py)
+export const SEARCH_NGRAM = 3;
+
+// Page size requested from the API (server maximum is 1000)
+export const API_PAGE_SIZE = 1000;
+
 // DOM element IDs
 export const ELEMENTS = {
     CHART: 'aggregatedChart',
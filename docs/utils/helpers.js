@@ -1,3 +1,5 @@
+import { SEARCH_NGRAM } from './constants.js';
+
 // Format agency name for display
 export function formatAgencyName(name) {
     if (!name) return '';
@@ -29,15 +31,51 @@ export function sortData(data, sortType) {
     });
 }
 
-// Filter data based on search term
-export function filterData(data, searchTerm) {
+// Filter data based on search term, narrowed first by the bundle's trigram index when there is one
+export function filterData(data, searchTerm, searchIndex = null) {
     if (!searchTerm) return data;
     const term = searchTerm.toLowerCase();
-    return data.filter(item => 
+    const candidates = searchIndex ? searchCandidates(searchIndex, term) : null;
+    return data.filter(item =>
+        (!candidates || item.id === undefined || candidates.has(item.id)) &&
         item.agency.toLowerCase().includes(term)
     );
 }
 
+// Agency ids whose names contain every trigram of the term, or null if the term is too short to use the index
+export function searchCandidates(searchIndex, term, ngram = SEARCH_NGRAM) {
+    if (term.length < ngram) return null;
+    let candidates = null;
+    for (let i = 0; i + ngram <= term.length; i++) {
+        const ids = searchIndex[term.slice(i, i + ngram)];
+        if (!ids) return new Set();
+        candidates = candidates ? new Set(ids.filter(id => candidates.has(id))) : new Set(ids);
+        if (!candidates.size) break;
+    }
+    return candidates;
+}
+
+// Decode the bundle's gap-encoded posting lists into agency ids
+export function decodeSearchIndex(encoded) {
+    const index = {};
+    for (const [gram, gaps] of Object.entries(encoded)) {
+        let id = 0;
+        index[gram] = gaps.map(gap => (id += gap));
+    }
+    return index;
+}
+
+// Load a classic script on demand (used for the SheetJS fallback)
+export function loadScript(src) {
+    return new Promise((resolve, reject) => {
+        const script = document.createElement('script');
+        script.src = src;
+        script.onload = resolve;
+        script.onerror = () => reject(new Error(`Failed to load ${src}`));
+        document.head.appendChild(script);
+    });
+}
+
 // Show loading state
 export function showLoading(loadingId) {
     const loader = document.getElementById(loadingId);
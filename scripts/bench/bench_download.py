@@ -0,0 +1,110 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+from datetime import datetime, timezone
+
+# Make the download scripts and the fake server importable
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROJECT_ROOT = os.path.dirname(SCRIPTS_DIR)
+sys.path.insert(0, os.path.join(SCRIPTS_DIR, "data"))
+sys.path.insert(0, os.path.join(SCRIPTS_DIR, "tests"))
+
+from bench_pipeline import DEFAULT_OUTPUT_DIR, environment
+from download_data import download_jobs
+from fake_ecfr_server import DATA_DIR, add_fault_arguments, server_from_args
+from fetch_plan import FetchJob
+from metrics import METRICS
+
+def percentile(values, q):
+    """The q-th percentile (0-100) of values by nearest rank, or None if there are none."""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, int(round(q / 100 * len(values))) - 1))]
+
+def jobs_for(server, dates):
+    """One full-title job per fixture title and date."""
+    titles = sorted({version["title"] for version in server.versions})
+    return [FetchJob(date, str(title), None) for date in dates for title in titles]
+
+async def run_download(args, concurrency, dates):
+    """Download every job from a fresh fake server into a scratch directory and measure it."""
+    server = server_from_args(args, args.fixture_dir).load_fixtures()
+    base_url = await server.start()
+    jobs = jobs_for(server, dates)
+    METRICS.reset()
+    try:
+        with tempfile.TemporaryDirectory() as data_dir:
+            start = time.perf_counter()
+            manifest = await download_jobs(jobs, data_dir, base_url, concurrency=concurrency,
+                                           rate_limit=args.rate_limit, max_retries=args.max_retries,
+                                           backoff=args.backoff)
+            elapsed = time.perf_counter() - start
+            saved = sum(1 for entry in manifest.entries.values() if entry.get("status") == "complete")
+    finally:
+        await server.stop()
+
+    served = [seconds for status, seconds in server.service_times if status == 200]
+    queue = METRICS.histograms.get(("http_queue_seconds", ()))
+    counters = {name: value for (name, labels), value in METRICS.counters.items() if not labels}
+    return {
+        "concurrency": concurrency,
+        "jobs": len(jobs),
+        "saved": saved,
+        "seconds": elapsed,
+        "mb_per_s": server.sent_bytes / (1 << 20) / elapsed if elapsed > 0 else None,
+        "files_per_s": saved / elapsed if elapsed > 0 else None,
+        "requests": sum(server.requests.values()),
+        "statuses": {str(status): count for status, count in sorted(server.statuses.items())},
+        "retries": counters.get("http_retries_total", 0),
+        "peak_in_flight": server.max_in_flight,
+        "latency_p50": percentile(served, 50),
+        "latency_p95": percentile(served, 95),
+        "latency_p99": percentile(served, 99),
+        "latency_max": max(served) if served else None,
+        "queue_mean": queue.sum / queue.count if queue and queue.count else None,
+        "queue_max": queue.max if queue else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the async downloader against a local fake eCFR server.")
+    parser.add_argument("--fixture-dir", default=DATA_DIR,
+                        help="Fixtures or recorded downloads to serve (default: docs/data)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8, 16],
+                        help="Client concurrency settings to compare (default: 1 4 8 16)")
+    parser.add_argument("--dates", type=int, default=3,
+                        help="Snapshot dates to download each title for (default: 3)")
+    parser.add_argument("--rate-limit", type=float, default=0,
+                        help="Client requests started per second, 0 for no limit (default: 0)")
+    parser.add_argument("--max-retries", type=int, default=5, help="Client retries (default: 5)")
+    parser.add_argument("--backoff", type=float, default=0.05, help="Client backoff base in seconds (default: 0.05)")
+    parser.add_argument("--output-dir", default=DEFAULT_OUTPUT_DIR, help="Where to save the JSON results")
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+    if args.latency == 0 and args.bandwidth_mb is None:
+        print("[INFO] No --latency or --bandwidth-mb set; results measure localhost and disk speed only")
+
+    dates = [f"{2023 - i}-01-01" for i in range(args.dates)]
+    results = []
+    for concurrency in args.concurrency:
+        result = asyncio.run(run_download(args, concurrency, dates))
+        results.append(result)
+        print(f"[INFO] concurrency={concurrency}: {result['saved']}/{result['jobs']} files in "
+              f"{result['seconds']:.2f}s ({result['mb_per_s']:.1f} MB/s), {result['retries']} retries, "
+              f"p50 {result['latency_p50'] or 0:.3f}s p95 {result['latency_p95'] or 0:.3f}s "
+              f"p99 {result['latency_p99'] or 0:.3f}s, peak in flight {result['peak_in_flight']}")
+
+    report = {"environment": environment(), "settings": vars(args), "results": results}
+    os.makedirs(args.output_dir, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    output = os.path.join(args.output_dir, f"bench-download-{stamp}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"[INFO] Saved benchmark results to {output}")
+
+if __name__ == "__main__":
+    main()
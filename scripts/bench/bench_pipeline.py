@@ -0,0 +1,270 @@
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import platform
+import argparse
+import resource
+import statistics
+import subprocess
+import tempfile
+import multiprocessing
+import concurrent.futures
+from datetime import datetime, timezone
+
+# Make the processing scripts importable
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROJECT_ROOT = os.path.dirname(SCRIPTS_DIR)
+sys.path.insert(0, os.path.join(SCRIPTS_DIR, "data"))
+
+import pandas as pd
+from lxml import etree
+
+from process_xml import COLUMNS, ENGINES, agency_totals, process_xml
+from results_store import ResultsStore
+from word_count import WordCounter
+
+# Configuration
+DATA_DIR = os.path.join(PROJECT_ROOT, "docs", "data")
+DEFAULT_OUTPUT_DIR = os.path.join(PROJECT_ROOT, "bench_results")
+
+def make_scaled_title(file_path, scale, output_dir):
+    """
+    Write a synthetic title whose chapters are repeated `scale` times,
+    keeping the XML well-formed. Returns the new file's path.
+    """
+    with open(file_path, "rb") as f:
+        data = f.read()
+    start = data.index(b"<DIV3")
+    end = data.rindex(b"</DIV3>") + len(b"</DIV3>")
+    body = data[start:end]
+    name = os.path.basename(file_path).replace(".xml", f"-x{scale}.xml")
+    # Keep the title-N naming process_xml expects
+    name = "title-" + name.split("title", 1)[1]
+    path = os.path.join(output_dir, name)
+    with open(path, "wb") as f:
+        f.write(data[:start])
+        for _ in range(scale):
+            f.write(body)
+        f.write(data[end:])
+    return path
+
+def count_sections(file_path):
+    """Number of DIV8 (section) elements in a file."""
+    with open(file_path, "rb") as f:
+        return f.read().count(b"<DIV8")
+
+# Word count backends: "split" tokenizes each paragraph string like the
+# iterparse and bs4 engines, "utf8" counts UTF-8 buffers in batches like the
+# fast engine
+WORD_COUNTERS = ("split", "utf8")
+
+def _paragraph_texts(file_path, backend="split"):
+    """Text of every <P> in a file, for timing the word count on its own."""
+    texts = []
+    for _, elem in etree.iterparse(file_path, events=("end",), tag="P"):
+        if backend == "utf8":
+            texts.append(etree.tostring(elem, method="text", encoding="utf-8", with_tail=False))
+        else:
+            texts.append("".join(elem.itertext()))
+    return texts
+
+# Stages: each takes the list of input files and returns a work count
+
+def stage_parse(file_paths):
+    """lxml iterparse walk with element clearing and no counting."""
+    elements = 0
+    for file_path in file_paths:
+        for _, elem in etree.iterparse(file_path, events=("end",)):
+            elements += 1
+            elem.clear()
+    return elements
+
+def stage_parse_count(file_paths, engine):
+    """Full per-file extraction with one of process_xml's engines."""
+    rows = 0
+    for file_path in file_paths:
+        rows += len(process_xml(file_path, engine))
+    return rows
+
+def stage_word_count(file_paths, backend):
+    """Count the words of pre-extracted paragraph text with one backend."""
+    texts = [text for file_path in file_paths for text in _paragraph_texts(file_path, backend)]
+    start = time.perf_counter()
+    if backend == "utf8":
+        counter = WordCounter()
+        for text in texts:
+            counter.add(text)
+        words = counter.take()
+    else:
+        words = sum(len(text.split()) for text in texts)
+    return words, time.perf_counter() - start
+
+def stage_combine(file_paths, rows):
+    """combine_rows plus the agency groupby on a table grown to `rows` rows."""
+    base = [row for file_path in file_paths for row in process_xml(file_path)]
+    repeats = max(1, rows // max(1, len(base)))
+    # Vary the date so repeated rows stay distinct snapshots
+    data = [row[:4] + [f"{2000 + i % 50}-01-01"] for i in range(repeats) for row in base]
+    df = pd.DataFrame(data, columns=COLUMNS)
+    start = time.perf_counter()
+    agency_totals(df)
+    return len(df), time.perf_counter() - start
+
+def stage_export(file_paths, output_dir):
+    """Excel export of both outputs and an upsert into a fresh SQLite store."""
+    results = {file_path: process_xml(file_path) for file_path in file_paths}
+    df = pd.DataFrame([row for rows in results.values() for row in rows], columns=COLUMNS)
+    start = time.perf_counter()
+    df.to_excel(os.path.join(output_dir, "output_chapter.xlsx"), index=False)
+    agency_totals(df).to_excel(os.path.join(output_dir, "output_agency_words.xlsx"), index=False)
+    excel_time = time.perf_counter() - start
+    start = time.perf_counter()
+    with ResultsStore(os.path.join(output_dir, "results.sqlite")) as store:
+        for file_path, rows in results.items():
+            store.upsert_rows(rows, os.path.basename(file_path))
+    return len(df), excel_time, time.perf_counter() - start
+
+def _measure(stage, file_paths, options):
+    """
+    Run one stage in this (fresh) process and return its timing and peak RSS.
+    Stages that need setup report their own timed section.
+    """
+    start = time.perf_counter()
+    if stage == "parse":
+        work = stage_parse(file_paths)
+    elif stage.startswith("parse_count:"):
+        work = stage_parse_count(file_paths, stage.split(":", 1)[1])
+    elif stage.startswith("word_count:"):
+        work, elapsed = stage_word_count(file_paths, stage.split(":", 1)[1])
+    elif stage == "combine":
+        work, elapsed = stage_combine(file_paths, options["combine_rows"])
+    elif stage == "export":
+        with tempfile.TemporaryDirectory() as output_dir:
+            work, excel_time, sqlite_time = stage_export(file_paths, output_dir)
+        elapsed = excel_time + sqlite_time
+        options = dict(options, excel_seconds=excel_time, sqlite_seconds=sqlite_time)
+    else:
+        raise ValueError(f"Unknown stage: {stage}")
+    if stage == "parse" or stage.startswith("parse_count:"):
+        elapsed = time.perf_counter() - start
+
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_mb = peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    result = {"seconds": elapsed, "work": work, "peak_rss_mb": peak_mb}
+    for key in ("excel_seconds", "sqlite_seconds"):
+        if key in options:
+            result[key] = options[key]
+    return result
+
+def run_stage(stage, dataset, file_paths, repeat, options):
+    """Run a stage `repeat` times, each in a freshly spawned process, and summarise."""
+    runs = []
+    context = multiprocessing.get_context("spawn")
+    for _ in range(repeat):
+        with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            runs.append(executor.submit(_measure, stage, file_paths, options).result())
+
+    size_mb = sum(os.path.getsize(path) for path in file_paths) / (1024 * 1024)
+    sections = sum(count_sections(path) for path in file_paths)
+    best = min(run["seconds"] for run in runs)
+    # Throughput in input terms only makes sense for the stages that read XML
+    per_input = best > 0 and stage not in ("combine", "export")
+    result = {
+        "stage": stage,
+        "dataset": dataset,
+        "files": len(file_paths),
+        "input_mb": round(size_mb, 3),
+        "sections": sections,
+        "work": runs[0]["work"],
+        "best_seconds": best,
+        "median_seconds": statistics.median(run["seconds"] for run in runs),
+        "mb_per_second": size_mb / best if per_input else None,
+        "sections_per_second": sections / best if per_input else None,
+        "work_per_second": runs[0]["work"] / best if best > 0 else None,
+        "peak_rss_mb": max(run["peak_rss_mb"] for run in runs),
+        "runs": runs,
+    }
+    if per_input:
+        rates = f"{result['mb_per_second']:8.2f} MB/s  {result['sections_per_second']:10.0f} sections/s"
+    else:
+        rates = f"{result['work_per_second'] or 0:10.0f} rows/s"
+    print(f"[INFO] {stage:<22} {dataset:<12} best {best:8.3f}s  {rates}  peak RSS {result['peak_rss_mb']:.0f} MB")
+    return result
+
+def environment():
+    """Machine and code version details saved with the results."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=PROJECT_ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the parse/count/combine/export pipeline offline.")
+    parser.add_argument("--data-dir", default=DATA_DIR, help="Directory with ECFR-title*.xml inputs (default: docs/data)")
+    parser.add_argument("--scale", type=int, nargs="*", default=[8],
+                        help="Also benchmark the largest title with its chapters repeated N times (default: 8)")
+    parser.add_argument("--engines", nargs="*", choices=sorted(ENGINES), default=sorted(ENGINES),
+                        help="Engines to time in the parse_count stage (default: all)")
+    parser.add_argument("--stages", nargs="*", default=["parse", "parse_count", "word_count", "combine", "export"],
+                        help="Stages to run (default: all)")
+    parser.add_argument("--combine-rows", type=int, default=200000,
+                        help="Rows in the combine stage's table (default: 200000)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement (default: 3)")
+    parser.add_argument("--output-dir", default=DEFAULT_OUTPUT_DIR, help="Where to save the JSON results")
+    args = parser.parse_args()
+
+    file_paths = sorted(glob.glob(os.path.join(args.data_dir, "ECFR-title*.xml")))
+    if not file_paths:
+        print(f"[ERROR] No ECFR-title*.xml files found in {args.data_dir}")
+        sys.exit(1)
+
+    scratch = tempfile.mkdtemp(prefix="ecfr-bench-")
+    try:
+        datasets = {"bundled": file_paths}
+        largest = max(file_paths, key=os.path.getsize)
+        for scale in args.scale:
+            datasets[f"scaled-x{scale}"] = [make_scaled_title(largest, scale, scratch)]
+
+        stages = []
+        for stage in args.stages:
+            if stage == "parse_count":
+                stages.extend(f"parse_count:{engine}" for engine in args.engines)
+            elif stage == "word_count":
+                stages.extend(f"word_count:{backend}" for backend in WORD_COUNTERS)
+            else:
+                stages.append(stage)
+
+        options = {"combine_rows": args.combine_rows}
+        results = []
+        for dataset, paths in datasets.items():
+            for stage in stages:
+                # The combine and export stages don't depend on input size
+                if dataset != "bundled" and stage in ("combine", "export"):
+                    continue
+                results.append(run_stage(stage, dataset, paths, args.repeat, options))
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    report = {"environment": environment(), "settings": vars(args), "results": results}
+    os.makedirs(args.output_dir, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    output = os.path.join(args.output_dir, f"bench-{stamp}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"[INFO] Saved benchmark results to {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+import os
+import json
+
+import numpy as np
+import pandas as pd
+
+from chapter_table import ChapterTable
+
+AGENCIES_FILE = os.path.join("data", "agencies.json")
+
+def save_agencies(agencies, path=AGENCIES_FILE):
+    """Save the admin API's agency list next to the downloaded XML for attribution."""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"agencies": agencies}, f, indent=2)
+    print(f"[INFO] Saved {len(agencies)} agencies to {path}")
+    return path
+
+def _per_distinct(values, normalize):
+    # Normalize each distinct value once; tables repeat the same few keys
+    codes, uniques = pd.factorize(values.fillna("").astype(str))
+    return pd.Series(normalize(pd.Series(uniques, dtype=object)).to_numpy()[codes], index=values.index)
+
+def normalize_titles(titles):
+    """Title numbers as digit strings: 1, "1" and "title1" all become "1"."""
+    return _per_distinct(titles, lambda values: values.str.replace(r"\D", "", regex=True))
+
+def _fold(name):
+    return " ".join(str(name).split()).casefold()
+
+def normalize_chapters(chapters):
+    """
+    Chapter numbers without the "CHAPTER" prefix or anything after the
+    number: "CHAPTER I", "I" and "CHAPTER I [RESERVED]" all become "I".
+    """
+    return _per_distinct(chapters, lambda values: values.str.extract(
+        r"(?i)^\s*(?:chapter\s+)?([0-9a-z]*)", expand=False).fillna("").str.upper())
+
+class AgencyLookup:
+    """
+    (title, chapter) -> agency table built from the admin API's
+    cfr_references, for exact attribution of chapter word counts.
+
+    Every agency, parent or child, is attributed the chapters it references
+    itself, so a chapter shared by a parent and its child counts towards
+    both. A reference to a whole title (no chapter, subtitle or part)
+    applies to each chapter of that title no agency claims. References
+    scoped to a subtitle or part cannot be matched to chapter rows and are
+    ignored. Rows that still match nothing keep the agency parsed from
+    their HEAD, in the API's casing when it names the same agency.
+    """
+
+    def __init__(self, table):
+        self.table = table
+        # Case- and whitespace-insensitive name -> the API's spelling of it
+        self.names = {}
+        for name in table["Agency"]:
+            self.names.setdefault(_fold(name), name)
+        # The same table as dicts: (title, chapter) -> agencies for chapter
+        # references, title -> agencies for whole-title references
+        self.chapter_agencies = {}
+        self.title_agencies = {}
+        for title, chapter, agency in table.itertuples(index=False):
+            if chapter:
+                self.chapter_agencies.setdefault((title, chapter), []).append(agency)
+            else:
+                self.title_agencies.setdefault(title, []).append(agency)
+
+    def canonical_names(self, agencies):
+        """
+        Agency names with those the API also lists (ignoring case and
+        spacing, e.g. "DEPARTMENT OF DEFENSE" from a HEAD) replaced by the
+        API's name, so the two spellings total as one agency.
+        """
+        return _per_distinct(agencies, lambda values: values.map(lambda name: self.names.get(_fold(name), name)))
+
+    @classmethod
+    def from_agencies(cls, agencies):
+        """Build the table from agencies.json's (nested) agency list."""
+        records = []
+
+        def visit(agency):
+            name = agency.get("name") or agency.get("display_name") or ""
+            for ref in agency.get("cfr_references", []):
+                if ref.get("chapter"):
+                    records.append((ref.get("title"), ref["chapter"], name))
+                elif not ref.get("subtitle") and not ref.get("part"):
+                    records.append((ref.get("title"), "", name))
+            for child in agency.get("children") or []:
+                visit(child)
+
+        for agency in agencies:
+            visit(agency)
+        table = pd.DataFrame(records, columns=["Title", "Chapter", "Agency"])
+        table["Title"] = normalize_titles(table["Title"])
+        table["Chapter"] = normalize_chapters(table["Chapter"])
+        return cls(table.drop_duplicates(["Title", "Chapter", "Agency"], ignore_index=True))
+
+    @classmethod
+    def load(cls, path=AGENCIES_FILE):
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_agencies(json.load(f).get("agencies", []))
+
+    def attribute(self, df):
+        """
+        Join chapter rows (Title, Chapter, Agency, WordCount, Date) onto the
+        table with a hash join on the normalized (title, chapter). Returns
+        the rows with Agency replaced by the referencing agencies (one row
+        per agency) and a Matched column, False for rows that kept their
+        HEAD agency (see canonical_names).
+        """
+        keyed = df.assign(_Title=normalize_titles(df["Title"]), _Chapter=normalize_chapters(df["Chapter"]),
+                          _Row=range(len(df)))
+        chapters = self.table[self.table["Chapter"] != ""]
+        titles = self.table[self.table["Chapter"] == ""]
+
+        by_chapter = keyed.merge(chapters.rename(columns={
+            "Title": "_Title", "Chapter": "_Chapter", "Agency": "_Agency"}), on=["_Title", "_Chapter"])
+        rest = keyed[~keyed["_Row"].isin(by_chapter["_Row"])]
+        by_title = rest.merge(titles[["Title", "Agency"]].rename(columns={
+            "Title": "_Title", "Agency": "_Agency"}), on="_Title")
+        unmatched = rest[~rest["_Row"].isin(by_title["_Row"])].assign(_Agency=self.canonical_names(rest["Agency"]))
+
+        matched = pd.concat([by_chapter, by_title], ignore_index=True).assign(Matched=True)
+        result = pd.concat([matched, unmatched.assign(Matched=False)], ignore_index=True)
+        result = result.sort_values("_Row", kind="stable")
+        result["Agency"] = result["_Agency"]
+        return result[list(df.columns) + ["Matched"]].reset_index(drop=True)
+
+    def attribute_codes(self, table):
+        """
+        attribute() on a ChapterTable's codes. Each distinct (title,
+        chapter) is looked up once; returns (rows, codes, agencies,
+        matched): one entry per row and attributed agency, with `codes`
+        indexing the `agencies` names, and per row whether any reference
+        matched it.
+        """
+        titles = normalize_titles(pd.Series(table.vocabularies["title"], dtype=object)).tolist()
+        chapters = normalize_chapters(pd.Series(table.vocabularies["chapter"], dtype=object)).tolist()
+        agencies = list(dict.fromkeys(self.table["Agency"]))
+        codes = {name: code for code, name in enumerate(agencies)}
+
+        # Agencies of each distinct (title, chapter), as runs of a flat array
+        pairs = table.codes("title").astype(np.int64) * max(len(chapters), 1) + table.codes("chapter")
+        distinct, inverse = np.unique(pairs, return_inverse=True)
+        flat, lengths = [], []
+        for pair in distinct:
+            title, chapter = titles[pair // max(len(chapters), 1)], chapters[pair % max(len(chapters), 1)]
+            names = self.chapter_agencies.get((title, chapter)) or self.title_agencies.get(title) or []
+            flat.extend(codes[name] for name in names)
+            lengths.append(len(names))
+        lengths = np.array(lengths, dtype=np.int64)
+        starts = np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype(np.int64)
+
+        # Matched rows, repeated once per agency
+        per_row = lengths[inverse]
+        rows = np.repeat(np.arange(len(table)), per_row)
+        within = np.arange(len(rows)) - np.repeat(np.cumsum(per_row) - per_row, per_row)
+        matched_codes = np.array(flat, dtype=np.int64)[starts[inverse][rows] + within] if len(rows) else rows
+
+        # Unmatched rows keep their HEAD agency, in the API's casing if listed
+        matched = per_row > 0
+        heads = self.canonical_names(pd.Series(table.agencies, dtype=object)).tolist()
+        head_codes = np.array([codes.setdefault(name, len(codes)) for name in heads], dtype=np.int64)
+        unmatched_rows = np.flatnonzero(~matched)
+        rows = np.concatenate([rows, unmatched_rows])
+        codes_array = np.concatenate([matched_codes, head_codes[table.codes("agency")[unmatched_rows]]])
+        return rows, codes_array, list(codes), matched
+
+    def totals(self, df):
+        """
+        Total WordCount per agency, with no fuzzy combining of name
+        variants, from chapter rows or a ChapterTable: the attributed
+        agency codes are totalled with ChapterTable.rollup_codes.
+        """
+        table = df if isinstance(df, ChapterTable) else ChapterTable.from_frame(df)
+        rows, codes, agencies, matched = self.attribute_codes(table)
+        if not matched.all():
+            print(f"[INFO] {(~matched).sum()} chapter rows ({table.counts[~matched].sum()} words) matched no "
+                  f"agency reference and keep their HEAD agency")
+        return table.rollup_codes(codes, agencies, "Agency", rows)
+
+def load_agency_lookup(path=AGENCIES_FILE):
+    """The AgencyLookup for a saved agencies.json, or None if there is none."""
+    if not path or not os.path.exists(path):
+        print(f"[INFO] No agency list at {path}; using the agency names parsed from HEADs")
+        return None
+    lookup = AgencyLookup.load(path)
+    print(f"[INFO] Attributing chapters with {len(lookup.table)} agency references from {path}")
+    return lookup
@@ -0,0 +1,208 @@
+from array import array
+
+import numpy as np
+import pandas as pd
+
+# Columns of the chapter-level rows produced by every engine. Date is the
+# snapshot date from the filename ("" if it has none).
+COLUMNS = ["Title", "Chapter", "Agency", "WordCount", "Date"]
+
+# Dictionary-encoded columns, in COLUMNS order
+KEYS = ("title", "chapter", "agency", "date")
+
+# Rollup keys accepted by ChapterTable.rollup
+ROLLUPS = {"Title": "title", "Chapter": "chapter", "Agency": "agency", "Date": "date"}
+
+def _sort_ranks(values):
+    """Rank of each distinct value in sorted order, indexed by its code."""
+    ranks = np.empty(len(values), dtype=np.int64)
+    ranks[np.argsort(np.array(values, dtype=object), kind="stable")] = np.arange(len(values))
+    return ranks
+
+class ChapterTable:
+    """
+    Chapter rows (COLUMNS) held as dictionary-encoded columns.
+
+    Title, Chapter, Agency and Date are stored once each in a vocabulary
+    (`titles`, `chapters`, `agencies`, `dates`) and every row refers to them
+    by int32 code; word counts are an int64 array. Rows can be appended as
+    the engines produce them without building a list of lists, and totals
+    and rollups are np.bincount over the codes instead of groupby over
+    object columns. to_frame() gives back the DataFrame the row lists
+    would have produced.
+    """
+
+    def __init__(self):
+        self.vocabularies = {key: [] for key in KEYS}
+        self._lookup = {key: {} for key in KEYS}
+        self._codes = {key: array("i") for key in KEYS}
+        self._counts = array("q")
+
+    def _encode(self, key, value):
+        lookup = self._lookup[key]
+        code = lookup.get(value)
+        if code is None:
+            code = lookup[value] = len(lookup)
+            self.vocabularies[key].append(value)
+        return code
+
+    def append(self, row):
+        """Append one [Title, Chapter, Agency, WordCount, Date] row."""
+        title, chapter, agency, word_count, date = row
+        for key, value in zip(KEYS, (title, chapter, agency, date)):
+            self._codes[key].append(self._encode(key, value))
+        self._counts.append(word_count)
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(row)
+        return self
+
+    @classmethod
+    def from_rows(cls, rows):
+        return cls().extend(rows)
+
+    @classmethod
+    def from_frame(cls, df):
+        """Encode a DataFrame of chapter rows; a missing Date column reads as ""."""
+        table = cls()
+        for key, column in zip(KEYS, ("Title", "Chapter", "Agency", "Date")):
+            values = df[column] if column in df.columns else pd.Series("", index=df.index)
+            codes, uniques = pd.factorize(values, use_na_sentinel=False)
+            table.vocabularies[key] = list(uniques)
+            table._lookup[key] = {value: code for code, value in enumerate(uniques)}
+            table._codes[key] = array("i", codes.astype(np.int32).tobytes())
+        table._counts = array("q", df["WordCount"].to_numpy(dtype=np.int64).tobytes())
+        return table
+
+    def __len__(self):
+        return len(self._counts)
+
+    def codes(self, key):
+        return np.frombuffer(self._codes[key], dtype=np.int32) if len(self) else np.zeros(0, dtype=np.int32)
+
+    @property
+    def counts(self):
+        return np.frombuffer(self._counts, dtype=np.int64) if len(self) else np.zeros(0, dtype=np.int64)
+
+    @property
+    def agencies(self):
+        return self.vocabularies["agency"]
+
+    def to_frame(self, rows=None, counts=None):
+        """The rows as a COLUMNS DataFrame; optionally only `rows` (positions), with `counts` as WordCount."""
+        rows = np.arange(len(self)) if rows is None else rows
+        columns = {}
+        for key, column in zip(KEYS, ("Title", "Chapter", "Agency", "Date")):
+            vocabulary = np.empty(len(self.vocabularies[key]), dtype=object)
+            vocabulary[:] = self.vocabularies[key]
+            columns[column] = vocabulary[self.codes(key)[rows]]
+        columns["WordCount"] = self.counts[rows] if counts is None else counts
+        return pd.DataFrame({column: columns[column] for column in COLUMNS})
+
+    def combine(self):
+        """
+        combine_rows on the encoded columns: returns (rows, counts), the
+        positions of the rows that survive in (Title, Chapter) order and
+        their combined word counts.
+
+        Within each (Title, Chapter) group, a row whose Agency is a proper
+        substring of a later row's Agency absorbs that row's WordCount, and
+        the later row is dropped. This gives the same result as the original
+        pairwise loop (including its handling of chains such as A in B in C)
+        but only compares distinct agency names, indexed by length, and sums
+        the counts with array operations.
+        """
+        titles, chapters = self.codes("title"), self.codes("chapter")
+        agencies = self.codes("agency")
+        # A stable sort reproduces groupby's group order and within-group row order
+        order = np.lexsort((_sort_ranks(self.vocabularies["chapter"])[chapters],
+                            _sort_ranks(self.vocabularies["title"])[titles]))
+        counts = self.counts[order]
+
+        # Row positions of each distinct (Title, Chapter, Agency), grouped by
+        # sorting on a single integer key
+        group = titles[order].astype(np.int64) * max(len(self.vocabularies["chapter"]), 1) + chapters[order]
+        key = group * max(len(self.agencies), 1) + agencies[order]
+        distinct, first, inverse = np.unique(key, return_index=True, return_inverse=True)
+        by_key = np.argsort(inverse, kind="stable")
+        bounds = np.concatenate([[0], np.cumsum(np.bincount(inverse, minlength=len(distinct)))])
+
+        # Distinct agencies per (Title, Chapter) in order of first appearance
+        groups = {}
+        for k in np.argsort(first, kind="stable"):
+            groups.setdefault(group[first[k]], []).append(k)
+
+        result = counts.copy()
+        deleted = np.zeros(len(order), dtype=bool)
+        for keys in groups.values():
+            if len(keys) < 2:
+                continue
+            names = [(self.agencies[agencies[order[first[k]]]], k) for k in keys]
+            names.sort(key=lambda name: len(name[0]))
+            for n, (longer, k) in enumerate(names):
+                shorter = [j for name, j in names[:n] if len(name) < len(longer) and name in longer]
+                if not shorter:
+                    continue
+
+                # Rows of the longer name, and rows of every name it contains
+                rows = by_key[bounds[k]:bounds[k + 1]]
+                candidates = np.sort(np.concatenate([by_key[bounds[j]:bounds[j + 1]] for j in shorter]))
+
+                # Each longer row is absorbed by the first earlier candidate row;
+                # any other earlier candidate rows each pick up the -1 deletion marker
+                earlier = np.searchsorted(candidates, rows)
+                absorbed = rows[earlier > 0]
+                if len(absorbed) == 0:
+                    continue
+                deleted[absorbed] = True
+                result[candidates[0]] += counts[absorbed].sum()
+                others = candidates[1:]
+                result[others] -= len(rows) - np.searchsorted(rows, others, side="right")
+
+        # Rows absorbed by another row restart from the -1 marker, and rows
+        # marked for deletion are removed
+        result[deleted] += -1 - counts[deleted]
+        keep = result != -1
+        return order[keep], result[keep]
+
+    def rollup(self, by="Agency", rows=None, counts=None):
+        """
+        Total WordCount per value of `by` (a column name in ROLLUPS) with
+        np.bincount, over the non-zero rows. Values are sorted, as groupby
+        sorts them. `rows` and `counts` select and override rows, as
+        returned by combine().
+        """
+        key = ROLLUPS[by]
+        rows = np.arange(len(self)) if rows is None else rows
+        return self.rollup_codes(self.codes(key)[rows], self.vocabularies[key], by, rows, counts)
+
+    def rollup_codes(self, codes, vocabulary, by="Agency", rows=None, counts=None):
+        """
+        rollup() with the group of each selected row given as `codes` into
+        `vocabulary` rather than taken from one of the table's columns,
+        e.g. agencies attributed from cfr_references. `rows` may repeat a
+        row to count it towards several groups.
+        """
+        rows = np.arange(len(self)) if rows is None else rows
+        counts = self.counts[rows] if counts is None else counts
+        nonzero = counts != 0
+        codes = np.asarray(codes, dtype=np.int64)[nonzero]
+        size = len(vocabulary)
+        totals = np.bincount(codes, weights=counts[nonzero], minlength=size)
+        present = np.bincount(codes, minlength=size) > 0
+        # Float sums are exact below 2**53 words; redo them in integers
+        # anyway so the result matches groupby to the last digit
+        if len(codes) and np.abs(totals).max() >= 2 ** 53:
+            totals = np.zeros(size, dtype=np.int64)
+            np.add.at(totals, codes, counts[nonzero])
+        names = np.empty(size, dtype=object)
+        names[:] = list(vocabulary)
+        found = np.flatnonzero(present)
+        found = found[np.argsort(names[found], kind="stable")]
+        return pd.DataFrame({by: names[found], "WordCount": totals[found].astype(np.int64)})
+
+    def agency_totals(self):
+        """Total WordCount per agency after combine(), as output_agency_words.xlsx."""
+        rows, counts = self.combine()
+        return self.rollup("Agency", rows, counts)
@@ -0,0 +1,46 @@
+import gzip
+
+# zstandard is optional; gzip is always available
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# File suffix added for each supported compression
+COMPRESSION_SUFFIXES = {
+    "none": "",
+    "gzip": ".gz",
+    "zstd": ".zst",
+}
+
+XML_SUFFIXES = tuple(".xml" + suffix for suffix in COMPRESSION_SUFFIXES.values())
+
+def is_xml_file(filename):
+    """True for .xml files and their .xml.gz / .xml.zst compressed forms."""
+    return filename.endswith(XML_SUFFIXES)
+
+def compressed_filename(filename, compression="none"):
+    """Add the suffix for the given compression to a filename."""
+    return filename + COMPRESSION_SUFFIXES[compression]
+
+def _require_zstandard():
+    if zstandard is None:
+        raise RuntimeError("zstd compression requires the 'zstandard' package (pip install zstandard)")
+
+def open_writer(path, compression="none"):
+    """Open a binary file for writing, compressing on the fly if requested."""
+    if compression == "gzip":
+        return gzip.open(path, "wb")
+    if compression == "zstd":
+        _require_zstandard()
+        return zstandard.ZstdCompressor().stream_writer(open(path, "wb"))
+    return open(path, "wb")
+
+def open_xml(path):
+    """Open an XML file for binary reading, decompressing it as a stream if needed."""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if path.endswith(".zst"):
+        _require_zstandard()
+        return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"))
+    return open(path, "rb")
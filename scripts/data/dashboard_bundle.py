@@ -0,0 +1,123 @@
+import os
+import json
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from agency_lookup import AGENCIES_FILE, load_agency_lookup
+from history import snapshot_totals
+from process_xml import COLUMNS, agency_totals, combine_rows
+from results_store import DEFAULT_STORE, ResultsStore
+
+DEFAULT_BUNDLE = os.path.join("data", "dashboard_bundle.json")
+
+# Bump when the layout changes; docs/app.js checks it before using a bundle
+BUNDLE_VERSION = 1
+
+# Length of the substrings indexed for name search
+NGRAM = 3
+
+def name_ngrams(name):
+    """Distinct lowercase NGRAM-character substrings of an agency name."""
+    name = name.lower()
+    return {name[i:i + NGRAM] for i in range(len(name) - NGRAM + 1)}
+
+def search_index(names):
+    """
+    Trigram index over agency names: each trigram maps to the sorted indices
+    of the names containing it, stored as gaps (the first index, then the
+    difference to each next one) to keep the JSON small. A search term of
+    NGRAM or more characters can only match names in the intersection of its
+    trigrams' lists, so the dashboard checks those few names instead of
+    scanning every one.
+    """
+    index = {}
+    for i, name in enumerate(names):
+        for gram in name_ngrams(name):
+            index.setdefault(gram, []).append(i)
+    return {gram: np.diff(postings, prepend=0).tolist() for gram, postings in sorted(index.items())}
+
+def build_bundle(df, totals=None, lookup=None):
+    """
+    Precompute the dashboard's data from chapter rows (COLUMNS).
+
+    Agency names are stored once in `agencies` and every table refers to
+    them by position:
+    - `totals`: word count per agency, as in output_agency_words.xlsx
+      (`totals` may be passed in if agency_totals was already computed)
+    - `dates`/`byDate`: per-agency counts for each snapshot date, as one
+      flat row-major array (agency * len(dates) + date)
+    - `titles`/`byTitle`: non-zero (agency, title, count) triples as three
+      parallel arrays
+    - `search`: the trigram name index from search_index()
+
+    Chapters are attributed to agencies with `lookup` (an AgencyLookup)
+    when given, as in agency_totals.
+    """
+    if "Date" not in df.columns:
+        df = df.assign(Date="")
+    if totals is None:
+        totals = agency_totals(df, lookup)
+
+    by_title = lookup.attribute(df) if lookup is not None else combine_rows(df)
+    by_title = by_title[by_title["WordCount"] != 0]
+    by_title = by_title.groupby(["Agency", "Title"])["WordCount"].sum().reset_index()
+    by_date = snapshot_totals(df, "agency", lookup)
+
+    agencies = sorted(set(totals["Agency"]) | set(by_title["Agency"]) | set(by_date["Agency"]))
+    codes = {name: i for i, name in enumerate(agencies)}
+    titles = sorted(set(by_title["Title"].astype(str)), key=lambda title: (len(title), title))
+    title_codes = {title: i for i, title in enumerate(titles)}
+    dates = sorted(set(by_date["Date"]))
+    date_codes = {date: i for i, date in enumerate(dates)}
+
+    total_counts = np.zeros(len(agencies), dtype=np.int64)
+    total_counts[totals["Agency"].map(codes).to_numpy()] = totals["WordCount"].to_numpy()
+    date_counts = np.zeros((len(agencies), len(dates)), dtype=np.int64)
+    np.add.at(date_counts, (by_date["Agency"].map(codes).to_numpy(), by_date["Date"].map(date_codes).to_numpy()),
+              by_date["WordCount"].to_numpy())
+
+    return {
+        "version": BUNDLE_VERSION,
+        "agencies": agencies,
+        "totals": total_counts.tolist(),
+        "dates": dates,
+        "byDate": date_counts.ravel().tolist(),
+        "titles": titles,
+        "byTitle": {
+            "agency": by_title["Agency"].map(codes).tolist(),
+            "title": by_title["Title"].astype(str).map(title_codes).tolist(),
+            "count": by_title["WordCount"].astype(np.int64).tolist(),
+        },
+        "search": search_index(agencies),
+    }
+
+def write_bundle(bundle, path=DEFAULT_BUNDLE):
+    """Write the bundle as compact JSON, atomically."""
+    tmp_path = path + ".part"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(bundle, f, separators=(",", ":"), ensure_ascii=False)
+    os.replace(tmp_path, path)
+    print(f"[INFO] Saved dashboard bundle ({len(bundle['agencies'])} agencies, "
+          f"{os.path.getsize(path) / 1024:.1f} KiB) to {path}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the dashboard's precomputed JSON data bundle.")
+    parser.add_argument("--store", default=DEFAULT_STORE, help=f"Results store to read (default: {DEFAULT_STORE})")
+    parser.add_argument("--chapter-xlsx", help="Read chapter rows from an output_chapter.xlsx instead of the store")
+    parser.add_argument("--agencies", default=AGENCIES_FILE,
+                        help=f"agencies.json used to attribute chapters (default: {AGENCIES_FILE})")
+    parser.add_argument("--output", default=DEFAULT_BUNDLE, help=f"Bundle to write (default: {DEFAULT_BUNDLE})")
+    args = parser.parse_args()
+
+    if args.chapter_xlsx:
+        df = pd.read_excel(args.chapter_xlsx, dtype={"Title": str, "Chapter": str})
+        df = df.reindex(columns=COLUMNS, fill_value="")
+    else:
+        with ResultsStore(args.store) as store:
+            df = store.chapter_rows()
+    write_bundle(build_bundle(df, lookup=load_agency_lookup(args.agencies)), args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+import os
+import re
+import mmap
+import argparse
+import tempfile
+from xml.sax.saxutils import unescape
+
+import numpy as np
+from lxml import etree
+
+from compression import is_xml_file
+
+# Open and close tags of DIV1 (title) through DIV9 (appendix)
+_DIV_TAG = re.compile(rb"<(/?)DIV([1-9])(?=[\s>/])([^>]*)>")
+
+# Attributes recorded for every DIV
+_ATTRIBUTE = re.compile(rb'\s(N|TYPE|NODE)\s*=\s*(?:"([^"]*)"|\'([^\']*)\')')
+ATTRIBUTES = ("N", "TYPE", "NODE")
+
+def div_index_path(file_path):
+    """Sidecar of a title file: title-13-2023-01-01.xml -> title-13-2023-01-01.xml.divs.npz."""
+    return file_path + ".divs.npz"
+
+def scan_divs(file_path):
+    """
+    Byte offsets of every DIV1-DIV9 in an uncompressed XML file, found with
+    one regex pass over a memory map instead of parsing.
+
+    Returns a dict of equal-length arrays: level, start (offset of the open
+    tag), end (offset just past the close tag), parent (index of the
+    enclosing DIV, -1 at the top) and the N, TYPE and NODE attributes.
+    """
+    columns = {name: [] for name in ("level", "start", "end", "parent", "n", "type", "node")}
+    if os.path.getsize(file_path) == 0:
+        return columns
+    stack = []         # Indices of the open DIVs
+    with open(file_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        for match in _DIV_TAG.finditer(data):
+            closing, level, attributes = match.group(1), int(match.group(2)), match.group(3)
+            if closing:
+                if stack and columns["level"][stack[-1]] == level:
+                    columns["end"][stack.pop()] = match.end()
+                continue
+            values = {name.decode(): (double if double is not None else single)
+                      for name, double, single in _ATTRIBUTE.findall(attributes)}
+            columns["parent"].append(stack[-1] if stack else -1)
+            columns["level"].append(level)
+            columns["start"].append(match.start())
+            columns["end"].append(match.end())
+            for name in ATTRIBUTES:
+                columns[name.lower()].append(unescape(values.get(name, b"").decode("utf-8"), {"&quot;": '"'}))
+            if not attributes.endswith(b"/"):
+                stack.append(len(columns["level"]) - 1)
+    return columns
+
+class DivIndex:
+    """
+    Random access to the DIVs of one title file through a sidecar of their
+    byte offsets.
+
+    The sidecar is built once with scan_divs and saved next to the XML
+    (div_index_path). It records the size and mtime of the file it was built
+    from and is rebuilt when they change. Readers map the XML and parse only
+    the requested DIV's bytes, so fetching one section costs the size of the
+    section rather than the size of the title.
+    """
+
+    def __init__(self, file_path, arrays):
+        self.file_path = file_path
+        self.arrays = arrays
+        for name, value in arrays.items():
+            setattr(self, name, value)
+
+    @classmethod
+    def build(cls, file_path):
+        if not file_path.endswith(".xml"):
+            raise ValueError(f"{file_path}: only uncompressed XML can be read at an offset")
+        stat = os.stat(file_path)
+        columns = scan_divs(file_path)
+        arrays = {
+            "level": np.array(columns["level"], dtype=np.uint8),
+            "start": np.array(columns["start"], dtype=np.int64),
+            "end": np.array(columns["end"], dtype=np.int64),
+            "parent": np.array(columns["parent"], dtype=np.int32),
+            "n": np.array(columns["n"], dtype=str),
+            "type": np.array(columns["type"], dtype=str),
+            "node": np.array(columns["node"], dtype=str),
+            "source": np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64),
+        }
+        return cls(file_path, arrays)
+
+    def save(self, path=None):
+        path = path or div_index_path(self.file_path)
+        # Written under a unique temporary name and renamed into place, so
+        # concurrent readers never load a half-written sidecar and two
+        # requests building the same index do not interleave their writes
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".part",
+                                        dir=os.path.dirname(path) or ".")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, **self.arrays)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return path
+
+    @classmethod
+    def load(cls, file_path, path=None):
+        with np.load(path or div_index_path(file_path)) as data:
+            return cls(file_path, {name: data[name] for name in data.files})
+
+    @classmethod
+    def for_file(cls, file_path):
+        """The index of a file: its sidecar if it is current, otherwise a fresh scan saved as the sidecar."""
+        path = div_index_path(file_path)
+        if os.path.exists(path):
+            index = cls.load(file_path, path)
+            stat = os.stat(file_path)
+            if index.is_current(stat):
+                return index
+        index = cls.build(file_path)
+        index.save(path)
+        return index
+
+    def is_current(self, stat):
+        return self.source.tolist() == [stat.st_size, stat.st_mtime_ns]
+
+    def __len__(self):
+        return len(self.level)
+
+    def find(self, level=None, n=None, type=None, node=None):
+        """Indices of the DIVs matching every given level and attribute, in file order."""
+        mask = np.ones(len(self), dtype=bool)
+        if level is not None:
+            mask &= self.level == int(level)
+        for column, value in ((self.n, n), (self.type, type), (self.node, node)):
+            if value is not None:
+                mask &= column == value
+        return np.flatnonzero(mask)
+
+    def read(self, i):
+        """The raw bytes of DIV i, from its open tag to its close tag."""
+        start, end = int(self.start[i]), int(self.end[i])
+        with open(self.file_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return data[start:end]
+
+    def element(self, i):
+        """DIV i parsed on its own."""
+        return etree.fromstring(self.read(i), etree.XMLParser(remove_comments=True, remove_pis=True))
+
+    def describe(self, i, text=False):
+        """
+        Summary of DIV i: level, attributes, HEAD, byte range and word count,
+        counted as process_xml counts chapters (the words of every <P>
+        inside it), and optionally its paragraph text.
+        """
+        elem = self.element(i)
+        paragraphs = ["".join(p.itertext()) for p in elem.iter("P")]
+        summary = {
+            "level": int(self.level[i]),
+            "type": str(self.type[i]),
+            "n": str(self.n[i]),
+            "node": str(self.node[i]),
+            "head": (elem.findtext("HEAD") or "").strip(),
+            "start": int(self.start[i]),
+            "end": int(self.end[i]),
+            "wordCount": sum(len(paragraph.split()) for paragraph in paragraphs),
+        }
+        if text:
+            # Nested paragraphs are already part of their outer paragraph's text
+            summary["paragraphs"] = [paragraph for p, paragraph in zip(elem.iter("P"), paragraphs)
+                                     if not any(a.tag == "P" for a in p.iterancestors())]
+        return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Index DIV byte offsets of title XML files for random access.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build = subparsers.add_parser("build", help="Write the sidecar index of every XML file in the data directory")
+    build.add_argument("--data-dir", default="data", help="Directory of title XML files (default: data)")
+
+    show = subparsers.add_parser("show", help="Print one DIV of a title file without parsing the rest")
+    show.add_argument("file", help="Uncompressed title XML file")
+    show.add_argument("--level", type=int, help="DIV level, e.g. 3 for chapters, 5 for parts, 8 for sections")
+    show.add_argument("--n", help="N attribute, e.g. 125 or \"§ 125.2\"")
+    show.add_argument("--type", help="TYPE attribute, e.g. PART")
+    show.add_argument("--node", help="NODE attribute")
+    show.add_argument("--text", action="store_true", help="Also print the paragraph text")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        file_paths = sorted(os.path.join(args.data_dir, filename) for filename in os.listdir(args.data_dir)
+                            if is_xml_file(filename) and filename.endswith(".xml"))
+        for file_path in file_paths:
+            index = DivIndex.for_file(file_path)
+            print(f"[INFO] {os.path.basename(file_path)}: {len(index)} DIVs")
+        return
+
+    index = DivIndex.for_file(args.file)
+    matches = index.find(args.level, args.n, args.type, args.node)
+    print(f"[INFO] {len(matches)} matching DIVs")
+    for i in matches:
+        summary = index.describe(i, args.text)
+        paragraphs = summary.pop("paragraphs", [])
+        print(", ".join(f"{name}={value}" for name, value in summary.items()))
+        for paragraph in paragraphs:
+            print(f"  {paragraph}")
+
+if __name__ == "__main__":
+    main()
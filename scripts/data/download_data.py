@@ -1,19 +1,22 @@
-import requests
+import json
 from bs4 import BeautifulSoup
 import os
-import concurrent.futures
+import asyncio
+import argparse
 
-# Update this to the correct API base URL.
-BASE_URL = "https://www.ecfr.gov"
+from agency_lookup import AGENCIES_FILE, save_agencies
+from ecfr_client import BASE_URL, EcfrClient
+from http_cache import add_cache_arguments, cache_from_args, cached_get
+from compression import COMPRESSION_SUFFIXES, compressed_filename
+from download_manifest import MANIFEST_NAME, DownloadManifest
+from fetch_plan import job_filename, plan_fetch_jobs, report_plan, save_agency_jobs
+from metrics import METRICS, add_metrics_arguments, instrumented_run
 
-def get_agencies():
-    """Retrieve the agencies JSON from the Admin Service."""
-    url = f"{BASE_URL}/api/admin/v1/agencies.json"
+def get_agencies(base_url=BASE_URL, cache=None):
+    """Retrieve the agencies JSON from the Admin Service, through the HTTP cache if given."""
+    url = f"{base_url}/api/admin/v1/agencies.json"
     print(f"[DEBUG] Requesting agencies data from: {url}")
-    response = requests.get(url)
-    print(f"[DEBUG] Agencies request status code: {response.status_code}")
-    response.raise_for_status()
-    data = response.json()
+    data = json.loads(cached_get(url, cache))
     print("[DEBUG] Agencies retrieved successfully.")
     return data.get("agencies", [])
 
@@ -26,79 +29,117 @@ def flatten_agencies(agencies):
             flat.extend(flatten_agencies(agency["children"]))
     return flat
 
-def get_title_xml(date, title, extra_params=None):
+async def save_title_xml(client, job, manifest, data_dir="data", compression="none", verify=False,
+                         revalidate=False):
     """
-    Download the full XML for a given title as of a particular date.
-    Optionally include additional query parameters (e.g., chapter).
+    Download the XML for one fetch job and stream it to a file, recording it
+    in the manifest. With `revalidate`, files already complete are checked
+    with a conditional GET using their recorded validators.
     """
-    url = f"{BASE_URL}/api/versioner/v1/full/{date}/title-{title}.xml"
-    params = extra_params if extra_params is not None else {}
-    print(f"[DEBUG] Requesting XML from: {url} with params: {params}")
-    response = requests.get(url, params=params)
-    print(f"[DEBUG] XML request status code: {response.status_code}")
-    response.raise_for_status()
-    return response.text
-
-def process_agency(agency, years):
+    extra_params = {}
+    if job.chapter:
+        extra_params["chapter"] = job.chapter
+
+    filename = compressed_filename(job_filename(job), compression)
+    filepath = os.path.join(data_dir, filename)
+
+    # Skip only files the manifest confirms are complete and unchanged
+    validators = None
+    if manifest.is_complete(filename, filepath, job, verify):
+        validators = manifest.validators(filename) if revalidate else None
+        if validators is None:
+            print(f"[INFO] File already exists: {filename}")
+            METRICS.inc("download_jobs_total", status="skipped")
+            return
+
+    # A .part file left by a killed run is never resumed
+    if os.path.exists(filepath + ".part"):
+        os.remove(filepath + ".part")
+
+    try:
+        result = await client.save_title_xml(job.date, job.title, filepath, extra_params, compression, validators)
+        if result.not_modified:
+            manifest.record_unchanged(filename)
+            print(f"[INFO] Unchanged on the server: {filename}")
+            METRICS.inc("download_jobs_total", status="unchanged")
+            return
+        manifest.record_complete(filename, filepath, job, result)
+        print(f"[INFO] Saved XML for {filename}")
+        METRICS.inc("download_jobs_total", status="saved")
+    except Exception as e:
+        manifest.record_failed(filename, job, e)
+        print(f"[ERROR] Error saving {filename}: {e}")
+        METRICS.inc("download_jobs_total", status="failed")
+
+async def download_jobs(jobs, data_dir="data", base_url=BASE_URL, compression="none", verify=False,
+                        revalidate=False, **client_options):
     """
-    Process one agency: for each CFR reference and for each year,
-    download the XML and save it to a file.
+    Run each fetch job exactly once through one pooled, rate-limited client.
+
+    Jobs already completed by an earlier run are skipped after a quick check
+    against data_dir/download_manifest.json (a full checksum with `verify`),
+    or revalidated with a conditional GET with `revalidate`. Returns the
+    manifest.
     """
-    slug = agency.get("slug")
-    print(f"\n[INFO] Processing agency: {slug}")
-    cfr_refs = agency.get("cfr_references", [])
-    
-    for ref in cfr_refs:
-        title = ref.get("title")
-        chapter = ref.get("chapter")
-        for year in years:
-            date_str = f"{year}-01-01"
-            extra_params = {}
-            if chapter:
-                extra_params["chapter"] = chapter
-            
-            # Create filename based on title and chapter
-            filename = f"title-{title}"
-            if chapter:
-                filename += f"-chapter-{chapter}"
-            filename += f"-{date_str}.xml"
-            
-            # Create data directory if it doesn't exist
-            os.makedirs("data", exist_ok=True)
-            filepath = os.path.join("data", filename)
-            
-            # Skip if file already exists
-            if os.path.exists(filepath):
-                print(f"[INFO] File already exists: {filename}")
-                continue
-                
-            try:
-                xml_data = get_title_xml(date_str, title, extra_params)
-                with open(filepath, "w", encoding="utf-8") as f:
-                    f.write(xml_data)
-                print(f"[INFO] Saved XML for {filename}")
-            except Exception as e:
-                print(f"[ERROR] Error saving {filename}: {e}")
+    os.makedirs(data_dir, exist_ok=True)
+    manifest = DownloadManifest(os.path.join(data_dir, MANIFEST_NAME))
+    try:
+        async with EcfrClient(base_url, **client_options) as client:
+            await asyncio.gather(*(save_title_xml(client, job, manifest, data_dir, compression, verify, revalidate)
+                                   for job in jobs))
+    finally:
+        manifest.save()
+    manifest.report()
+    return manifest
+
+async def download_all(agencies_flat, years, data_dir="data", base_url=BASE_URL, compression="none", verify=False,
+                       revalidate=False, **client_options):
+    """Plan the unique fetch jobs for every agency and year, then download them."""
+    dates = [f"{year}-01-01" for year in years]
+    jobs, agency_jobs, requested = plan_fetch_jobs(agencies_flat, dates)
+    report_plan(jobs, requested)
+    os.makedirs(data_dir, exist_ok=True)
+    save_agency_jobs(agency_jobs, data_dir)
+    return await download_jobs(jobs, data_dir, base_url, compression, verify, revalidate, **client_options)
 
 def main():
+    parser = argparse.ArgumentParser(description="Download historical eCFR title XML for every agency.")
+    parser.add_argument("--base-url", default=BASE_URL,
+                        help=f"eCFR API base URL (default: {BASE_URL}, or $ECFR_BASE_URL)")
+    parser.add_argument("--concurrency", type=int, default=8,
+                        help="Maximum number of requests in flight (default: 8)")
+    parser.add_argument("--rate-limit", type=float, default=5.0,
+                        help="Maximum requests started per second per host (default: 5)")
+    parser.add_argument("--max-retries", type=int, default=5,
+                        help="Retries on 429/5xx responses and connection errors (default: 5)")
+    parser.add_argument("--compression", choices=sorted(COMPRESSION_SUFFIXES), default="none",
+                        help="Store downloaded XML compressed (default: none)")
+    parser.add_argument("--verify", action="store_true",
+                        help="Checksum every previously downloaded file instead of trusting size and mtime")
+    parser.add_argument("--revalidate", action="store_true",
+                        help="Ask the server whether previously downloaded files changed (conditional GET)")
+    add_cache_arguments(parser)
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
     # Create data directory if it doesn't exist
     os.makedirs("data", exist_ok=True)
     
-    agencies = get_agencies()
-    agencies_flat = flatten_agencies(agencies)
-    
-    # Define the year range (for example, from 2017 to 2023)
-    years = range(2017, 2024)
-    
-    # Use ThreadPoolExecutor to process each agency in its own thread
-    with concurrent.futures.ThreadPoolExecutor(max_workers=len(agencies_flat)) as executor:
-        future_to_agency = {executor.submit(process_agency, agency, years): agency for agency in agencies_flat}
-        for future in concurrent.futures.as_completed(future_to_agency):
-            agency = future_to_agency[future]
-            try:
-                future.result()
-            except Exception as e:
-                print(f"[ERROR] Exception processing agency {agency.get('slug')}: {e}")
+    with instrumented_run(args, "download"):
+        cache = cache_from_args(args)
+        agencies = get_agencies(args.base_url, cache)
+        save_agencies(agencies, AGENCIES_FILE)
+        agencies_flat = flatten_agencies(agencies)
+
+        # Define the year range (for example, from 2017 to 2023)
+        years = range(2017, 2024)
+
+        asyncio.run(download_all(agencies_flat, years, base_url=args.base_url, compression=args.compression, verify=args.verify,
+                                 revalidate=args.revalidate,
+                                 concurrency=args.concurrency, rate_limit=args.rate_limit,
+                                 max_retries=args.max_retries))
+        if cache is not None:
+            cache.report()
 
 if __name__ == "__main__":
     main()
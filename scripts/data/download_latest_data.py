@@ -1,30 +1,31 @@
-import requests
+import json
 from bs4 import BeautifulSoup
 import os
-import concurrent.futures
+import asyncio
+import argparse
 from datetime import datetime
 
-# Update this to the correct API base URL
-BASE_URL = "https://www.ecfr.gov"
+from agency_lookup import AGENCIES_FILE, save_agencies
+from ecfr_client import BASE_URL
+from download_data import download_jobs
+from compression import COMPRESSION_SUFFIXES
+from fetch_plan import plan_fetch_jobs, report_plan, save_agency_jobs
+from http_cache import add_cache_arguments, cache_from_args, cached_get
+from metrics import add_metrics_arguments, instrumented_run
 
-def get_latest_date():
+def get_latest_date(base_url=BASE_URL, cache=None):
     """Get the latest available date from the eCFR API."""
-    url = f"{BASE_URL}/api/versioner/v1/versions.json"
-    response = requests.get(url)
-    response.raise_for_status()
-    data = response.json()
+    url = f"{base_url}/api/versioner/v1/versions.json"
+    data = json.loads(cached_get(url, cache))
     # Get the most recent date
     latest_date = data.get("versions", [])[0].get("date")
     return latest_date
 
-def get_agencies():
-    """Retrieve the agencies JSON from the Admin Service."""
-    url = f"{BASE_URL}/api/admin/v1/agencies.json"
+def get_agencies(base_url=BASE_URL, cache=None):
+    """Retrieve the agencies JSON from the Admin Service, through the HTTP cache if given."""
+    url = f"{base_url}/api/admin/v1/agencies.json"
     print(f"[DEBUG] Requesting agencies data from: {url}")
-    response = requests.get(url)
-    print(f"[DEBUG] Agencies request status code: {response.status_code}")
-    response.raise_for_status()
-    data = response.json()
+    data = json.loads(cached_get(url, cache))
     print("[DEBUG] Agencies retrieved successfully.")
     return data.get("agencies", [])
 
@@ -37,86 +38,57 @@ def flatten_agencies(agencies):
             flat.extend(flatten_agencies(agency["children"]))
     return flat
 
-def get_title_xml(date, title, extra_params=None):
-    """
-    Download the full XML for a given title as of a particular date.
-    Optionally include additional query parameters (e.g., chapter).
-    """
-    url = f"{BASE_URL}/api/versioner/v1/full/{date}/title-{title}.xml"
-    params = extra_params if extra_params is not None else {}
-    print(f"[DEBUG] Requesting XML from: {url} with params: {params}")
-    response = requests.get(url, params=params)
-    print(f"[DEBUG] XML request status code: {response.status_code}")
-    response.raise_for_status()
-    return response.text
+def main():
+    parser = argparse.ArgumentParser(description="Download the latest eCFR title XML for every agency.")
+    parser.add_argument("--base-url", default=BASE_URL,
+                        help=f"eCFR API base URL (default: {BASE_URL}, or $ECFR_BASE_URL)")
+    parser.add_argument("--concurrency", type=int, default=10,
+                        help="Maximum number of requests in flight (default: 10)")
+    parser.add_argument("--rate-limit", type=float, default=5.0,
+                        help="Maximum requests started per second per host (default: 5)")
+    parser.add_argument("--max-retries", type=int, default=5,
+                        help="Retries on 429/5xx responses and connection errors (default: 5)")
+    parser.add_argument("--compression", choices=sorted(COMPRESSION_SUFFIXES), default="none",
+                        help="Store downloaded XML compressed (default: none)")
+    parser.add_argument("--verify", action="store_true",
+                        help="Checksum every previously downloaded file instead of trusting size and mtime")
+    parser.add_argument("--revalidate", action="store_true",
+                        help="Ask the server whether previously downloaded files changed (conditional GET)")
+    add_cache_arguments(parser)
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
 
-def process_agency(agency, date):
-    """
-    Process one agency: for each CFR reference,
-    download the XML and save it to a file.
-    """
-    slug = agency.get("slug")
-    print(f"\n[INFO] Processing agency: {slug}")
-    cfr_refs = agency.get("cfr_references", [])
-    
-    for ref in cfr_refs:
-        title = ref.get("title")
-        chapter = ref.get("chapter")
-        
-        extra_params = {}
-        if chapter:
-            extra_params["chapter"] = chapter
-        
-        # Create filename based on title and chapter
-        filename = f"title-{title}"
-        if chapter:
-            filename += f"-chapter-{chapter}"
-        filename += f"-{date}.xml"
-        
-        # Create data directory if it doesn't exist
-        os.makedirs("data", exist_ok=True)
-        filepath = os.path.join("data", filename)
-        
-        # Skip if file already exists
-        if os.path.exists(filepath):
-            print(f"[INFO] File already exists: {filename}")
-            continue
-            
-        try:
-            xml_data = get_title_xml(date, title, extra_params)
-            with open(filepath, "w", encoding="utf-8") as f:
-                f.write(xml_data)
-            print(f"[INFO] Saved XML for {filename}")
-        except Exception as e:
-            print(f"[ERROR] Error saving {filename}: {e}")
+    with instrumented_run(args, "download"):
+        run(args)
+
+def run(args):
+    """Body of main(): plan and download the latest snapshot of every title."""
+
+    cache = cache_from_args(args)
 
-def main():
     # Get the latest available date
-    latest_date = get_latest_date()
+    latest_date = get_latest_date(args.base_url, cache)
     print(f"[INFO] Using latest available date: {latest_date}")
     
     # Create data directory if it doesn't exist
     os.makedirs("data", exist_ok=True)
     
     # Get all agencies
-    agencies = get_agencies()
+    agencies = get_agencies(args.base_url, cache)
+    save_agencies(agencies, AGENCIES_FILE)
     agencies_flat = flatten_agencies(agencies)
     
-    # Use ThreadPoolExecutor to process each agency in its own thread
-    with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-        # Submit all tasks
-        future_to_agency = {
-            executor.submit(process_agency, agency, latest_date): agency 
-            for agency in agencies_flat
-        }
-        
-        # Process completed tasks
-        for future in concurrent.futures.as_completed(future_to_agency):
-            agency = future_to_agency[future]
-            try:
-                future.result()
-            except Exception as e:
-                print(f"[ERROR] Exception processing agency {agency.get('slug')}: {e}")
+    # Plan each (date, title, chapter) download once, however many agencies share it
+    jobs, agency_jobs, requested = plan_fetch_jobs(agencies_flat, [latest_date])
+    report_plan(jobs, requested)
+    save_agency_jobs(agency_jobs)
+
+    asyncio.run(download_jobs(jobs, base_url=args.base_url, compression=args.compression, verify=args.verify,
+                              revalidate=args.revalidate,
+                              concurrency=args.concurrency, rate_limit=args.rate_limit,
+                              max_retries=args.max_retries))
+    if cache is not None:
+        cache.report()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
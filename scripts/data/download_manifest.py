@@ -0,0 +1,161 @@
+import os
+import re
+import json
+import time
+
+from compression import open_xml
+from row_cache import file_sha256
+
+MANIFEST_NAME = "download_manifest.json"
+
+# Bytes read from each end of a file when checking that its XML is complete
+TAIL_SIZE = 1 << 12
+
+def xml_looks_complete(filepath):
+    """
+    Cheap completeness check for a downloaded XML file: its last tag must
+    close the root element. Compressed files are decompressed in full, which
+    also checks their trailing CRC.
+    """
+    try:
+        with open_xml(filepath) as f:
+            head = f.read(TAIL_SIZE)
+            if not filepath.endswith((".gz", ".zst")):
+                f.seek(max(len(head), os.path.getsize(filepath) - TAIL_SIZE))
+                tail = head + f.read()
+            else:
+                tail = head
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    tail = (tail + chunk)[-TAIL_SIZE:]
+    except Exception as e:
+        # Truncated gzip/zstd streams fail here
+        print(f"[DEBUG] Could not read {filepath}: {e!r}")
+        return False
+    root = re.search(rb"<([A-Za-z_][\w.:-]*)[\s>/]", re.sub(rb"<[?!][^>]*>", b"", head))
+    return bool(root) and tail.rstrip().endswith(b"</" + root.group(1) + b">")
+
+class DownloadManifest:
+    """
+    Record of every download job in a data directory, kept in JSON.
+
+    Each entry, keyed by filename, holds the job, its status ("complete" or
+    "failed"), the file's size, mtime and SHA-256, the server's ETag and
+    Last-Modified, and the last error. A file counts as already downloaded
+    only if its entry is complete and the file still matches it: size and
+    mtime are checked first and the hash only when they differ (or when
+    `verify` is set), so a rerun skips good files quickly and refetches
+    missing, truncated or altered ones.
+    """
+
+    def __init__(self, path, save_interval=5.0):
+        self.path = path
+        self.save_interval = save_interval
+        self.last_saved = time.monotonic()
+        self.stats = {"verified": 0, "adopted": 0, "downloaded": 0, "unchanged": 0, "failed": 0, "invalid": 0}
+        self.entries = self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[ERROR] Ignoring unreadable manifest {self.path}: {e}")
+            return {}
+
+    def save(self):
+        """Write the manifest atomically."""
+        tmp_path = self.path + ".part"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+        self.last_saved = time.monotonic()
+
+    def _changed(self):
+        # Save every few seconds, so an interrupted run loses little progress
+        if time.monotonic() - self.last_saved >= self.save_interval:
+            self.save()
+
+    def _file_fields(self, filepath):
+        stat = os.stat(filepath)
+        return {"bytes": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": file_sha256(filepath)}
+
+    def is_complete(self, filename, filepath, job=None, verify=False):
+        """
+        Whether `filepath` holds a complete download of `filename`.
+
+        Files that predate the manifest are adopted if their XML looks
+        complete, so an existing data directory is not fetched again.
+        """
+        entry = self.entries.get(filename)
+        if not os.path.exists(filepath):
+            return False
+        if entry is None:
+            if not xml_looks_complete(filepath):
+                print(f"[INFO] Refetching incomplete {filename}")
+                self.stats["invalid"] += 1
+                return False
+            self.entries[filename] = {"status": "complete", "job": job and job._asdict(),
+                                      "etag": None, "last_modified": None, "adopted": True,
+                                      **self._file_fields(filepath)}
+            self.stats["adopted"] += 1
+            self._changed()
+            return True
+        if entry.get("status") != "complete":
+            return False
+
+        stat = os.stat(filepath)
+        if not verify and stat.st_size == entry["bytes"] and stat.st_mtime_ns == entry["mtime_ns"]:
+            self.stats["verified"] += 1
+            return True
+        if stat.st_size == entry["bytes"] and file_sha256(filepath) == entry["sha256"]:
+            entry["mtime_ns"] = stat.st_mtime_ns
+            self.stats["verified"] += 1
+            self._changed()
+            return True
+        print(f"[INFO] Refetching {filename}: it no longer matches its checksum")
+        self.stats["invalid"] += 1
+        entry["status"] = "invalid"
+        return False
+
+    def validators(self, filename):
+        """The ETag/Last-Modified recorded for a file, or None if it has neither."""
+        entry = self.entries.get(filename) or {}
+        if not (entry.get("etag") or entry.get("last_modified")):
+            return None
+        return {"etag": entry.get("etag"), "last_modified": entry.get("last_modified")}
+
+    def record_unchanged(self, filename):
+        """Record that the server confirmed a file is unchanged (304)."""
+        self.entries[filename]["checked_at"] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        self.stats["unchanged"] += 1
+        self._changed()
+
+    def record_complete(self, filename, filepath, job, result):
+        """Record a finished download; `result` is the client's DownloadResult."""
+        self.entries[filename] = {
+            "status": "complete", "job": job._asdict(),
+            "received": result.received, "etag": result.etag, "last_modified": result.last_modified,
+            "updated_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            **self._file_fields(filepath),
+        }
+        self.stats["downloaded"] += 1
+        self._changed()
+
+    def record_failed(self, filename, job, error):
+        """Record a failed download so the next run retries it."""
+        entry = self.entries.setdefault(filename, {})
+        entry.update({"status": "failed", "job": job._asdict(), "error": str(error),
+                      "attempts": entry.get("attempts", 0) + 1,
+                      "updated_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())})
+        self.stats["failed"] += 1
+        self._changed()
+
+    def report(self):
+        """Print this run's job outcomes."""
+        print(f"[INFO] Download manifest: {self.stats['downloaded']} downloaded, "
+              f"{self.stats['verified']} already complete ({self.stats['unchanged']} confirmed by a 304), "
+              f"{self.stats['adopted']} adopted from earlier runs, "
+              f"{self.stats['invalid']} refetched as incomplete or changed, {self.stats['failed']} failed "
+              f"({self.path})")
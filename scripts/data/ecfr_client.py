@@ -0,0 +1,214 @@
+import os
+import asyncio
+import random
+import time
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from compression import open_writer
+from metrics import METRICS
+
+# eCFR API base URL. Set ECFR_BASE_URL to point every script elsewhere, e.g. at
+# scripts/tests/fake_ecfr_server.py for offline runs and load tests.
+BASE_URL = os.environ.get("ECFR_BASE_URL", "https://www.ecfr.gov")
+
+# Responses worth retrying: throttling and transient server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Bytes read from the network per write when streaming downloads to disk
+CHUNK_SIZE = 1 << 16
+
+# What a streamed download returns: bytes received, the response's validators,
+# and whether the server answered 304 so the existing file was kept
+DownloadResult = namedtuple("DownloadResult", ["received", "etag", "last_modified", "not_modified"],
+                            defaults=[False])
+
+class RateLimiter:
+    """Space out request starts so that at most `rate` begin per second."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self.next_slot = 0.0
+        self.lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self.lock:
+            now = time.monotonic()
+            delay = self.next_slot - now
+            self.next_slot = max(now, self.next_slot) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+class EcfrClient:
+    """
+    Async eCFR API client sharing one aiohttp connection pool.
+
+    At most `concurrency` requests are in flight at once and at most
+    `rate_limit` requests per second are started against any one host.
+    Requests answered with 429 or 5xx are retried with exponential backoff
+    (honouring Retry-After when the server sends one). Queueing time, request
+    latency, statuses, retries and bytes are recorded in the shared METRICS.
+    With an HttpCache, get() serves fresh responses from disk and revalidates
+    stale ones with a conditional GET.
+    """
+
+    def __init__(self, base_url=BASE_URL, concurrency=8, rate_limit=5.0,
+                 max_retries=5, backoff=1.0, timeout=300, cache=None):
+        self.base_url = base_url
+        self.cache = cache
+        self.concurrency = concurrency
+        self.rate_limit = rate_limit
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.limiters = {}
+        self.session = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.concurrency)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+
+    def _limiter(self, url):
+        host = urlsplit(url).netloc
+        if host not in self.limiters:
+            self.limiters[host] = RateLimiter(self.rate_limit)
+        return self.limiters[host]
+
+    def _retry_delay(self, attempt, response=None):
+        """Exponential backoff with jitter, or the server's Retry-After."""
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                return float(retry_after)
+        return self.backoff * (2 ** attempt) * (0.5 + random.random() / 2)
+
+    async def request(self, path, params=None, consume=None, headers=None):
+        """
+        GET a path relative to the base URL, retrying throttled and failed
+        requests. `consume` is awaited with the successful (or 304) response
+        and its result returned; by default the whole body is read into memory.
+        """
+        url = f"{self.base_url}{path}"
+        limiter = self._limiter(url)
+        attempt = 0
+        while True:
+            queued = time.perf_counter()
+            async with self.semaphore:
+                await limiter.wait()
+                start = time.perf_counter()
+                METRICS.observe("http_queue_seconds", start - queued)
+                try:
+                    async with self.session.get(url, params=params, headers=headers) as response:
+                        print(f"[DEBUG] GET {url} {params or ''} -> {response.status}")
+                        METRICS.inc("http_responses_total", status=response.status)
+                        if response.status in RETRY_STATUSES and attempt < self.max_retries:
+                            delay = self._retry_delay(attempt, response)
+                        else:
+                            response.raise_for_status()
+                            if consume is None:
+                                body = await response.read()
+                                METRICS.inc("http_received_bytes_total", len(body))
+                            else:
+                                body = await consume(response)
+                            METRICS.observe("http_request_seconds", time.perf_counter() - start)
+                            return body
+                except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError) as e:
+                    METRICS.inc("http_errors_total", error=type(e).__name__)
+                    if attempt >= self.max_retries:
+                        raise
+                    print(f"[DEBUG] GET {url} failed: {e!r}")
+                    delay = self._retry_delay(attempt)
+            # Back off outside the semaphore so other requests can proceed
+            attempt += 1
+            METRICS.inc("http_retries_total")
+            print(f"[DEBUG] Retrying {url} in {delay:.1f}s (attempt {attempt}/{self.max_retries})")
+            await asyncio.sleep(delay)
+
+    async def get(self, path, params=None, ttl=None):
+        """
+        GET a path relative to the base URL and return the body as bytes,
+        through the client's HttpCache if it has one.
+        """
+        if self.cache is None:
+            return await self.request(path, params)
+
+        url = f"{self.base_url}{path}"
+        entry = self.cache.lookup(url, params)
+        if self.cache.is_fresh(entry):
+            self.cache.record("fresh")
+            return self.cache.body(url, params)
+
+        async def read(response):
+            return response.status, response.headers.copy(), await response.read()
+
+        status, headers, body = await self.request(path, params, consume=read,
+                                                   headers=self.cache.conditional_headers(entry))
+        if status == 304 and entry is not None:
+            self.cache.revalidated(url, params, entry, headers, ttl)
+            self.cache.record("revalidated")
+            return self.cache.body(url, params)
+        self.cache.store(url, params, body, headers, ttl)
+        self.cache.record("misses")
+        return body
+
+    async def download(self, path, filepath, params=None, compression="none", validators=None):
+        """
+        Stream a response body to `filepath` in chunks, optionally compressed.
+
+        The body is written to a temporary .part file that is renamed into
+        place only once complete, so an interrupted download never leaves a
+        truncated file behind. A body shorter than its Content-Length raises
+        an error instead of being kept. `validators` (an ETag and/or
+        Last-Modified from an earlier download) make the request conditional;
+        on 304 the existing file is left alone. Returns a DownloadResult.
+        """
+        tmp_path = filepath + ".part"
+        headers = {}
+        if validators and validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators and validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+
+        async def write_body(response):
+            if response.status == 304:
+                return DownloadResult(0, response.headers.get("ETag", validators.get("etag")),
+                                      response.headers.get("Last-Modified", validators.get("last_modified")),
+                                      not_modified=True)
+            received = 0
+            with open_writer(tmp_path, compression) as f:
+                async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                    f.write(chunk)
+                    received += len(chunk)
+            METRICS.inc("http_received_bytes_total", received)
+            # Content-Length counts the encoded body when Content-Encoding is set
+            expected = response.headers.get("Content-Length")
+            if expected and expected.isdigit() and "Content-Encoding" not in response.headers \
+                    and int(expected) != received:
+                raise aiohttp.ClientPayloadError(f"received {received} of {expected} bytes")
+            return DownloadResult(received, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+
+        try:
+            result = await self.request(path, params, consume=write_body, headers=headers or None)
+            if not result.not_modified:
+                os.replace(tmp_path, filepath)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return result
+
+    def title_xml_path(self, date, title):
+        return f"/api/versioner/v1/full/{date}/title-{title}.xml"
+
+    async def save_title_xml(self, date, title, filepath, extra_params=None, compression="none", validators=None):
+        """Stream the full XML for a title straight to disk without buffering it."""
+        return await self.download(self.title_xml_path(date, title), filepath,
+                                   params=extra_params or None, compression=compression, validators=validators)
@@ -0,0 +1,52 @@
+import os
+import json
+from collections import namedtuple
+
+# One XML download: a title (optionally scoped to a chapter) as of a date
+FetchJob = namedtuple("FetchJob", ["date", "title", "chapter"])
+
+def job_filename(job):
+    """Create the data filename for a fetch job, e.g. title-1-chapter-I-2023-01-01.xml."""
+    filename = f"title-{job.title}"
+    if job.chapter:
+        filename += f"-chapter-{job.chapter}"
+    filename += f"-{job.date}.xml"
+    return filename
+
+def plan_fetch_jobs(agencies_flat, dates):
+    """
+    Build the unique set of fetch jobs for every agency's CFR references.
+
+    Parent and child agencies often reference the same title/chapter, so the
+    same XML would otherwise be requested several times. Returns
+    (jobs, agency_jobs, requested): the unique jobs in first-seen order, a
+    mapping of agency slug to the filenames of its jobs (kept for later
+    attribution), and the number of requests before deduplication.
+    """
+    jobs = {}
+    agency_jobs = {}
+    requested = 0
+    for agency in agencies_flat:
+        filenames = agency_jobs.setdefault(agency.get("slug"), [])
+        for ref in agency.get("cfr_references", []):
+            for date in dates:
+                job = FetchJob(date, ref.get("title"), ref.get("chapter"))
+                requested += 1
+                jobs.setdefault(job, None)
+                filename = job_filename(job)
+                if filename not in filenames:
+                    filenames.append(filename)
+    return list(jobs), agency_jobs, requested
+
+def report_plan(jobs, requested):
+    """Print how many redundant requests planning removed."""
+    print(f"[INFO] Planned {len(jobs)} unique fetch jobs from {requested} agency references "
+          f"({requested - len(jobs)} redundant requests removed)")
+
+def save_agency_jobs(agency_jobs, data_dir="data"):
+    """Save the agency -> XML file mapping next to the downloaded files."""
+    path = os.path.join(data_dir, "agency_jobs.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(agency_jobs, f, indent=2)
+    print(f"[INFO] Saved agency to file mapping to {path}")
+    return path
@@ -0,0 +1,192 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from agency_lookup import AGENCIES_FILE, load_agency_lookup
+from process_xml import combine_rows
+from results_store import DEFAULT_STORE, ResultsStore
+from section_index import DEFAULT_SECTIONS, SectionIndex
+
+# Grouping keys for each kind of delta report
+DELTA_KEYS = {
+    "agency": ["Agency"],
+    "chapter": ["Title", "Chapter", "Agency"],
+}
+
+def snapshot_totals(df, by="agency", lookup=None):
+    """
+    Word counts per snapshot date, grouped by agency or by chapter.
+
+    Chapters are attributed with `lookup` (an AgencyLookup) when given;
+    otherwise agency name variants are combined within each snapshot, so a
+    later renaming does not merge counts across years.
+    """
+    keys = DELTA_KEYS[by]
+    frames = []
+    for date, rows in df.groupby("Date", sort=True):
+        rows = lookup.attribute(rows) if lookup is not None else combine_rows(rows)
+        rows = rows[rows["WordCount"] != 0]
+        totals = rows.groupby(keys)["WordCount"].sum().reset_index()
+        totals["Date"] = date
+        frames.append(totals)
+    if not frames:
+        return pd.DataFrame(columns=keys + ["Date", "WordCount"])
+    return pd.concat(frames, ignore_index=True)
+
+def yearly_deltas(df, by="agency", lookup=None):
+    """
+    Change in word count between adjacent snapshot dates.
+
+    Returns one row per key and date with WordCount, Previous, Delta and
+    PctChange. Keys missing from a snapshot count as zero there, so added and
+    removed agencies or chapters show up as full-size deltas.
+    """
+    keys = DELTA_KEYS[by]
+    totals = snapshot_totals(df, by, lookup)
+    wide = totals.pivot_table(index=keys, columns="Date", values="WordCount", aggfunc="sum", fill_value=0)
+    wide = wide.reindex(sorted(wide.columns), axis=1)
+
+    counts = wide.to_numpy(dtype=np.int64)
+    previous = np.zeros_like(counts)
+    previous[:, 1:] = counts[:, :-1]
+    delta = counts - previous
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pct = np.where(previous > 0, delta / previous * 100, np.nan)
+
+    dates = list(wide.columns)
+    result = pd.DataFrame({
+        **{key: np.repeat(wide.index.get_level_values(key), len(dates)) for key in keys},
+        "Date": np.tile(dates, len(wide)),
+        "WordCount": counts.ravel(),
+        "Previous": previous.ravel(),
+        "Delta": delta.ravel(),
+        "PctChange": pct.ravel(),
+    })
+    # The first snapshot has nothing to compare against
+    return result[result["Date"] != dates[0]].reset_index(drop=True) if dates else result
+
+def _children(index, rows):
+    """Map each DIV row in `rows` to its child rows, in document order."""
+    members = set(rows.tolist())
+    children = {}
+    for row in rows:
+        parent = index.parent[row]
+        if parent in members:
+            children.setdefault(int(parent), []).append(int(row))
+    return children
+
+def _match_key(index, row, seen):
+    """Key used to pair DIVs between snapshots: level, TYPE, N and occurrence."""
+    key = (int(index.level[row]), index.types[index.type_code[row]], str(index.n[row]))
+    seen[key] = seen.get(key, 0) + 1
+    return key + (seen[key],)
+
+def changed_sections(index, title, date_from, date_to):
+    """
+    Compare two snapshots of a title and list the DIVs that changed.
+
+    Walks both DIV trees together, pairing children by level, TYPE and N.
+    Subtrees with equal tree hashes are skipped without comparing their
+    descendants. (The hashes come from section_index, which still parses
+    every snapshot in full.)
+    Returns (changes, skipped): a DataFrame with one row per added, removed
+    or changed DIV, and the number of DIVs skipped as unchanged.
+    """
+    titles = index.titles[index.title_code]
+    dates = index.dates[index.date_code]
+    rows_from = np.flatnonzero((titles == str(title)) & (dates == date_from))
+    rows_to = np.flatnonzero((titles == str(title)) & (dates == date_to))
+    totals = np.zeros(len(index), dtype=np.int64)
+    for level in range(1, index.ancestors.shape[1]):
+        at_level = index.level == level
+        totals[at_level] = index.totals(level)[at_level]
+
+    children_from = _children(index, rows_from)
+    children_to = _children(index, rows_to)
+    subtree_size = {}
+
+    def size(row, children):
+        if row not in subtree_size:
+            subtree_size[row] = 1 + sum(size(child, children) for child in children.get(row, []))
+        return subtree_size[row]
+
+    changes = []
+    skipped = 0
+
+    def pair(rows_a, rows_b):
+        seen_a, seen_b = {}, {}
+        keyed_a = {_match_key(index, row, seen_a): row for row in rows_a}
+        keyed_b = {_match_key(index, row, seen_b): row for row in rows_b}
+        ordered = list(keyed_a) + [key for key in keyed_b if key not in keyed_a]
+        return [(keyed_a.get(key), keyed_b.get(key)) for key in ordered]
+
+    # Depth-first, in document order
+    stack = pair([row for row in rows_from if index.parent[row] < 0],
+                 [row for row in rows_to if index.parent[row] < 0])[::-1]
+    while stack:
+        row_a, row_b = stack.pop()
+        if row_a is not None and row_b is not None and index.tree_hash[row_a] == index.tree_hash[row_b]:
+            skipped += size(row_a, children_from)
+            continue
+        row = row_b if row_b is not None else row_a
+        status = "added" if row_a is None else "removed" if row_b is None else "changed"
+        before = int(totals[row_a]) if row_a is not None else 0
+        after = int(totals[row_b]) if row_b is not None else 0
+        changes.append({
+            "Level": int(index.level[row]),
+            "Type": index.types[index.type_code[row]],
+            "N": str(index.n[row]),
+            "Head": str(index.head[row]),
+            "Status": status,
+            "Before": before,
+            "After": after,
+            "Delta": after - before,
+        })
+        stack.extend(pair(children_from.get(row_a, []) if row_a is not None else [],
+                          children_to.get(row_b, []) if row_b is not None else [])[::-1])
+    columns = ["Level", "Type", "N", "Head", "Status", "Before", "After", "Delta"]
+    return pd.DataFrame(changes, columns=columns), skipped
+
+def main():
+    parser = argparse.ArgumentParser(description="Year-over-year word count changes.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    deltas = subparsers.add_parser("deltas", help="Deltas per agency or chapter between snapshot dates")
+    deltas.add_argument("--by", choices=sorted(DELTA_KEYS), default="agency", help="Grouping (default: agency)")
+    deltas.add_argument("--store", default=DEFAULT_STORE, help=f"Results store (default: {DEFAULT_STORE})")
+    deltas.add_argument("--agencies", default=AGENCIES_FILE,
+                        help=f"agencies.json used to attribute chapters (default: {AGENCIES_FILE})")
+    deltas.add_argument("--output", help="Also save the full table to this .csv or .xlsx file")
+    deltas.add_argument("--top", type=int, default=20, help="Largest changes to print (default: 20)")
+
+    changes = subparsers.add_parser("changes", help="DIVs that changed in a title between two snapshots")
+    changes.add_argument("title", help="Title number")
+    changes.add_argument("date_from", help="Earlier snapshot date, e.g. 2022-01-01")
+    changes.add_argument("date_to", help="Later snapshot date, e.g. 2023-01-01")
+    changes.add_argument("--index", default=DEFAULT_SECTIONS, help=f"Section index (default: {DEFAULT_SECTIONS})")
+    changes.add_argument("--level", type=int, help="Only report DIVs at this level, e.g. 8 for sections")
+    args = parser.parse_args()
+
+    if args.command == "deltas":
+        with ResultsStore(args.store) as store:
+            df = store.chapter_rows()
+        result = yearly_deltas(df, args.by, load_agency_lookup(args.agencies))
+        if args.output:
+            if args.output.endswith(".xlsx"):
+                result.to_excel(args.output, index=False)
+            else:
+                result.to_csv(args.output, index=False)
+            print(f"[INFO] Saved {len(result)} delta rows to {args.output}")
+        largest = result.reindex(result["Delta"].abs().sort_values(ascending=False).index)
+        print(largest.head(args.top).to_string(index=False))
+    else:
+        index = SectionIndex.load(args.index)
+        result, skipped = changed_sections(index, args.title, args.date_from, args.date_to)
+        if args.level is not None:
+            result = result[result["Level"] == args.level]
+        print(f"[INFO] {len(result)} changed DIVs, {skipped} unchanged DIVs skipped")
+        print(result.to_string(index=False))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+import os
+import json
+import time
+import hashlib
+from urllib.parse import urlencode
+
+import requests
+
+from metrics import METRICS
+
+DEFAULT_HTTP_CACHE_DIR = os.path.join("data", ".cache", "http")
+
+# Seconds a cached response is used without asking the server again
+DEFAULT_TTL = 600
+
+# Total size of cached bodies before the least recently used are evicted
+DEFAULT_MAX_BYTES = 256 << 20
+
+def _max_age(headers):
+    """max-age from a Cache-Control header, 0 for no-cache, None if absent."""
+    directives = [part.strip().lower() for part in headers.get("Cache-Control", "").split(",")]
+    if "no-cache" in directives:
+        return 0
+    for directive in directives:
+        if directive.startswith("max-age=") and directive[8:].isdigit():
+            return int(directive[8:])
+    return None
+
+class HttpCache:
+    """
+    On-disk cache of small API responses (agencies.json, versions.json).
+
+    Each response is stored as a body file plus a JSON metadata file with
+    its ETag, Last-Modified and expiry. Until it expires a response is
+    served without any request. After that it is revalidated with
+    If-None-Match / If-Modified-Since, so an unchanged resource costs a 304.
+    Responses stay fresh for `ttl` seconds since they were last validated
+    (less if the server's max-age is shorter, or a request passes its own
+    ttl), so lowering the ttl takes effect immediately; no-store responses are not
+    kept. Once the bodies exceed `max_bytes`, the least recently used
+    entries are evicted.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_HTTP_CACHE_DIR, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.stats = {"fresh": 0, "revalidated": 0, "misses": 0, "evicted": 0}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _paths(self, url, params=None):
+        key = url + ("?" + urlencode(sorted(params.items())) if params else "")
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        base = os.path.join(self.cache_dir, digest)
+        return base + ".json", base + ".body"
+
+    def _write_meta(self, meta_path, entry):
+        tmp_path = meta_path + ".part"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, meta_path)
+
+    def lookup(self, url, params=None):
+        """The cached entry for a URL (fresh or stale), or None."""
+        meta_path, body_path = self._paths(url, params)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not os.path.exists(body_path):
+            return None
+        entry["accessed_at"] = time.time()
+        self._write_meta(meta_path, entry)
+        return entry
+
+    def is_fresh(self, entry):
+        if entry is None:
+            return False
+        now = time.time()
+        return now < entry["expires_at"] and now < entry["validated_at"] + self.ttl
+
+    def conditional_headers(self, entry):
+        """Validators to send when revalidating a stale entry."""
+        headers = {}
+        if entry is not None and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry is not None and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def body(self, url, params=None):
+        with open(self._paths(url, params)[1], "rb") as f:
+            return f.read()
+
+    def _expires_at(self, headers, ttl):
+        if ttl is None:
+            max_age = _max_age(headers)
+            ttl = self.ttl if max_age is None else min(self.ttl, max_age)
+        return time.time() + ttl
+
+    def store(self, url, params, body, headers, ttl=None):
+        """Cache a 200 response."""
+        if "no-store" in headers.get("Cache-Control", "").lower():
+            return
+        meta_path, body_path = self._paths(url, params)
+        tmp_path = body_path + ".part"
+        with open(tmp_path, "wb") as f:
+            f.write(body)
+        os.replace(tmp_path, body_path)
+        now = time.time()
+        self._write_meta(meta_path, {
+            "url": url, "params": params, "size": len(body),
+            "etag": headers.get("ETag"), "last_modified": headers.get("Last-Modified"),
+            "stored_at": now, "validated_at": now, "accessed_at": now,
+            "expires_at": self._expires_at(headers, ttl),
+        })
+        self.evict()
+
+    def revalidated(self, url, params, entry, headers, ttl=None):
+        """Extend a stale entry after the server answered 304 Not Modified."""
+        entry["etag"] = headers.get("ETag") or entry.get("etag")
+        entry["last_modified"] = headers.get("Last-Modified") or entry.get("last_modified")
+        entry["validated_at"] = time.time()
+        entry["expires_at"] = self._expires_at(headers, ttl)
+        self._write_meta(self._paths(url, params)[0], entry)
+
+    def evict(self):
+        """Drop least recently used entries until the bodies fit in max_bytes."""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"):
+                continue
+            meta_path = os.path.join(self.cache_dir, name)
+            try:
+                with open(meta_path, "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                continue
+            entries.append((entry.get("accessed_at", 0), entry.get("size", 0), meta_path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, meta_path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            for path in (meta_path, meta_path[:-len(".json")] + ".body"):
+                if os.path.exists(path):
+                    os.remove(path)
+            total -= size
+            self.stats["evicted"] += 1
+
+    def record(self, result):
+        """Count a lookup outcome: fresh, revalidated or misses."""
+        self.stats[result] += 1
+        METRICS.inc("http_cache_total", result=result)
+
+    def report(self):
+        print(f"[INFO] HTTP cache: {self.stats['fresh']} fresh hits, {self.stats['revalidated']} revalidated "
+              f"(304), {self.stats['misses']} fetched, {self.stats['evicted']} evicted ({self.cache_dir})")
+
+def cached_get(url, cache=None, params=None, ttl=None):
+    """
+    GET a URL with requests, through `cache` if one is given. Returns the
+    body as bytes.
+    """
+    if cache is None:
+        response = requests.get(url, params=params)
+        response.raise_for_status()
+        return response.content
+
+    entry = cache.lookup(url, params)
+    if cache.is_fresh(entry):
+        cache.record("fresh")
+        return cache.body(url, params)
+    response = requests.get(url, params=params, headers=cache.conditional_headers(entry))
+    print(f"[DEBUG] GET {url} -> {response.status_code}")
+    if response.status_code == 304 and entry is not None:
+        cache.revalidated(url, params, entry, response.headers, ttl)
+        cache.record("revalidated")
+        return cache.body(url, params)
+    response.raise_for_status()
+    cache.store(url, params, response.content, response.headers, ttl)
+    cache.record("misses")
+    return response.content
+
+def add_cache_arguments(parser):
+    """Add the HTTP cache options to a script's parser."""
+    parser.add_argument("--no-http-cache", dest="http_cache", action="store_false",
+                        help="Always fetch agencies.json/versions.json instead of using the on-disk cache")
+    parser.add_argument("--cache-ttl", type=int, default=DEFAULT_TTL,
+                        help=f"Seconds a cached API response is used before revalidating (default: {DEFAULT_TTL})")
+    parser.add_argument("--cache-max-mb", type=int, default=DEFAULT_MAX_BYTES >> 20,
+                        help=f"Size bound of the HTTP cache in MB (default: {DEFAULT_MAX_BYTES >> 20})")
+
+def cache_from_args(args, cache_dir=DEFAULT_HTTP_CACHE_DIR):
+    """The HttpCache selected by add_cache_arguments' options, or None."""
+    if not args.http_cache:
+        return None
+    return HttpCache(cache_dir, ttl=args.cache_ttl, max_bytes=args.cache_max_mb << 20)
@@ -0,0 +1,221 @@
+import json
+import time
+import bisect
+import cProfile
+import pstats
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+# Histogram bucket upper bounds in seconds, from a fast request to a large title
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+def _key(name, labels):
+    return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+class Histogram:
+    """Cumulative-bucket histogram with count, sum, min and max."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def cumulative(self):
+        """(upper bound, observations <= bound) pairs, ending with +Inf."""
+        total = 0
+        pairs = []
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+class Metrics:
+    """
+    In-process registry of counters, gauges and histograms.
+
+    Series are identified by a name plus keyword labels, e.g.
+    `metrics.inc("http_requests_total", status=200)`. Timers record seconds
+    into a histogram. Safe to update from several threads; worker processes
+    have their own registry, so results from a process pool should be
+    recorded by the parent.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = _key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.gauges[_key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        key = _key(name, labels)
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Time the enclosed block and record it in the `name` histogram."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.histograms.clear()
+
+    def to_prometheus(self):
+        """All series in the Prometheus text exposition format."""
+        lines = []
+        with self.lock:
+            for kind, series in (("counter", self.counters), ("gauge", self.gauges)):
+                for name in sorted({name for name, _ in series}):
+                    lines.append(f"# TYPE {name} {kind}")
+                    for (series_name, labels), value in sorted(series.items()):
+                        if series_name == name:
+                            lines.append(f"{name}{_format_labels(labels)} {value}")
+            for name in sorted({name for name, _ in self.histograms}):
+                lines.append(f"# TYPE {name} histogram")
+                for (series_name, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+                    if series_name != name:
+                        continue
+                    for bound, count in histogram.cumulative():
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append(f"{name}_bucket{_format_labels(labels, [('le', le)])} {count}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def records(self):
+        """All series as dicts, one per series, for JSON-lines output."""
+        timestamp = time.time()
+        records = []
+        with self.lock:
+            for kind, series in (("counter", self.counters), ("gauge", self.gauges)):
+                for (name, labels), value in sorted(series.items()):
+                    records.append({"time": timestamp, "type": kind, "name": name,
+                                    "labels": dict(labels), "value": value})
+            for (name, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+                records.append({"time": timestamp, "type": "histogram", "name": name, "labels": dict(labels),
+                                "count": histogram.count, "sum": histogram.sum,
+                                "min": histogram.min, "max": histogram.max,
+                                "buckets": [[bound if bound != float("inf") else "+Inf", count]
+                                            for bound, count in histogram.cumulative()]})
+        return records
+
+    def write(self, path):
+        """Save the metrics: JSON lines for a .jsonl path, Prometheus text otherwise."""
+        if path.endswith(".jsonl"):
+            # Appended, so repeated runs build up a history in one file
+            with open(path, "a", encoding="utf-8") as f:
+                for record in self.records():
+                    f.write(json.dumps(record) + "\n")
+        else:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(self.to_prometheus())
+        print(f"[INFO] Saved metrics to {path}")
+
+    def report(self):
+        """Print a one-line summary of every timer histogram."""
+        with self.lock:
+            histograms = sorted(self.histograms.items(), key=lambda item: item[0])
+        for (name, labels), histogram in histograms:
+            mean = histogram.sum / histogram.count if histogram.count else 0.0
+            print(f"[INFO] {name}{_format_labels(labels)}: {histogram.count} x, total {histogram.sum:.2f}s, "
+                  f"mean {mean:.3f}s, max {histogram.max:.3f}s")
+
+# Shared registry used by the download and processing scripts
+METRICS = Metrics()
+
+@contextmanager
+def profiling(profile_path=None, trace_memory=False, top=15):
+    """
+    Optionally profile the enclosed block with cProfile and/or tracemalloc.
+
+    With `profile_path`, cProfile stats are saved there (readable with
+    `python -m pstats`) and the top functions by cumulative time printed.
+    With `trace_memory`, the peak traced allocation and the largest
+    allocation sites are printed and the peak recorded as a gauge. Both only
+    see this process, not the workers of a process pool.
+    """
+    profiler = cProfile.Profile() if profile_path else None
+    if trace_memory:
+        tracemalloc.start()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        if trace_memory:
+            snapshot = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+                tracemalloc.Filter(False, cProfile.__file__),
+            ])
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            METRICS.set("python_traced_memory_peak_bytes", peak)
+            print(f"[INFO] Peak traced memory: {peak / (1024 * 1024):.1f} MB")
+            for stat in snapshot.statistics("lineno")[:top]:
+                print(f"[DEBUG] {stat}")
+        if profiler is not None:
+            profiler.dump_stats(profile_path)
+            print(f"[INFO] Saved profile to {profile_path}")
+            pstats.Stats(profiler).sort_stats("cumulative").print_stats(top)
+
+def add_metrics_arguments(parser):
+    """Add the --metrics, --profile and --trace-memory options to a script's parser."""
+    parser.add_argument("--metrics",
+                        help="Save timers and counters to this file (.jsonl for JSON lines, else Prometheus text)")
+    parser.add_argument("--profile", help="Profile the run with cProfile and save the stats to this file")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Track allocations with tracemalloc and report the largest (this process only)")
+
+@contextmanager
+def instrumented_run(args, name):
+    """
+    Run a script's body under the options from add_metrics_arguments:
+    time it as stage `name`, profile it if asked, then report and save
+    the metrics.
+    """
+    try:
+        with profiling(args.profile, args.trace_memory):
+            with METRICS.timer("stage_seconds", stage=name):
+                yield METRICS
+    finally:
+        METRICS.report()
+        if args.metrics:
+            METRICS.write(args.metrics)
@@ -0,0 +1,317 @@
+import os
+import time
+import asyncio
+import argparse
+import concurrent.futures
+from collections import deque, namedtuple
+
+from agency_lookup import AGENCIES_FILE, save_agencies
+from compression import COMPRESSION_SUFFIXES, compressed_filename, is_xml_file
+from download_data import save_title_xml
+from download_latest_data import flatten_agencies, get_agencies, get_latest_date
+from download_manifest import MANIFEST_NAME, DownloadManifest
+from ecfr_client import BASE_URL, EcfrClient
+from fetch_plan import job_filename, plan_fetch_jobs, report_plan, save_agency_jobs
+from http_cache import add_cache_arguments, cache_from_args
+from metrics import METRICS, add_metrics_arguments, instrumented_run
+from process_xml import (COUNTING_VERSION, ENGINES, _record_parse, _timed_process_xml, aggregate_results,
+                         cached_rows, store_results, write_outputs)
+from results_store import DEFAULT_STORE
+from row_cache import RowCache
+
+# A node of the run's dependency graph: its name, the coroutine function it
+# runs, and the stages that must finish before it starts. Stages connected
+# by a queue instead (fetch -> parse) start together and overlap.
+Stage = namedtuple("Stage", ["name", "run", "after"])
+
+async def run_stages(stages):
+    """
+    Run a dependency graph of stages, each as soon as every stage it is
+    after has finished. A stage whose dependency failed is skipped. Returns
+    {name: (start, end)} in seconds from the start of the run; the first
+    failure is raised once every stage has finished or been skipped.
+    """
+    start = time.perf_counter()
+    finished = {stage.name: asyncio.Event() for stage in stages}
+    failed = set()
+    spans = {}
+
+    async def run(stage):
+        try:
+            for name in stage.after:
+                await finished[name].wait()
+            if failed & set(stage.after):
+                failed.add(stage.name)
+                print(f"[ERROR] Skipping stage {stage.name}: {', '.join(sorted(failed & set(stage.after)))} failed")
+                return
+            began = time.perf_counter() - start
+            try:
+                with METRICS.timer("pipeline_stage_seconds", stage=stage.name):
+                    await stage.run()
+            except BaseException:
+                failed.add(stage.name)
+                raise
+            finally:
+                spans[stage.name] = (began, time.perf_counter() - start)
+        finally:
+            finished[stage.name].set()
+
+    outcomes = await asyncio.gather(*(run(stage) for stage in stages), return_exceptions=True)
+    for outcome in outcomes:
+        if isinstance(outcome, BaseException):
+            raise outcome
+    return spans
+
+class Pipeline:
+    """
+    One overlapped run: fetch -> parse -> aggregate -> export.
+
+    Downloads run on `concurrency` fetchers sharing one EcfrClient and put
+    each finished file on a queue of `queue_size`; parsers take files off
+    it onto a pool of `workers` processes, so a title is parsed as soon as
+    its download completes while the others continue. When the queue is
+    full the fetchers wait, so downloads never run far ahead of parsing.
+    If parsing fails, `dead` is set and the fetchers stop instead of
+    waiting for room in a queue nobody reads.
+    XML already in data_dir that no job fetched is parsed too, so the
+    outputs cover the same files as process_xml. Aggregation and export
+    start once every file is parsed.
+    """
+
+    def __init__(self, jobs, data_dir="data", base_url=BASE_URL, compression="none", verify=False,
+                 revalidate=False, engine="iterparse", workers=1, queue_size=None, cache=None,
+                 concurrency=8, store_path=DEFAULT_STORE, agencies_path=AGENCIES_FILE, excel=True,
+                 **client_options):
+        self.jobs = jobs
+        self.data_dir = data_dir
+        self.base_url = base_url
+        self.compression = compression
+        self.verify = verify
+        self.revalidate = revalidate
+        self.engine = engine
+        self.workers = max(1, workers)
+        self.queue_size = queue_size or 2 * self.workers
+        self.cache = cache
+        self.concurrency = max(1, concurrency)
+        self.store_path = store_path
+        self.agencies_path = agencies_path
+        self.excel = excel
+        self.client_options = client_options
+
+        self.queue = None
+        self.dead = None
+        self.results = {}
+        self.timings = {}
+        self.aggregated = None
+        self.spans = {}
+        self.counts = {"fetched": 0, "failed": 0, "parsed": 0, "cache_hits": 0, "rows": 0}
+        self.parse_seconds = 0.0
+        self.peak_queue = 0
+        self.first_parsed = None
+
+    def stages(self):
+        return [
+            Stage("fetch", self.fetch, []),
+            Stage("parse", self.parse, []),
+            Stage("aggregate", self.aggregate, ["parse"]),
+            Stage("export", self.export, ["aggregate"]),
+        ]
+
+    async def run(self):
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.dead = asyncio.Event()
+        self.started = time.perf_counter()
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self.workers) as self.executor:
+            self.spans = await run_stages(self.stages())
+        return self.results
+
+    async def put(self, file_path):
+        """Queue a file for the parsers; returns False, without queueing it, once parsing has failed."""
+        put = asyncio.ensure_future(self.queue.put(file_path))
+        dead = asyncio.ensure_future(self.dead.wait())
+        try:
+            await asyncio.wait([put, dead], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            put.cancel()
+            dead.cancel()
+        if put.cancelled():
+            return False
+        self.peak_queue = max(self.peak_queue, self.queue.qsize())
+        return True
+
+    async def fetch(self):
+        manifest = DownloadManifest(os.path.join(self.data_dir, MANIFEST_NAME))
+        pending = deque(self.jobs)
+        queued = set()
+
+        async def fetcher(client):
+            while pending and not self.dead.is_set():
+                job = pending.popleft()
+                filename = compressed_filename(job_filename(job), self.compression)
+                file_path = os.path.join(self.data_dir, filename)
+                await save_title_xml(client, job, manifest, self.data_dir, self.compression, self.verify,
+                                     self.revalidate)
+                if (manifest.entries.get(filename) or {}).get("status") != "complete" or not os.path.exists(file_path):
+                    self.counts["failed"] += 1
+                    continue
+                self.counts["fetched"] += 1
+                queued.add(file_path)
+                if not await self.put(file_path):
+                    return
+
+        try:
+            try:
+                async with EcfrClient(self.base_url, concurrency=self.concurrency, **self.client_options) as client:
+                    await asyncio.gather(*(fetcher(client) for _ in range(self.concurrency)))
+            finally:
+                manifest.save()
+                manifest.report()
+            for filename in sorted(os.listdir(self.data_dir)):
+                file_path = os.path.join(self.data_dir, filename)
+                if is_xml_file(filename) and file_path not in queued and not await self.put(file_path):
+                    break
+        finally:
+            # One end marker per parser, even if fetching failed. If parsing
+            # failed nothing reads the queue any more, so drop what is left
+            # in it rather than wait for room.
+            for _ in range(self.workers):
+                if not await self.put(None):
+                    break
+            if self.dead.is_set():
+                while not self.queue.empty():
+                    self.queue.get_nowait()
+
+    async def parse(self):
+        loop = asyncio.get_running_loop()
+
+        async def parser():
+            while True:
+                file_path = await self.queue.get()
+                if file_path is None:
+                    return
+                # Hashing a large title takes a while, so look it up off the event loop
+                rows = await asyncio.to_thread(cached_rows, self.cache, file_path) if self.cache is not None else None
+                if rows is not None:
+                    self.counts["cache_hits"] += 1
+                    METRICS.inc("row_cache_hits_total")
+                else:
+                    if self.cache is not None:
+                        METRICS.inc("row_cache_misses_total")
+                    rows, timing, _ = await loop.run_in_executor(self.executor, _timed_process_xml,
+                                                                 file_path, self.engine, None)
+                    self.timings[file_path] = timing
+                    self.parse_seconds += timing[0]
+                    _record_parse(file_path, rows, timing, self.engine)
+                    if self.cache is not None:
+                        await asyncio.to_thread(self.cache.put, file_path, rows)
+                    print(f"Processed {os.path.basename(file_path)} in {timing[0]:.2f}s")
+                self.results[file_path] = rows
+                self.counts["parsed"] += 1
+                self.counts["rows"] += len(rows)
+                if self.first_parsed is None:
+                    self.first_parsed = time.perf_counter() - self.started
+
+        parsers = [asyncio.ensure_future(parser()) for _ in range(self.workers)]
+        try:
+            await asyncio.gather(*parsers)
+        except BaseException:
+            # Stop the other parsers and tell fetch nobody is reading the queue
+            self.dead.set()
+            for task in parsers:
+                task.cancel()
+            raise
+        # Rows in sorted filename order, as process_files returns them
+        self.results = {file_path: self.results[file_path] for file_path in sorted(self.results)}
+        if self.cache is not None:
+            self.cache.save_index()
+
+    async def aggregate(self):
+        if self.excel:
+            self.aggregated = await asyncio.to_thread(aggregate_results, self.results, self.agencies_path)
+
+    async def export(self):
+        await asyncio.to_thread(store_results, self.results, self.store_path)
+        if self.aggregated is not None:
+            await asyncio.to_thread(write_outputs, *self.aggregated, self.data_dir)
+
+    def report(self):
+        """Print the end-of-run summary of every stage."""
+        print("\n[SUMMARY]")
+        for name, (start, end) in sorted(self.spans.items(), key=lambda item: item[1]):
+            print(f"Stage {name}: {start:.2f}s -> {end:.2f}s ({end - start:.2f}s)")
+        fetch_end = self.spans.get("fetch", (0.0, 0.0))[1]
+        overlap = max(0.0, fetch_end - self.first_parsed) if self.first_parsed is not None else 0.0
+        print(f"Files: {self.counts['fetched']} fetched, {self.counts['failed']} failed, "
+              f"{self.counts['parsed']} parsed ({self.counts['cache_hits']} from the row cache), "
+              f"{self.counts['rows']} chapter rows")
+        print(f"Parsing: {self.parse_seconds:.2f}s on {self.workers} worker(s), {overlap:.2f}s of it "
+              f"alongside downloads; peak queue {self.peak_queue}/{self.queue_size}")
+        total = max((end for _, end in self.spans.values()), default=0.0)
+        print(f"Total: {total:.2f}s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Download, parse, aggregate and export in one overlapped run.")
+    parser.add_argument("--date", help="Snapshot date to download (default: the latest available)")
+    parser.add_argument("--data-dir", default="data", help="Directory for XML and outputs (default: data)")
+    parser.add_argument("--base-url", default=BASE_URL,
+                        help=f"eCFR API base URL (default: {BASE_URL}, or $ECFR_BASE_URL)")
+    parser.add_argument("--concurrency", type=int, default=8,
+                        help="Downloads in flight (default: 8)")
+    parser.add_argument("--rate-limit", type=float, default=5.0,
+                        help="Maximum requests started per second per host (default: 5)")
+    parser.add_argument("--max-retries", type=int, default=5,
+                        help="Retries on 429/5xx responses and connection errors (default: 5)")
+    parser.add_argument("--compression", choices=sorted(COMPRESSION_SUFFIXES), default="none",
+                        help="Store downloaded XML compressed (default: none)")
+    parser.add_argument("--verify", action="store_true",
+                        help="Checksum every previously downloaded file instead of trusting size and mtime")
+    parser.add_argument("--revalidate", action="store_true",
+                        help="Ask the server whether previously downloaded files changed (conditional GET)")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="iterparse",
+                        help="XML word-count engine (default: iterparse)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Parser processes (default: one per CPU)")
+    parser.add_argument("--queue-size", type=int,
+                        help="Downloaded files waiting to be parsed before downloads pause (default: 2 per worker)")
+    parser.add_argument("--no-cache", dest="cache", action="store_false",
+                        help="Parse every file even if its rows are cached")
+    parser.add_argument("--store", help="SQLite results store to upsert into (default: <data-dir>/results.sqlite)")
+    parser.add_argument("--no-excel", dest="excel", action="store_false",
+                        help="Skip the output_chapter.xlsx / output_agency_words.xlsx / dashboard bundle export")
+    add_cache_arguments(parser)
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    with instrumented_run(args, "pipeline"):
+        run(args)
+
+def run(args):
+    """Body of main(): plan the downloads for one snapshot date, then run the pipeline."""
+    os.makedirs(args.data_dir, exist_ok=True)
+    http_cache = cache_from_args(args, os.path.join(args.data_dir, ".cache", "http"))
+    date = args.date or get_latest_date(args.base_url, http_cache)
+    print(f"[INFO] Using snapshot date: {date}")
+
+    agencies = get_agencies(args.base_url, http_cache)
+    agencies_path = os.path.join(args.data_dir, os.path.basename(AGENCIES_FILE))
+    save_agencies(agencies, agencies_path)
+    jobs, agency_jobs, requested = plan_fetch_jobs(flatten_agencies(agencies), [date])
+    report_plan(jobs, requested)
+    save_agency_jobs(agency_jobs, args.data_dir)
+
+    cache = RowCache(os.path.join(args.data_dir, ".cache", "rows"), COUNTING_VERSION) if args.cache else None
+    pipeline = Pipeline(jobs, args.data_dir, args.base_url, args.compression, args.verify, args.revalidate,
+                        args.engine, args.workers, args.queue_size, cache, args.concurrency,
+                        args.store or os.path.join(args.data_dir, os.path.basename(DEFAULT_STORE)),
+                        agencies_path, args.excel, rate_limit=args.rate_limit, max_retries=args.max_retries)
+    try:
+        asyncio.run(pipeline.run())
+    finally:
+        if cache is not None:
+            cache.report()
+        if http_cache is not None:
+            http_cache.report()
+        pipeline.report()
+
+if __name__ == "__main__":
+    main()
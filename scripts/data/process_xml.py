@@ -1,91 +1,461 @@
 import os
-import pandas as pd
+import time
+import argparse
+import concurrent.futures
 from bs4 import BeautifulSoup
+from lxml import etree
 
-def process_xml(file_path):
-    """Process a single XML file and extract word counts."""
-    with open(file_path, "r", encoding="utf-8") as file:
+from agency_lookup import AGENCIES_FILE, load_agency_lookup
+from chapter_table import COLUMNS, ChapterTable
+from compression import is_xml_file, open_xml
+from metrics import METRICS, add_metrics_arguments, instrumented_run
+from results_store import DEFAULT_STORE, ResultsStore, snapshot_date
+from row_cache import DEFAULT_CACHE_DIR, RowCache
+from word_count import WordCounter
+
+def split_agency_head(agency_text):
+    """Split a DIV3 HEAD such as "CHAPTER I—AGENCY" into (chapter, agency)."""
+    # Split agency_text on em dash (—)
+    parts = agency_text.split('—')
+
+    # Assign Chapter and Agency based on split results
+    if len(parts) > 1:  # If em dash was found
+        chapter = parts[0].strip()
+        agency = '—'.join(parts[1:]).strip()  # Rejoin remaining parts for agency
+    else:
+        chapter = parts[0].strip()  # If no em dash, assume entire text is chapter
+        agency = ''
+    return chapter, agency
+
+def title_from_filename(file_path):
+    """Extract the title number from a filename such as title-1-2023-01-01.xml(.gz)."""
+    return os.path.basename(file_path).split("-")[1].split(".")[0]
+
+def process_xml_bs4(file_path):
+    """Process a single XML file with BeautifulSoup (loads the whole tree)."""
+    with open_xml(file_path) as file:
         soup = BeautifulSoup(file, "xml")
 
-    # Extract title number from filename
-    title_number = os.path.basename(file_path).split("-")[1].split(".")[0]
+    # Extract title number and snapshot date from filename
+    title_number = title_from_filename(file_path)
+    date = snapshot_date(file_path)
 
     # Extract agencies and word counts
     data = []
     for div3 in soup.find_all("DIV3"):
         agency_text = div3.find("HEAD").get_text().strip() if div3.find("HEAD") else "No HEAD"
+        chapter, agency = split_agency_head(agency_text)
 
-        # Split agency_text on em dash (—)
-        parts = agency_text.split('—')
+        word_count = sum(len(p.get_text().split()) for p in div3.find_all("P"))
+        data.append([title_number, chapter, agency, word_count, date])
 
-        # Assign Chapter and Agency based on split results
-        if len(parts) > 1:  # If em dash was found
-            chapter = parts[0].strip()
-            agency = '—'.join(parts[1:]).strip()  # Rejoin remaining parts for agency
-        else:
-            chapter = parts[0].strip()  # If no em dash, assume entire text is chapter
-            agency = ''
+    return data
 
-        word_count = sum(len(p.get_text().split()) for p in div3.find_all("P"))
-        data.append([title_number, chapter, agency, word_count])
+def process_xml_iterparse(file_path):
+    """
+    Process a single XML file with lxml iterparse.
+
+    Elements are cleared as soon as they have been counted, so memory stays
+    flat regardless of the title size. Produces the same rows as the
+    BeautifulSoup engine. Compressed (.gz/.zst) files are decompressed as a
+    stream.
+    """
+    with open_xml(file_path) as source:
+        return iterparse_rows(source, title_from_filename(file_path), snapshot_date(file_path))
+
+def iterparse_rows(source, title_number, date):
+    """The rows of process_xml_iterparse for an open binary XML stream."""
+    data = []
+    head = None        # HEAD text of the current DIV3 (None until seen)
+    word_count = 0
+    in_div3 = False
+    p_depth = 0        # Open <P> elements; their children must survive until the outer P ends
+
+    context = etree.iterparse(source, events=("start", "end"),
+                              remove_comments=True, remove_pis=True)
+    for event, elem in context:
+        tag = elem.tag
+        if event == "start":
+            if tag == "DIV3":
+                in_div3 = True
+                head = None
+                word_count = 0
+            elif tag == "P":
+                p_depth += 1
+            continue
+
+        if tag == "P":
+            if in_div3:
+                word_count += len("".join(elem.itertext()).split())
+            p_depth -= 1
+        elif in_div3:
+            if tag == "HEAD" and head is None:
+                head = "".join(elem.itertext()).strip()
+            elif tag == "DIV3":
+                agency_text = head if head is not None else "No HEAD"
+                chapter, agency = split_agency_head(agency_text)
+                data.append([title_number, chapter, agency, word_count, date])
+                in_div3 = False
+
+        # Free everything already processed, except the subtree of an open P
+        if p_depth == 0:
+            elem.clear()
+            parent = elem.getparent()
+            if parent is not None:
+                while elem.getprevious() is not None:
+                    del parent[0]
+    del context
 
     return data
 
+def process_xml_fast(file_path):
+    """
+    Process a single XML file with lxml iterparse and a batched word counter.
+
+    Walks the file like process_xml_iterparse, but takes each <P>'s text as
+    UTF-8 bytes serialized by lxml and counts a chapter's paragraphs in
+    batches with count_words_utf8 instead of building and splitting a
+    Python string per paragraph. Gives exactly the same counts.
+    """
+    with open_xml(file_path) as source:
+        return fast_rows(source, title_from_filename(file_path), snapshot_date(file_path))
+
+def fast_rows(source, title_number, date):
+    """The rows of process_xml_fast for an open binary XML stream."""
+    data = []
+    head = None        # HEAD text of the current DIV3 (None until seen)
+    counter = WordCounter()
+    in_div3 = False
+    p_depth = 0        # Open <P> elements; their children must survive until the outer P ends
+    tostring = etree.tostring
+
+    context = etree.iterparse(source, events=("start", "end"),
+                              remove_comments=True, remove_pis=True)
+    for event, elem in context:
+        tag = elem.tag
+        if event == "start":
+            if tag == "DIV3":
+                in_div3 = True
+                head = None
+                counter.take()
+            elif tag == "P":
+                p_depth += 1
+            continue
+
+        if tag == "P":
+            if in_div3:
+                counter.add(tostring(elem, method="text", encoding="utf-8", with_tail=False))
+            p_depth -= 1
+        elif in_div3:
+            if tag == "HEAD" and head is None:
+                head = "".join(elem.itertext()).strip()
+            elif tag == "DIV3":
+                agency_text = head if head is not None else "No HEAD"
+                chapter, agency = split_agency_head(agency_text)
+                data.append([title_number, chapter, agency, counter.take(), date])
+                in_div3 = False
+
+        # Free everything already processed, except the subtree of an open P
+        if p_depth == 0:
+            elem.clear()
+            parent = elem.getparent()
+            if parent is not None:
+                while elem.getprevious() is not None:
+                    del parent[0]
+    del context
+
+    return data
+
+# Bump whenever the counting rules change, to invalidate cached rows
+COUNTING_VERSION = "2"
+
+# Word-count engines selectable with --engine
+ENGINES = {
+    "iterparse": process_xml_iterparse,
+    "fast": process_xml_fast,
+    "bs4": process_xml_bs4,
+}
+
+def process_xml(file_path, engine="iterparse"):
+    """Process a single XML file and extract word counts."""
+    return ENGINES[engine](file_path)
+
+def _timed_process_xml(file_path, engine, shard=None):
+    """
+    Worker entry point: process one file (or one shard of it) and report its
+    wall and CPU time, plus the wall-clock time it started so the parent can
+    tell how long it waited in the pool's queue.
+    """
+    started = time.time()
+    start, start_cpu = time.perf_counter(), time.process_time()
+    if shard is None:
+        rows = process_xml(file_path, engine)
+    else:
+        # Imported here because shard_xml builds on this module
+        from shard_xml import process_shard
+        rows = process_shard(shard, engine)
+    return rows, (time.perf_counter() - start, time.process_time() - start_cpu), started
+
+def _record_parse(file_path, rows, timing, engine):
+    """Record one parsed file in METRICS."""
+    METRICS.observe("file_parse_seconds", timing[0], engine=engine)
+    METRICS.observe("file_parse_cpu_seconds", timing[1], engine=engine)
+    METRICS.inc("parsed_bytes_total", os.path.getsize(file_path), engine=engine)
+    METRICS.inc("parsed_rows_total", len(rows), engine=engine)
+
+def cached_rows(cache, file_path):
+    """A file's rows from a RowCache, or None if its content has not been parsed before."""
+    rows = cache.get(file_path)
+    if rows is None:
+        return None
+    # Cache entries are shared by identical content, so restamp the title
+    # and date from this file's name
+    title_number, date = title_from_filename(file_path), snapshot_date(file_path)
+    return [[title_number] + row[1:4] + [date] for row in rows]
+
+def process_files(file_paths, engine="iterparse", workers=1, cache=None, shard_bytes=None):
+    """
+    Process many XML files, optionally across a pool of worker processes.
+
+    Files are submitted largest first so the biggest titles do not end up as
+    the tail of the run. With `shard_bytes`, uncompressed files larger than
+    that are split into shards at DIV3/DIV5 boundaries (see shard_xml) that
+    are parsed as separate work units and merged back, so one huge title no
+    longer holds a single worker. Rows are merged in sorted filename order,
+    so the output does not depend on scheduling. Files whose content is
+    already in `cache` (a RowCache) are not parsed at all. Returns (results,
+    timings): results maps each file, in sorted order, to its rows and
+    timings maps each parsed file to its (wall, cpu) seconds, summed over
+    its shards.
+    """
+    file_paths = sorted(file_paths)
+    results = {}
+    timings = {}
+
+    if cache is not None:
+        for file_path in file_paths:
+            rows = cached_rows(cache, file_path)
+            if rows is not None:
+                results[file_path] = rows
+    pending = [file_path for file_path in file_paths if file_path not in results]
+    if cache is not None:
+        METRICS.inc("row_cache_hits_total", len(results))
+        METRICS.inc("row_cache_misses_total", len(pending))
+
+    # Work units: whole files, or the shards of files large enough to split
+    shards = {}
+    if shard_bytes and engine != "bs4":
+        from shard_xml import plan_shards
+        for file_path in pending:
+            shards[file_path] = plan_shards(file_path, shard_bytes)
+            if shards[file_path]:
+                print(f"[INFO] Split {os.path.basename(file_path)} into {len(shards[file_path])} shards")
+    largest_first = sorted(pending, key=os.path.getsize, reverse=True)
+    units = [(file_path, shard) for file_path in largest_first for shard in shards.get(file_path) or [None]]
+    remaining = {file_path: len(shards.get(file_path) or [None]) for file_path in pending}
+    parts = {}
+
+    def finish(file_path, shard, rows, timing):
+        """Collect one unit's rows; return True once its file is complete."""
+        parts.setdefault(file_path, []).append(rows)
+        wall, cpu = timings.get(file_path, (0.0, 0.0))
+        timings[file_path] = (wall + timing[0], cpu + timing[1])
+        remaining[file_path] -= 1
+        if remaining[file_path]:
+            return False
+        if shard is None:
+            results[file_path] = parts.pop(file_path)[0]
+        else:
+            from shard_xml import merge_shard_rows
+            results[file_path] = merge_shard_rows(file_path, parts.pop(file_path))
+        _record_parse(file_path, results[file_path], timings[file_path], engine)
+        return True
+
+    if workers <= 1:
+        for file_path, shard in units:
+            if shard is None:
+                print(f"Processing {os.path.basename(file_path)}...")
+            rows, timing, _ = _timed_process_xml(file_path, engine, shard)
+            finish(file_path, shard, rows, timing)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            submitted = time.time()
+            future_to_unit = {executor.submit(_timed_process_xml, file_path, engine, shard): (file_path, shard)
+                              for file_path, shard in units}
+            for future in concurrent.futures.as_completed(future_to_unit):
+                file_path, shard = future_to_unit[future]
+                rows, timing, started = future.result()
+                METRICS.observe("pool_queue_seconds", max(0.0, started - submitted))
+                if finish(file_path, shard, rows, timing):
+                    print(f"Processed {os.path.basename(file_path)} in {timings[file_path][0]:.2f}s")
+
+    if cache is not None:
+        for file_path in pending:
+            cache.put(file_path, results[file_path])
+        cache.save_index()
+
+    return {file_path: results[file_path] for file_path in file_paths}, timings
+
 def combine_rows(df):
-    """Combine rows where one agency is contained within another."""
-    # Group by 'Title' and 'Chapter'
-    grouped = df.groupby(['Title', 'Chapter'])
-
-    # Iterate through groups
-    combined_data = []
-    for name, group in grouped:
-        # Find rows where 'Agency' is fully contained in another row
-        for i in range(len(group)):
-            for j in range(i + 1, len(group)):
-                if group.iloc[i]['Agency'] in group.iloc[j]['Agency'] and group.iloc[i]['Agency'] != group.iloc[j]['Agency']:
-                    # Add WordCounts and update the longer row
-                    group.loc[group.index[i], 'WordCount'] += group.loc[group.index[j], 'WordCount']
-                    group.loc[group.index[j], 'WordCount'] = -1  # Mark for deletion
-
-        # Remove rows marked for deletion
-        combined_data.extend(group[group['WordCount'] != -1].values.tolist())
-
-    # Create a new DataFrame from the combined data
-    combined_df = pd.DataFrame(combined_data, columns=df.columns)
-    return combined_df
+    """
+    Combine rows where one agency is contained within another.
+
+    Within each (Title, Chapter) group, a row whose Agency is a proper
+    substring of a later row's Agency absorbs that row's WordCount, and the
+    later row is dropped. The work is done on dictionary-encoded columns by
+    ChapterTable.combine; rows come back in (Title, Chapter) order with all
+    of their columns.
+    """
+    rows, counts = ChapterTable.from_frame(df).combine()
+    return df.iloc[rows].assign(WordCount=counts).reset_index(drop=True)
+
+def agency_totals(df, lookup=None):
+    """
+    Total the WordCount of each agency, from a DataFrame of chapter rows or
+    a ChapterTable. With `lookup` (an AgencyLookup) chapters are attributed
+    exactly from the admin API's cfr_references; otherwise agency name
+    variants parsed from HEADs are combined.
+    """
+    if lookup is not None:
+        return lookup.totals(df)
+
+    # Combine rows, then total the non-zero rows of each agency
+    table = df if isinstance(df, ChapterTable) else ChapterTable.from_frame(df)
+    return table.agency_totals()
 
 def main():
+    parser = argparse.ArgumentParser(description="Compute eCFR word counts per chapter and agency.")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="iterparse",
+                        help="XML word-count engine (default: iterparse)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of worker processes used to parse files (default: 1)")
+    parser.add_argument("--shard-mb", type=float,
+                        help="Split uncompressed files larger than this many MB into shards parsed "
+                             "in parallel (iterparse/fast engines)")
+    parser.add_argument("--no-cache", dest="cache", action="store_false",
+                        help="Parse every file even if its rows are cached")
+    parser.add_argument("--clear-cache", action="store_true",
+                        help="Drop all cached rows before processing")
+    parser.add_argument("--sections", action="store_true",
+                        help="Also build the DIV1-DIV9 word count index data/sections.npz")
+    parser.add_argument("--text-index", action="store_true",
+                        help="Count words while building the full-text index data/text_index.npz "
+                             "(every file is parsed; the row cache is not used)")
+    parser.add_argument("--store", default=DEFAULT_STORE,
+                        help=f"SQLite results store to upsert into (default: {DEFAULT_STORE})")
+    parser.add_argument("--agencies", default=AGENCIES_FILE,
+                        help=f"agencies.json saved by the downloaders, used to attribute chapters to agencies "
+                             f"(default: {AGENCIES_FILE}; HEAD names are combined if it is missing)")
+    parser.add_argument("--no-excel", dest="excel", action="store_false",
+                        help="Skip the output_chapter.xlsx / output_agency_words.xlsx / dashboard bundle export")
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    with instrumented_run(args, "process_xml"):
+        run(args)
+
+def run(args):
+    """Body of main(): parse, store and export, timing each stage."""
+
     # Create data directory if it doesn't exist
     os.makedirs("data", exist_ok=True)
     
     # Process all XML files in the data directory
     xml_dir = "data"
-    all_data = []
-    for filename in os.listdir(xml_dir):
-        if filename.endswith(".xml"):
-            file_path = os.path.join(xml_dir, filename)
-            print(f"Processing {filename}...")
-            all_data.extend(process_xml(file_path))
+    file_paths = [os.path.join(xml_dir, filename) for filename in os.listdir(xml_dir)
+                  if is_xml_file(filename)]
 
-    # Create initial DataFrame
-    df = pd.DataFrame(all_data, columns=["Title", "Chapter", "Agency", "WordCount"])
+    cache = None
+    if args.cache or args.clear_cache:
+        cache = RowCache(DEFAULT_CACHE_DIR, COUNTING_VERSION)
+        if args.clear_cache:
+            cache.clear()
+            print(f"[INFO] Cleared row cache in {DEFAULT_CACHE_DIR}")
+        if not args.cache:
+            cache = None
 
-    # Save intermediate results
-    df.to_excel('data/output_chapter.xlsx', index=False)
-    print("Saved intermediate results to output_chapter.xlsx")
+    start = time.perf_counter()
+    with METRICS.timer("stage_seconds", stage="parse"):
+        if args.text_index:
+            # Imported here because text_index builds on this module
+            from text_index import DEFAULT_TEXT_INDEX, build_text_index
+            results, timings = build_text_index(file_paths, DEFAULT_TEXT_INDEX, args.workers)
+        else:
+            shard_bytes = int(args.shard_mb * (1 << 20)) if args.shard_mb else None
+            results, timings = process_files(file_paths, args.engine, args.workers, cache, shard_bytes)
+    wall_time = time.perf_counter() - start
+    if cache is not None:
+        cache.report()
+
+    # Report per-file and overall timings. The serial cost is estimated from
+    # per-file CPU time, since wall times overlap when workers share cores.
+    for file_path, (seconds, cpu_seconds) in sorted(timings.items(), key=lambda item: item[1], reverse=True):
+        print(f"[INFO] {os.path.basename(file_path)}: {seconds:.2f}s wall, {cpu_seconds:.2f}s cpu")
+    serial_time = sum(cpu_seconds for _, cpu_seconds in timings.values())
+    speedup = serial_time / wall_time if timings and wall_time > 0 else 1.0
+    print(f"[INFO] Parsed {len(timings)} of {len(file_paths)} files with {args.workers} worker(s) "
+          f"in {wall_time:.2f}s (serial estimate {serial_time:.2f}s, speedup {speedup:.2f}x)")
+
+    if args.sections:
+        # Imported here because section_index builds on this module
+        from section_index import DEFAULT_SECTIONS, build_section_index
+        with METRICS.timer("stage_seconds", stage="sections"):
+            build_section_index(file_paths, DEFAULT_SECTIONS, args.workers)
+
+    export_results(results, args.store, args.agencies, args.excel)
+
+def export_results(results, store_path=DEFAULT_STORE, agencies_path=AGENCIES_FILE, excel=True, data_dir="data"):
+    """
+    Store, aggregate and export parsed rows ({file: rows}, as returned by
+    process_files): upsert them into the results store, then unless
+    `excel` is False write output_chapter.xlsx, the agency totals in
+    output_agency_words.xlsx and the dashboard bundle into data_dir.
+    """
+    store_results(results, store_path)
+    if excel:
+        write_outputs(*aggregate_results(results, agencies_path), data_dir)
+
+def store_results(results, store_path=DEFAULT_STORE):
+    """Upsert each file's rows into the results store under its snapshot date."""
+    with METRICS.timer("stage_seconds", stage="store"), ResultsStore(store_path) as store:
+        for file_path, rows in results.items():
+            store.upsert_rows(rows, os.path.basename(file_path))
+    print(f"Saved results to {store_path}")
+
+def aggregate_results(results, agencies_path=AGENCIES_FILE):
+    """
+    The chapter rows of every file as one DataFrame, the AgencyLookup from
+    agencies_path (None without one) and the agency totals.
+    """
+    # Encode the rows into typed columns as they are collected
+    table = ChapterTable()
+    for rows in results.values():
+        table.extend(rows)
+    df = table.to_frame()
 
     # Combine rows and process agency word counts
-    df = combine_rows(df)
-    
-    # Remove rows with 0 in WordCount
-    agency_wordcounts = df[df['WordCount'] != 0]
+    with METRICS.timer("stage_seconds", stage="combine"):
+        lookup = load_agency_lookup(agencies_path)
+        agency_wordcounts = agency_totals(table, lookup)
+    return df, lookup, agency_wordcounts
 
-    # Calculate total WordCount for each agency
-    agency_wordcounts = agency_wordcounts.groupby('Agency')['WordCount'].sum().reset_index()
+def write_outputs(df, lookup, agency_wordcounts, data_dir="data"):
+    """Write the chapter rows, agency totals and dashboard bundle into data_dir."""
+    # Save intermediate results
+    with METRICS.timer("stage_seconds", stage="export"):
+        df.to_excel(os.path.join(data_dir, 'output_chapter.xlsx'), index=False)
+    print("Saved intermediate results to output_chapter.xlsx")
 
     # Save final results
-    agency_wordcounts.to_excel('data/output_agency_words.xlsx', index=False)
+    with METRICS.timer("stage_seconds", stage="export"):
+        agency_wordcounts.to_excel(os.path.join(data_dir, 'output_agency_words.xlsx'), index=False)
     print("Saved final results to output_agency_words.xlsx")
 
+    # Precomputed data for the dashboard; imported here because
+    # dashboard_bundle builds on this module
+    from dashboard_bundle import build_bundle, write_bundle
+    with METRICS.timer("stage_seconds", stage="bundle"):
+        write_bundle(build_bundle(df, agency_wordcounts, lookup), os.path.join(data_dir, "dashboard_bundle.json"))
+
 if __name__ == "__main__":
     main() 
\ No newline at end of file
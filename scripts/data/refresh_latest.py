@@ -0,0 +1,190 @@
+import os
+import json
+import asyncio
+import argparse
+
+import pandas as pd
+
+from agency_lookup import load_agency_lookup
+from compression import COMPRESSION_SUFFIXES, compressed_filename
+from ecfr_client import BASE_URL, EcfrClient
+from fetch_plan import FetchJob, job_filename
+from http_cache import add_cache_arguments, cache_from_args
+from metrics import METRICS, add_metrics_arguments, instrumented_run
+from process_xml import COLUMNS, ENGINES, agency_totals, process_xml
+from results_store import ResultsStore
+
+def latest_title_dates(versions):
+    """
+    Reduce the versions.json entries to the latest amendment date per title.
+
+    Each entry is expected to carry a "title" and a "date"; entries without a
+    title are ignored.
+    """
+    latest = {}
+    for version in versions:
+        title = version.get("title")
+        date = version.get("date")
+        if title is None or not date:
+            continue
+        title = str(title)
+        if date > latest.get(title, ""):
+            latest[title] = date
+    return latest
+
+def load_state(state_file):
+    """Load the per-title last-amended dates recorded by the previous run."""
+    if not os.path.exists(state_file):
+        return {}
+    with open(state_file, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_state(state, state_file):
+    """Write the state file atomically so a crash never leaves it half-written."""
+    tmp_path = state_file + ".part"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, state_file)
+
+def changed_titles(latest, state):
+    """Titles whose latest version is newer than the one recorded in the state."""
+    return sorted((title for title, date in latest.items() if date > state.get(title, "")),
+                  key=lambda title: int(title) if title.isdigit() else title)
+
+async def fetch_changed_titles(latest, titles, data_dir, base_url, compression, **client_options):
+    """Download the full XML of every changed title. Returns {title: filepath} for successes."""
+    fetched = {}
+    async with EcfrClient(base_url, **client_options) as client:
+        async def fetch(title):
+            job = FetchJob(latest[title], title, None)
+            filepath = os.path.join(data_dir, compressed_filename(job_filename(job), compression))
+            try:
+                await client.save_title_xml(job.date, job.title, filepath, compression=compression)
+                print(f"[INFO] Saved XML for {os.path.basename(filepath)}")
+                fetched[title] = filepath
+            except Exception as e:
+                print(f"[ERROR] Error saving title {title}: {e}")
+
+        await asyncio.gather(*(fetch(title) for title in titles))
+    return fetched
+
+def remove_title_xml(data_dir, job):
+    """Delete the XML saved for a job, in whichever compression it was stored."""
+    for compression in COMPRESSION_SUFFIXES:
+        filepath = os.path.join(data_dir, compressed_filename(job_filename(job), compression))
+        if os.path.exists(filepath):
+            os.remove(filepath)
+            print(f"[INFO] Removed superseded {os.path.basename(filepath)}")
+
+def patch_outputs(new_rows, replaced, data_dir, sheet_name="output_chapter.xlsx"):
+    """
+    Replace chapter rows in output_chapter.xlsx and recompute
+    output_agency_words.xlsx from the patched table.
+
+    `replaced` maps each refreshed title to the snapshot dates whose rows
+    the new rows supersede. Rows of that title for any other date (earlier
+    years, or snapshots kept alongside) are left in place.
+    """
+    chapter_file = os.path.join(data_dir, sheet_name)
+    if os.path.exists(chapter_file):
+        df = pd.read_excel(chapter_file, dtype={"Title": str, "Chapter": str, "Agency": str, "Date": str})
+        df[["Agency", "Date"]] = df[["Agency", "Date"]].fillna("")
+        stale = pd.Series(False, index=df.index)
+        for title, dates in replaced.items():
+            stale |= (df["Title"] == title) & df["Date"].isin(list(dates))
+        df = df[~stale]
+    else:
+        df = pd.DataFrame(columns=COLUMNS)
+
+    df = pd.concat([df, pd.DataFrame(new_rows, columns=COLUMNS)], ignore_index=True)
+    df["WordCount"] = df["WordCount"].astype("int64")
+    df.to_excel(chapter_file, index=False)
+    print(f"[INFO] Patched {len(new_rows)} chapter rows for {len(replaced)} title(s) in {chapter_file}")
+
+    agency_wordcounts = agency_totals(df, load_agency_lookup(os.path.join(data_dir, "agencies.json")))
+    agency_file = os.path.join(data_dir, "output_agency_words.xlsx")
+    agency_wordcounts.to_excel(agency_file, index=False)
+    print(f"[INFO] Saved final results to {agency_file}")
+    return df, agency_wordcounts
+
+async def fetch_versions(base_url, cache=None, **client_options):
+    """Get the versions.json listing from the versioner API, through the HTTP cache if given."""
+    async with EcfrClient(base_url, cache=cache, **client_options) as client:
+        body = await client.get("/api/versioner/v1/versions.json")
+    return json.loads(body).get("versions", [])
+
+def refresh(data_dir="data", state_file=None, base_url=BASE_URL, compression="none",
+            engine="iterparse", cache=None, **client_options):
+    """
+    Run one incremental refresh: fetch only titles amended since the last
+    run, recount them, upsert them into the results store under their new
+    date and patch the aggregate outputs. Returns the list of refreshed
+    titles.
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    state_file = state_file or os.path.join(data_dir, "refresh_state.json")
+    state = load_state(state_file)
+
+    latest = latest_title_dates(asyncio.run(fetch_versions(base_url, cache, **client_options)))
+    titles = changed_titles(latest, state)
+    print(f"[INFO] {len(titles)} of {len(latest)} titles changed since the last run: {titles}")
+    if not titles:
+        return []
+
+    fetched = asyncio.run(fetch_changed_titles(latest, titles, data_dir, base_url, compression,
+                                               **client_options))
+    refreshed = [title for title in titles if title in fetched]
+    if not refreshed:
+        return []
+
+    new_rows = []
+    with ResultsStore(os.path.join(data_dir, "results.sqlite")) as store:
+        for title in refreshed:
+            print(f"Processing {os.path.basename(fetched[title])}...")
+            with METRICS.timer("file_parse_seconds", engine=engine):
+                rows = process_xml(fetched[title], engine)
+            # The previous snapshot goes, as its XML and spreadsheet rows do below
+            previous = [(title, state[title])] if state.get(title) and state[title] != latest[title] else []
+            store.upsert_rows(rows, os.path.basename(fetched[title]), replaces=previous)
+            new_rows.extend(rows)
+    # Each title's new rows supersede those of the snapshot it replaces (and
+    # of the new date itself, should an earlier run have recorded it)
+    patch_outputs(new_rows, {title: {state.get(title, ""), latest[title]} - {""} for title in refreshed},
+                  data_dir)
+
+    # Only record titles that made it all the way through, and drop the XML
+    # they replace so a full process_xml run does not count them twice
+    for title in refreshed:
+        if state.get(title):
+            remove_title_xml(data_dir, FetchJob(state[title], title, None))
+        state[title] = latest[title]
+    save_state(state, state_file)
+    return refreshed
+
+def main():
+    parser = argparse.ArgumentParser(description="Refresh word counts for titles amended since the last run.")
+    parser.add_argument("--data-dir", default="data", help="Directory for XML, outputs and state (default: data)")
+    parser.add_argument("--state-file", help="State file of per-title amendment dates "
+                                             "(default: <data-dir>/refresh_state.json)")
+    parser.add_argument("--compression", choices=sorted(COMPRESSION_SUFFIXES), default="none",
+                        help="Store downloaded XML compressed (default: none)")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="iterparse",
+                        help="XML word-count engine (default: iterparse)")
+    parser.add_argument("--base-url", default=BASE_URL,
+                        help=f"eCFR API base URL (default: {BASE_URL}, or $ECFR_BASE_URL)")
+    parser.add_argument("--concurrency", type=int, default=8,
+                        help="Maximum number of requests in flight (default: 8)")
+    add_cache_arguments(parser)
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    with instrumented_run(args, "refresh"):
+        cache = cache_from_args(args, os.path.join(args.data_dir, ".cache", "http"))
+        refreshed = refresh(args.data_dir, args.state_file, args.base_url, compression=args.compression,
+                            engine=args.engine, cache=cache, concurrency=args.concurrency)
+        if cache is not None:
+            cache.report()
+    print(f"[INFO] Refreshed {len(refreshed)} title(s)")
+
+if __name__ == "__main__":
+    main()
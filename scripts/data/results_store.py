@@ -0,0 +1,125 @@
+import os
+import re
+import sqlite3
+from datetime import datetime, timezone
+
+import pandas as pd
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS word_counts (
+    title       TEXT NOT NULL,
+    chapter     TEXT NOT NULL,
+    agency      TEXT NOT NULL,
+    date        TEXT NOT NULL,
+    word_count  INTEGER NOT NULL,
+    source      TEXT,
+    position    INTEGER NOT NULL,
+    updated_at  TEXT NOT NULL,
+    PRIMARY KEY (title, chapter, agency, date)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_word_counts_agency ON word_counts (agency, date);
+CREATE INDEX IF NOT EXISTS idx_word_counts_date ON word_counts (date, title);
+"""
+
+DEFAULT_STORE = os.path.join("data", "results.sqlite")
+
+_DATE_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+def snapshot_date(file_path):
+    """Snapshot date embedded in a filename such as title-1-2023-01-01.xml, or "" if none."""
+    match = _DATE_PATTERN.search(os.path.basename(file_path))
+    return match.group(0) if match else ""
+
+class ResultsStore:
+    """
+    SQLite store of chapter word counts keyed by (title, chapter, agency, date).
+
+    Writing a title's rows for a date replaces everything stored for that
+    (title, date) by an earlier run, so reprocessing a file neither
+    duplicates its counts nor leaves behind chapters that have since
+    disappeared. Per-agency or per-date queries are served from indexes
+    instead of re-reading spreadsheets.
+    """
+
+    def __init__(self, path=DEFAULT_STORE):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        # (title, date) pairs already written through this connection
+        self.written = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def upsert_rows(self, rows, source=None, replaces=()):
+        """
+        Write [title, chapter, agency, word_count, date] rows.
+
+        The stored rows of each (title, date) in the batch are deleted first,
+        in the same transaction, unless this store already wrote that
+        (title, date): rows sharing a key are then summed, within the batch
+        and across the batches of one run (e.g. a title and its
+        chapter-scoped downloads), matching how the spreadsheet outputs
+        total them. Each key keeps the position of its first row so
+        chapter_rows() can return rows in document order. `replaces` lists
+        further (title, date) snapshots the rows supersede, such as the
+        previous date of a refreshed title; they are deleted in the same
+        transaction. Returns the number of keys written.
+        """
+        totals = {}
+        positions = {}
+        for position, (title, chapter, agency, word_count, date) in enumerate(rows):
+            key = (str(title), chapter, agency, date)
+            totals[key] = totals.get(key, 0) + int(word_count)
+            positions.setdefault(key, position)
+
+        replaced = {(key[0], key[3]) for key in totals} - self.written
+        superseded = {(str(title), date) for title, date in replaces} - {(key[0], key[3]) for key in totals}
+        updated_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        with self.conn:
+            self.conn.executemany("DELETE FROM word_counts WHERE title = ? AND date = ?",
+                                  sorted(replaced | superseded))
+            self.conn.executemany(
+                """
+                INSERT INTO word_counts (title, chapter, agency, date, word_count, source, position, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (title, chapter, agency, date) DO UPDATE SET
+                    word_count = word_count + excluded.word_count,
+                    updated_at = excluded.updated_at
+                """,
+                [(*key, word_count, source, positions[key], updated_at)
+                 for key, word_count in totals.items()],
+            )
+        self.written |= replaced
+        return len(totals)
+
+    def chapter_rows(self, date=None):
+        """
+        Chapter rows as a DataFrame with the Title/Chapter/Agency/WordCount/Date
+        columns, ordered by source file and position within it.
+        """
+        query = ("SELECT title AS Title, chapter AS Chapter, agency AS Agency, "
+                 "word_count AS WordCount, date AS Date FROM word_counts")
+        params = ()
+        if date is not None:
+            query += " WHERE date = ?"
+            params = (date,)
+        query += " ORDER BY source, position"
+        return pd.read_sql_query(query, self.conn, params=params)
+
+    def agency_history(self, agency):
+        """Total word count of one agency per snapshot date."""
+        return pd.read_sql_query(
+            "SELECT date, SUM(word_count) AS WordCount FROM word_counts WHERE agency = ? GROUP BY date ORDER BY date",
+            self.conn, params=(agency,))
+
+    def dates(self):
+        """Snapshot dates present in the store."""
+        return [row[0] for row in self.conn.execute("SELECT DISTINCT date FROM word_counts ORDER BY date")]
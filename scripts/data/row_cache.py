@@ -0,0 +1,102 @@
+import os
+import gzip
+import json
+import shutil
+import hashlib
+
+DEFAULT_CACHE_DIR = os.path.join("data", ".cache", "rows")
+
+def file_sha256(path, chunk_size=1 << 20):
+    """SHA-256 of a file's bytes, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class RowCache:
+    """
+    On-disk cache of the rows extracted from each XML file.
+
+    Entries are keyed by the SHA-256 of the file's content plus `version`, a
+    tag for the counting rules, so bumping the version invalidates every
+    entry. To avoid hashing unchanged files on every run, an index remembers
+    each path's size and mtime alongside its hash; the hash is only
+    recomputed when those change. Entries are stored as gzipped JSON.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, version="1"):
+        self.cache_dir = cache_dir
+        self.version = str(version)
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self.stats = {"stat_hits": 0, "hash_hits": 0, "misses": 0, "stores": 0}
+        os.makedirs(cache_dir, exist_ok=True)
+        self.index = self._load_index()
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return {}
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_index(self):
+        """Write the path index atomically."""
+        tmp_path = self.index_path + ".part"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.index, f)
+        os.replace(tmp_path, self.index_path)
+
+    def _entry_path(self, digest):
+        return os.path.join(self.cache_dir, f"{digest}-v{self.version}.json.gz")
+
+    def _digest(self, path):
+        """Content hash of a file, reusing the indexed hash if size and mtime match."""
+        stat = os.stat(path)
+        entry = self.index.get(os.path.abspath(path))
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            return entry["sha256"], True
+        digest = file_sha256(path)
+        self.index[os.path.abspath(path)] = {
+            "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest,
+        }
+        return digest, False
+
+    def get(self, path):
+        """Cached rows for a file, or None if its content has not been seen."""
+        digest, stat_match = self._digest(path)
+        entry_path = self._entry_path(digest)
+        if not os.path.exists(entry_path):
+            self.stats["misses"] += 1
+            return None
+        with gzip.open(entry_path, "rt", encoding="utf-8") as f:
+            rows = json.load(f)
+        self.stats["stat_hits" if stat_match else "hash_hits"] += 1
+        return rows
+
+    def put(self, path, rows):
+        """Store the rows extracted from a file."""
+        digest, _ = self._digest(path)
+        entry_path = self._entry_path(digest)
+        tmp_path = entry_path + ".part"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, entry_path)
+        self.stats["stores"] += 1
+
+    def clear(self):
+        """Remove every cached entry and the path index."""
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.index = {}
+
+    def report(self):
+        """Print cache statistics for this run."""
+        hits = self.stats["stat_hits"] + self.stats["hash_hits"]
+        lookups = hits + self.stats["misses"]
+        rate = hits / lookups * 100 if lookups else 0.0
+        print(f"[INFO] Row cache: {hits}/{lookups} hits ({rate:.0f}%; "
+              f"{self.stats['stat_hits']} by size/mtime, {self.stats['hash_hits']} by content hash), "
+              f"{self.stats['stores']} new entries in {self.cache_dir}")
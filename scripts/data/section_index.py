@@ -0,0 +1,277 @@
+import os
+import hashlib
+import argparse
+import concurrent.futures
+
+import numpy as np
+import pandas as pd
+from lxml import etree
+
+from compression import is_xml_file, open_xml
+from process_xml import title_from_filename
+from results_store import snapshot_date
+
+# DIV1 (title) through DIV9 (appendix), see ECFR-XML-User-Guide.md
+DIV_LEVELS = {f"DIV{level}": level for level in range(1, 10)}
+MAX_LEVEL = 9
+
+DEFAULT_SECTIONS = os.path.join("data", "sections.npz")
+
+def _digest(data):
+    """64-bit content hash as an unsigned integer."""
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little")
+
+def extract_sections(file_path, known_counts=None):
+    """
+    Stream one XML file and record every DIV1-DIV9 element.
+
+    Returns (columns, reused). columns is a dict of equal-length lists:
+    level, type, n, node, head, parent (index of the enclosing DIV in the
+    same lists, -1 at the top), words (the words of the <P> elements whose
+    innermost DIV is this one), text_hash (hash of those paragraphs) and
+    tree_hash (hash of the DIV's heading, paragraphs and child DIVs, so equal
+    tree hashes mean an unchanged subtree). Words are counted exactly as
+    process_xml counts them, so rolling a file up to level 3 reproduces its
+    chapter word counts.
+
+    `known_counts` maps text hashes to word counts, typically from the
+    previous snapshot of the same title; DIVs whose text is unchanged take
+    their count from it instead of being re-tokenized. reused is the
+    number of DIVs counted that way.
+    """
+    columns = {name: [] for name in ("level", "type", "n", "node", "head", "parent",
+                                     "words", "text_hash", "tree_hash")}
+    known_counts = known_counts or {}
+    reused = 0
+    stack = []         # Indices of the open DIVs
+    texts = []         # Paragraph texts of each open DIV
+    children = []      # Tree hashes of each open DIV's finished child DIVs
+    p_depth = 0        # Open <P> elements; their children must survive until the outer P ends
+
+    with open_xml(file_path) as source:
+        context = etree.iterparse(source, events=("start", "end"),
+                                  remove_comments=True, remove_pis=True)
+        for event, elem in context:
+            tag = elem.tag
+            if event == "start":
+                if tag in DIV_LEVELS:
+                    columns["parent"].append(stack[-1] if stack else -1)
+                    stack.append(len(columns["level"]))
+                    texts.append([])
+                    children.append([])
+                    columns["level"].append(DIV_LEVELS[tag])
+                    columns["type"].append(elem.get("TYPE", ""))
+                    columns["n"].append(elem.get("N", ""))
+                    columns["node"].append(elem.get("NODE", ""))
+                    columns["head"].append(None)
+                    columns["words"].append(0)
+                    columns["text_hash"].append(0)
+                    columns["tree_hash"].append(0)
+                elif tag == "P":
+                    p_depth += 1
+                continue
+
+            if tag == "P":
+                if stack:
+                    texts[-1].append("".join(elem.itertext()))
+                p_depth -= 1
+            elif tag == "HEAD":
+                if stack and columns["head"][stack[-1]] is None:
+                    columns["head"][stack[-1]] = "".join(elem.itertext()).strip()
+            elif tag in DIV_LEVELS:
+                index = stack.pop()
+                # Joining on whitespace leaves the token count unchanged
+                text = "\n".join(texts.pop())
+                text_hash = _digest(text.encode("utf-8"))
+                if text_hash in known_counts:
+                    words = known_counts[text_hash]
+                    reused += 1
+                else:
+                    words = len(text.split())
+                label = f"{tag} {columns['type'][index]} {columns['n'][index]} {columns['head'][index] or ''}"
+                tree_hash = _digest(b"".join([label.encode("utf-8"), text_hash.to_bytes(8, "little")]
+                                             + [child.to_bytes(8, "little") for child in children.pop()]))
+                if children:
+                    children[-1].append(tree_hash)
+                columns["words"][index] = words
+                columns["text_hash"][index] = text_hash
+                columns["tree_hash"][index] = tree_hash
+
+            # Free everything already processed, except the subtree of an open P
+            if p_depth == 0:
+                elem.clear()
+                parent = elem.getparent()
+                if parent is not None:
+                    while elem.getprevious() is not None:
+                        del parent[0]
+        del context
+
+    columns["head"] = [head or "" for head in columns["head"]]
+    return columns, reused
+
+def _extract_series(file_paths):
+    """
+    Extract the snapshots of one title in date order, reusing the counts of
+    DIVs whose text is unchanged since the previous snapshot. This is count
+    reuse only: every file is still parsed in full and every DIV's text
+    hashed, since a subtree's hash is only known once it has been read.
+    """
+    extracted = []
+    known_counts = {}
+    for file_path in file_paths:
+        columns, reused = extract_sections(file_path, known_counts)
+        known_counts = dict(zip(columns["text_hash"], columns["words"]))
+        extracted.append((file_path, columns, reused))
+    return extracted
+
+def _encode(values):
+    """Dictionary-encode a string column into (int32 codes, unique values)."""
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object))
+    return codes.astype(np.int32), np.array(uniques, dtype=str)
+
+class SectionIndex:
+    """
+    Columnar table of word counts for every DIV in a set of title files.
+
+    Each row is one DIV. Title, date and TYPE are dictionary-encoded, counts,
+    levels and content hashes are typed arrays, and `ancestors[i, L]` holds the row of the
+    level-L DIV enclosing row i (or i itself at its own level, -1 if none),
+    so totals at any level are a single bincount.
+    """
+
+    def __init__(self, arrays):
+        self.arrays = arrays
+        for name, value in arrays.items():
+            setattr(self, name, value)
+
+    @classmethod
+    def from_files(cls, file_paths, workers=1):
+        # Each title's snapshots are extracted in date order by one worker
+        series = {}
+        for file_path in sorted(file_paths, key=lambda path: (snapshot_date(path), path)):
+            series.setdefault(title_from_filename(file_path), []).append(file_path)
+        if workers > 1:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+                extracted = [item for items in executor.map(_extract_series, series.values()) for item in items]
+        else:
+            extracted = [item for paths in series.values() for item in _extract_series(paths)]
+        extracted.sort(key=lambda item: item[0])
+
+        titles, dates, parents = [], [], []
+        columns = {name: [] for name in ("level", "type", "n", "node", "head", "words", "text_hash", "tree_hash")}
+        total_reused = 0
+        for file_path, sections, reused in extracted:
+            total_reused += reused
+            offset = len(columns["level"])
+            count = len(sections["level"])
+            titles.extend([title_from_filename(file_path)] * count)
+            dates.extend([snapshot_date(file_path)] * count)
+            parents.extend(parent + offset if parent >= 0 else -1 for parent in sections["parent"])
+            for name in columns:
+                columns[name].extend(sections[name])
+        if total_reused:
+            print(f"[INFO] Reused counts of {total_reused} unchanged DIVs from earlier snapshots")
+
+        level = np.array(columns["level"], dtype=np.int8)
+        parent = np.array(parents, dtype=np.int32)
+
+        # Parents always sit at a lower level, so fill ancestors level by level
+        ancestors = np.full((len(level), MAX_LEVEL + 1), -1, dtype=np.int32)
+        for current in range(1, MAX_LEVEL + 1):
+            rows = np.flatnonzero(level == current)
+            has_parent = rows[parent[rows] >= 0]
+            ancestors[has_parent] = ancestors[parent[has_parent]]
+            ancestors[rows, current] = rows
+
+        title_codes, title_values = _encode(titles)
+        date_codes, date_values = _encode(dates)
+        type_codes, type_values = _encode(columns["type"])
+        return cls({
+            "title_code": title_codes, "titles": title_values,
+            "date_code": date_codes, "dates": date_values,
+            "type_code": type_codes, "types": type_values,
+            "level": level,
+            "n": np.array(columns["n"], dtype=str),
+            "node": np.array(columns["node"], dtype=str),
+            "head": np.array(columns["head"], dtype=str),
+            "parent": parent,
+            "words": np.array(columns["words"], dtype=np.int64),
+            "text_hash": np.array(columns["text_hash"], dtype=np.uint64),
+            "tree_hash": np.array(columns["tree_hash"], dtype=np.uint64),
+            "ancestors": ancestors,
+        })
+
+    @classmethod
+    def load(cls, path=DEFAULT_SECTIONS):
+        with np.load(path) as data:
+            return cls({name: data[name] for name in data.files})
+
+    def save(self, path=DEFAULT_SECTIONS):
+        np.savez_compressed(path, **self.arrays)
+
+    def __len__(self):
+        return len(self.level)
+
+    def totals(self, level):
+        """Total words under every row's level-`level` ancestor, as an array over rows."""
+        owners = self.ancestors[:, level]
+        inside = owners >= 0
+        return np.bincount(owners[inside], weights=self.words[inside], minlength=len(self)).astype(np.int64)
+
+    def rollup(self, level, title=None, date=None):
+        """
+        One row per DIV at `level` with the total words of its subtree,
+        optionally restricted to a title and/or snapshot date.
+        """
+        totals = self.totals(level)
+        mask = self.level == level
+        if title is not None:
+            mask &= self.titles[self.title_code] == str(title)
+        if date is not None:
+            mask &= self.dates[self.date_code] == date
+        rows = np.flatnonzero(mask)
+        return pd.DataFrame({
+            "Title": self.titles[self.title_code[rows]],
+            "Date": self.dates[self.date_code[rows]],
+            "Type": self.types[self.type_code[rows]],
+            "N": self.n[rows],
+            "Node": self.node[rows],
+            "Head": self.head[rows],
+            "WordCount": totals[rows],
+        })
+
+def build_section_index(file_paths, path=DEFAULT_SECTIONS, workers=1):
+    """Extract the DIV hierarchy of every file and save it as a compressed .npz table."""
+    index = SectionIndex.from_files(file_paths, workers)
+    index.save(path)
+    print(f"[INFO] Saved {len(index)} DIV rows from {len(file_paths)} files to {path}")
+    return index
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the DIV-level word count index.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build = subparsers.add_parser("build", help="Index every XML file in the data directory")
+    build.add_argument("--data-dir", default="data", help="Directory of title XML files (default: data)")
+    build.add_argument("--output", default=DEFAULT_SECTIONS, help=f"Index file (default: {DEFAULT_SECTIONS})")
+    build.add_argument("--workers", type=int, default=1, help="Worker processes (default: 1)")
+
+    rollup = subparsers.add_parser("rollup", help="Print word counts rolled up to one DIV level")
+    rollup.add_argument("level", type=int, choices=range(1, MAX_LEVEL + 1),
+                        help="DIV level, e.g. 3 for chapters, 5 for parts, 8 for sections")
+    rollup.add_argument("--index", default=DEFAULT_SECTIONS, help=f"Index file (default: {DEFAULT_SECTIONS})")
+    rollup.add_argument("--title", help="Only this title")
+    rollup.add_argument("--date", help="Only this snapshot date")
+    rollup.add_argument("--top", type=int, default=20, help="Rows to print, largest first (default: 20)")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        file_paths = [os.path.join(args.data_dir, filename) for filename in os.listdir(args.data_dir)
+                      if is_xml_file(filename)]
+        build_section_index(file_paths, args.output, args.workers)
+    else:
+        df = SectionIndex.load(args.index).rollup(args.level, args.title, args.date)
+        print(df.nlargest(args.top, "WordCount").to_string(index=False))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+import io
+import os
+import re
+import json
+import mmap
+import argparse
+from collections import namedtuple
+
+import pandas as pd
+
+from process_xml import COLUMNS, fast_rows, iterparse_rows, title_from_filename
+from results_store import snapshot_date
+
+# Files larger than this are split, and shards are packed up to about this size
+DEFAULT_SHARD_BYTES = 16 << 20
+
+# Start and end tags of chapters (DIV3) and parts (DIV5)
+_DIV_TAG = re.compile(rb"<(/?)DIV([35])[\s>]")
+
+# Engines that can count a shard (they read a stream rather than a file)
+SHARD_ENGINES = {
+    "iterparse": iterparse_rows,
+    "fast": fast_rows,
+}
+
+# One chapter's share of a shard: the byte spans to parse, and whether they
+# hold the DIV3 itself (its HEAD) or only DIV5 parts split off from it
+Piece = namedtuple("Piece", ["chapter", "spans", "whole"])
+
+# An independent unit of work: pieces of one file, parsed together
+Shard = namedtuple("Shard", ["file_path", "pieces"])
+
+def scan_chapters(file_path):
+    """
+    Byte offsets of every DIV3 in an uncompressed XML file, found with one
+    regex pass over a memory map instead of parsing.
+
+    Returns (start, end, head_first, parts) per DIV3, where parts are the
+    (start, end) offsets of the DIV5s inside it and head_first says whether
+    a HEAD comes before the first of them.
+    """
+    chapters = []
+    if os.path.getsize(file_path) == 0:
+        return chapters
+    with open(file_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        chapter = part = None
+        for match in _DIV_TAG.finditer(data):
+            closing, level = match.group(1), match.group(2)
+            end = data.find(b">", match.start()) + 1
+            if level == b"3":
+                if not closing:
+                    chapter = (match.start(), [])
+                elif chapter is not None:
+                    start, parts = chapter
+                    head_first = data.find(b"<HEAD", start, parts[0][0] if parts else end) != -1
+                    chapters.append((start, end, head_first, parts))
+                    chapter = None
+            elif chapter is not None:
+                if not closing:
+                    part = match.start()
+                elif part is not None:
+                    chapter[1].append((part, end))
+                    part = None
+    return chapters
+
+def plan_shards(file_path, shard_bytes=DEFAULT_SHARD_BYTES):
+    """
+    Split a large title file into shards of about `shard_bytes`.
+
+    Consecutive chapters are packed into a shard together. A chapter larger
+    than `shard_bytes` is split further at its DIV5 boundaries: the parts go
+    to pieces of their own and the chapter's remaining text (its HEAD,
+    subchapter headings and anything outside the parts) stays in a piece
+    with the parts cut out. Every piece is well-formed XML on its own.
+    Returns [] for files too small to split and for compressed files,
+    which cannot be read at an offset.
+    """
+    if not file_path.endswith(".xml") or os.path.getsize(file_path) <= shard_bytes:
+        return []
+
+    pieces = []
+    for ordinal, (start, end, head_first, parts) in enumerate(scan_chapters(file_path)):
+        if end - start <= shard_bytes or not parts or not head_first:
+            pieces.append(Piece(ordinal, [(start, end)], True))
+            continue
+        spans, position = [], start
+        for part_start, part_end in parts:
+            spans.append((position, part_start))
+            position = part_end
+        spans.append((position, end))
+        pieces.append(Piece(ordinal, spans, True))
+        group = []
+        for part in parts:
+            if group and part[1] - group[0][0] > shard_bytes:
+                pieces.append(Piece(ordinal, group, False))
+                group = []
+            group.append(part)
+        pieces.append(Piece(ordinal, group, False))
+
+    shards, current, size = [], [], 0
+    for piece in pieces:
+        piece_size = sum(end - start for start, end in piece.spans)
+        if current and size + piece_size > shard_bytes:
+            shards.append(Shard(file_path, current))
+            current, size = [], 0
+        current.append(piece)
+        size += piece_size
+    if current:
+        shards.append(Shard(file_path, current))
+    return shards
+
+def process_shard(shard, engine="iterparse"):
+    """
+    Count the words in one shard with the same rules as process_xml.
+
+    The pieces are read by offset and parsed as one document, DIV5 parts
+    wrapped in a bare DIV3 so the engine counts them. Returns
+    (chapter, whole, Chapter, Agency, WordCount) per piece for
+    merge_shard_rows.
+    """
+    document = [b"<SHARD>"]
+    with open(shard.file_path, "rb") as f:
+        for piece in shard.pieces:
+            if not piece.whole:
+                document.append(b"<DIV3>")
+            for start, end in piece.spans:
+                f.seek(start)
+                document.append(f.read(end - start))
+            if not piece.whole:
+                document.append(b"</DIV3>")
+    document.append(b"</SHARD>")
+
+    rows = SHARD_ENGINES[engine](io.BytesIO(b"".join(document)), "", "")
+    if len(rows) != len(shard.pieces):
+        raise ValueError(f"{shard.file_path}: {len(rows)} chapters counted in a shard of {len(shard.pieces)} pieces")
+    return [(piece.chapter, piece.whole, row[1], row[2], row[3]) for piece, row in zip(shard.pieces, rows)]
+
+def merge_shard_rows(file_path, shard_results):
+    """
+    Merge the results of every shard of a file into its chapter rows, in
+    file order, exactly as process_xml would return them.
+    """
+    chapters = {}
+    for chapter, whole, chapter_name, agency, word_count in (row for rows in shard_results for row in rows):
+        entry = chapters.setdefault(chapter, ["", "", 0])
+        if whole:
+            entry[0], entry[1] = chapter_name, agency
+        entry[2] += word_count
+    title_number, date = title_from_filename(file_path), snapshot_date(file_path)
+    return [[title_number, chapter_name, agency, word_count, date]
+            for _, (chapter_name, agency, word_count) in sorted(chapters.items())]
+
+def save_plan(shards, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump([shard._asdict() for shard in shards], f)
+
+def load_plan(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [Shard(shard["file_path"], [Piece(chapter, [tuple(span) for span in spans], whole)
+                                           for chapter, spans, whole in shard["pieces"]])
+                for shard in json.load(f)]
+
+def main():
+    parser = argparse.ArgumentParser(description="Split large title XML files into shards parsed independently.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    plan = subparsers.add_parser("plan", help="Scan files and write a shard plan")
+    plan.add_argument("files", nargs="+", help="Uncompressed title XML files")
+    plan.add_argument("--shard-mb", type=float, default=DEFAULT_SHARD_BYTES >> 20,
+                      help=f"Target shard size in MB (default: {DEFAULT_SHARD_BYTES >> 20})")
+    plan.add_argument("--output", default="shard_plan.json", help="Plan to write (default: shard_plan.json)")
+
+    run = subparsers.add_parser("run", help="Count one shard of a plan, e.g. on another machine")
+    run.add_argument("plan", help="Plan written by the plan command")
+    run.add_argument("shard", type=int, help="Index of the shard in the plan")
+    run.add_argument("--engine", choices=sorted(SHARD_ENGINES), default="iterparse",
+                     help="XML word-count engine (default: iterparse)")
+    run.add_argument("--output", help="Result to write (default: shard-<index>.json)")
+
+    merge = subparsers.add_parser("merge", help="Merge shard results into chapter rows")
+    merge.add_argument("results", nargs="+", help="Results written by the run command")
+    merge.add_argument("--output", default="output_chapter.xlsx", help="Rows to write, .xlsx or .csv")
+    args = parser.parse_args()
+
+    if args.command == "plan":
+        shards = [shard for file_path in args.files for shard in plan_shards(file_path, int(args.shard_mb * (1 << 20)))]
+        save_plan(shards, args.output)
+        print(f"[INFO] Saved {len(shards)} shards of {len(args.files)} files to {args.output}")
+    elif args.command == "run":
+        shards = load_plan(args.plan)
+        shard = shards[args.shard]
+        output = args.output or f"shard-{args.shard}.json"
+        expected = sum(other.file_path == shard.file_path for other in shards)
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump({"file_path": shard.file_path, "shard": args.shard, "shards_of_file": expected,
+                       "rows": process_shard(shard, args.engine)}, f)
+        print(f"[INFO] Counted {len(shard.pieces)} pieces of {os.path.basename(shard.file_path)} into {output}")
+    else:
+        by_file, seen, expected = {}, {}, {}
+        for path in args.results:
+            with open(path, "r", encoding="utf-8") as f:
+                result = json.load(f)
+            by_file.setdefault(result["file_path"], []).append(result["rows"])
+            seen.setdefault(result["file_path"], set()).add(result["shard"])
+            expected[result["file_path"]] = result["shards_of_file"]
+        incomplete = [file_path for file_path in by_file if len(seen[file_path]) != expected[file_path]]
+        if incomplete:
+            for file_path in incomplete:
+                print(f"[ERROR] {file_path}: {len(seen[file_path])} of {expected[file_path]} shard results")
+            raise SystemExit(1)
+        rows = [row for file_path in sorted(by_file) for row in merge_shard_rows(file_path, by_file[file_path])]
+        df = pd.DataFrame(rows, columns=COLUMNS)
+        if args.output.endswith(".xlsx"):
+            df.to_excel(args.output, index=False)
+        else:
+            df.to_csv(args.output, index=False)
+        print(f"[INFO] Saved {len(df)} chapter rows from {len(by_file)} files to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,375 @@
+import os
+import re
+import time
+import argparse
+import concurrent.futures
+from array import array
+
+import numpy as np
+import pandas as pd
+from lxml import etree
+
+from agency_lookup import AGENCIES_FILE, load_agency_lookup
+from compression import is_xml_file, open_xml
+from process_xml import split_agency_head, title_from_filename
+from results_store import snapshot_date
+
+DEFAULT_TEXT_INDEX = os.path.join("data", "text_index.npz")
+
+# Terms are lowercase runs of word characters: letters, digits and underscores
+TOKEN = re.compile(r"\w+")
+
+# DIVs whose N identifies a document: chapter, part and section
+DOC_LEVELS = {"DIV3": "chapter", "DIV5": "part", "DIV8": "section"}
+
+# Columns of a document, besides the title and date taken from the filename
+DOC_FIELDS = ("chapter", "part", "section", "agency", "words")
+
+# Fields a frequency query can group by
+GROUP_FIELDS = ("agency", "title", "chapter", "part", "section", "date")
+
+def tokenize(text):
+    return TOKEN.findall(text.lower())
+
+def _uint32(values):
+    """An array("I") buffer as a uint32 array, without copying it."""
+    return np.frombuffer(values, dtype=np.uint32) if len(values) else np.zeros(0, dtype=np.uint32)
+
+def extract_text(file_path):
+    """
+    Stream one XML file, counting words exactly as process_xml does and
+    collecting the terms of every paragraph in the same pass.
+
+    Paragraphs are grouped into documents keyed by their enclosing chapter
+    (DIV3), part (DIV5) and section (DIV8) numbers. Returns (rows, docs,
+    terms, term_ids, doc_ids, positions): the process_xml rows, a dict of
+    document columns (DOC_FIELDS), the distinct terms and one entry per
+    token occurrence. Positions run on within a document, with a gap
+    between paragraphs so phrases never match across two of them.
+    Occurrences are appended to 4-byte array("I") buffers rather than
+    lists, so memory grows by 12 bytes per token instead of a few boxed
+    ints.
+    """
+    title_number = title_from_filename(file_path)
+    date = snapshot_date(file_path)
+
+    rows = []
+    docs = {field: [] for field in DOC_FIELDS}
+    doc_chapter = []   # Row of each document's chapter, for its agency
+    doc_keys = {}
+    vocabulary = {}
+    term_ids, doc_ids, positions = array("I"), array("I"), array("I")
+    next_position = []
+
+    head = None        # HEAD text of the current DIV3 (None until seen)
+    word_count = 0
+    in_div3 = False
+    p_depth = 0        # Open <P> elements; their children must survive until the outer P ends
+    keys = {"chapter": "", "part": "", "section": ""}
+
+    with open_xml(file_path) as source:
+        context = etree.iterparse(source, events=("start", "end"),
+                                  remove_comments=True, remove_pis=True)
+        for event, elem in context:
+            tag = elem.tag
+            if event == "start":
+                if tag in DOC_LEVELS:
+                    keys[DOC_LEVELS[tag]] = elem.get("N", "")
+                    if tag == "DIV3":
+                        in_div3 = True
+                        head = None
+                        word_count = 0
+                        keys["part"] = keys["section"] = ""
+                    elif tag == "DIV5":
+                        keys["section"] = ""
+                elif tag == "P":
+                    p_depth += 1
+                continue
+
+            if tag in DOC_LEVELS:
+                # Text after a DIV closes belongs to its parent, not to it
+                keys["section"] = ""
+                if tag != "DIV8":
+                    keys["part"] = ""
+            if tag == "P":
+                if in_div3:
+                    text = "".join(elem.itertext())
+                    word_count += len(text.split())
+                    if p_depth == 1:
+                        key = (keys["chapter"], keys["part"], keys["section"])
+                        if key not in doc_keys:
+                            doc_keys[key] = len(doc_keys)
+                            for field, value in zip(("chapter", "part", "section"), key):
+                                docs[field].append(value)
+                            docs["words"].append(0)
+                            doc_chapter.append(len(rows))
+                            next_position.append(0)
+                        doc = doc_keys[key]
+                        tokens = tokenize(text)
+                        docs["words"][doc] += len(text.split())
+                        start = next_position[doc]
+                        term_ids.extend(vocabulary.setdefault(token, len(vocabulary)) for token in tokens)
+                        doc_ids.extend(array("I", [doc]) * len(tokens))
+                        positions.extend(range(start, start + len(tokens)))
+                        next_position[doc] = start + len(tokens) + 1
+                p_depth -= 1
+            elif in_div3:
+                if tag == "HEAD" and head is None:
+                    head = "".join(elem.itertext()).strip()
+                elif tag == "DIV3":
+                    agency_text = head if head is not None else "No HEAD"
+                    chapter, agency = split_agency_head(agency_text)
+                    rows.append([title_number, chapter, agency, word_count, date])
+                    in_div3 = False
+
+            # Free everything already processed, except the subtree of an open P
+            if p_depth == 0:
+                elem.clear()
+                parent = elem.getparent()
+                if parent is not None:
+                    while elem.getprevious() is not None:
+                        del parent[0]
+        del context
+
+    docs["agency"] = [rows[row][2] if row < len(rows) else "" for row in doc_chapter]
+    return rows, docs, list(vocabulary), _uint32(term_ids), _uint32(doc_ids), _uint32(positions)
+
+def _timed_extract_text(file_path):
+    start, start_cpu = time.perf_counter(), time.process_time()
+    extracted = extract_text(file_path)
+    return extracted, (time.perf_counter() - start, time.process_time() - start_cpu)
+
+def _encode(values):
+    """Dictionary-encode a string column into (int32 codes, unique values)."""
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object))
+    return codes.astype(np.int32), np.array(uniques, dtype=str)
+
+class TextIndex:
+    """
+    Positional inverted index over the paragraph text of a set of title files.
+
+    Documents are (title, chapter, part, section, date) slices of text with
+    their agency and word count. For each term, kept in sorted `terms`,
+    `term_offsets` points at its postings: document ids in increasing order
+    with the term's frequency in each, and per posting a run of token
+    positions stored as gaps. Everything lives in typed arrays saved with
+    np.savez_compressed, so a query is a binary search and a few slices.
+    """
+
+    def __init__(self, arrays):
+        self.arrays = arrays
+        for name, value in arrays.items():
+            setattr(self, name, value)
+
+    @classmethod
+    def from_extracted(cls, extracted):
+        """Build the index from (file_path, extract_text result) pairs."""
+        titles, dates = [], []
+        docs = {field: [] for field in DOC_FIELDS}
+        vocabulary = {}
+        term_ids, doc_ids, positions = [], [], []
+        for file_path, (_, file_docs, terms, file_terms, file_doc_ids, file_positions) in extracted:
+            offset = len(docs["words"])
+            count = len(file_docs["words"])
+            titles.extend([title_from_filename(file_path)] * count)
+            dates.extend([snapshot_date(file_path)] * count)
+            for field in DOC_FIELDS:
+                docs[field].extend(file_docs[field])
+            # Map this file's term ids onto the shared vocabulary
+            remap = np.array([vocabulary.setdefault(term, len(vocabulary)) for term in terms], dtype=np.uint32)
+            term_ids.append(remap[file_terms] if len(terms) else file_terms)
+            doc_ids.append(file_doc_ids + np.uint32(offset))
+            positions.append(file_positions)
+
+        # Renumber terms in sorted order so lookups are a binary search
+        vocabulary = np.array(list(vocabulary), dtype=str)
+        order = np.argsort(vocabulary, kind="stable")
+        rank = np.empty(len(order), dtype=np.uint32)
+        rank[order] = np.arange(len(order), dtype=np.uint32)
+        term_ids = rank[np.concatenate(term_ids)] if term_ids else np.zeros(0, dtype=np.uint32)
+        doc_ids = np.concatenate(doc_ids) if doc_ids else np.zeros(0, dtype=np.uint32)
+        positions = np.concatenate(positions) if positions else np.zeros(0, dtype=np.uint32)
+
+        # Sort occurrences by (term, document, position) and cut into postings
+        sort = np.lexsort((positions, doc_ids, term_ids))
+        term_ids, doc_ids, positions = term_ids[sort], doc_ids[sort], positions[sort]
+        new_posting = np.ones(len(term_ids), dtype=bool)
+        new_posting[1:] = (term_ids[1:] != term_ids[:-1]) | (doc_ids[1:] != doc_ids[:-1])
+        posting_starts = np.flatnonzero(new_posting)
+        posting_offsets = np.append(posting_starts, len(term_ids)).astype(np.int64)
+        gaps = positions.copy()
+        gaps[1:] -= positions[:-1]
+        gaps[posting_starts] = positions[posting_starts]
+
+        posting_terms = term_ids[posting_starts]
+        term_offsets = np.searchsorted(posting_terms, np.arange(len(vocabulary) + 1)).astype(np.int64)
+        title_codes, title_values = _encode(titles)
+        date_codes, date_values = _encode(dates)
+        agency_codes, agency_values = _encode(docs["agency"])
+        return cls({
+            "terms": vocabulary[order],
+            "term_offsets": term_offsets,
+            "posting_docs": doc_ids[posting_starts],
+            "posting_counts": np.diff(posting_offsets).astype(np.uint32),
+            "position_offsets": posting_offsets,
+            "position_gaps": gaps,
+            "title_code": title_codes, "titles": title_values,
+            "date_code": date_codes, "dates": date_values,
+            "agency_code": agency_codes, "agencies": agency_values,
+            "chapter": np.array(docs["chapter"], dtype=str),
+            "part": np.array(docs["part"], dtype=str),
+            "section": np.array(docs["section"], dtype=str),
+            "words": np.array(docs["words"], dtype=np.int64),
+        })
+
+    @classmethod
+    def load(cls, path=DEFAULT_TEXT_INDEX):
+        with np.load(path) as data:
+            return cls({name: data[name] for name in data.files})
+
+    def save(self, path=DEFAULT_TEXT_INDEX):
+        np.savez_compressed(path, **self.arrays)
+
+    def __len__(self):
+        return len(self.words)
+
+    def _postings(self, term):
+        """(first, last) posting numbers of a term; empty if it is not indexed."""
+        i = np.searchsorted(self.terms, term)
+        if i == len(self.terms) or self.terms[i] != term:
+            return 0, 0
+        return self.term_offsets[i], self.term_offsets[i + 1]
+
+    def _positions(self, posting):
+        start, end = self.position_offsets[posting], self.position_offsets[posting + 1]
+        return np.cumsum(self.position_gaps[start:end], dtype=np.int64)
+
+    def term_counts(self, term):
+        """(document ids, occurrences) of one term."""
+        first, last = self._postings(tokenize(term)[0] if tokenize(term) else "")
+        return self.posting_docs[first:last].astype(np.int64), self.posting_counts[first:last].astype(np.int64)
+
+    def phrase_counts(self, phrase):
+        """
+        (document ids, occurrences) of a phrase: its terms at consecutive
+        positions. Documents are narrowed to those holding every term before
+        any positions are decoded.
+        """
+        tokens = tokenize(phrase)
+        if len(tokens) <= 1:
+            return self.term_counts(phrase)
+        ranges = [self._postings(token) for token in tokens]
+        docs = self.posting_docs[ranges[0][0]:ranges[0][1]]
+        for first, last in ranges[1:]:
+            docs = np.intersect1d(docs, self.posting_docs[first:last], assume_unique=True)
+        counts = np.zeros(len(docs), dtype=np.int64)
+        for k, doc in enumerate(docs):
+            starts = None
+            for offset, (first, last) in enumerate(ranges):
+                posting = first + np.searchsorted(self.posting_docs[first:last], doc)
+                found = self._positions(posting) - offset
+                starts = found if starts is None else np.intersect1d(starts, found, assume_unique=True)
+                if not len(starts):
+                    break
+            counts[k] = len(starts)
+        keep = counts > 0
+        return docs[keep].astype(np.int64), counts[keep]
+
+    def documents(self, docs, counts):
+        """Document rows for query results, most occurrences first."""
+        df = pd.DataFrame({
+            "Title": self.titles[self.title_code[docs]],
+            "Chapter": self.chapter[docs],
+            "Part": self.part[docs],
+            "Section": self.section[docs],
+            "Date": self.dates[self.date_code[docs]],
+            "Agency": self.agencies[self.agency_code[docs]],
+            "Count": counts,
+            "Words": self.words[docs],
+        })
+        return df.sort_values("Count", ascending=False, kind="stable").reset_index(drop=True)
+
+    def search(self, query):
+        """Documents mentioning a term or phrase, most occurrences first."""
+        docs, counts = self.phrase_counts(query)
+        return self.documents(docs, counts)
+
+    def frequency(self, query, by="agency", lookup=None):
+        """
+        Occurrences of a term or phrase grouped by `by` (one of
+        GROUP_FIELDS), with the number of matching documents and the
+        occurrences per 10,000 words of the group's text. With `lookup` (an
+        AgencyLookup) agencies come from cfr_references, as in agency_totals.
+        """
+        docs, counts = self.phrase_counts(query)
+        column = by.capitalize()
+        all_docs = self.documents(np.arange(len(self)), np.zeros(len(self), dtype=np.int64))
+        matches = self.documents(docs, counts)
+        if lookup is not None and by == "agency":
+            all_docs = lookup.attribute(all_docs)
+            matches = lookup.attribute(matches)
+        words = all_docs.groupby(column)["Words"].sum()
+        result = matches.groupby(column).agg(Count=("Count", "sum"), Documents=("Count", "size"))
+        result["PerTenThousandWords"] = result["Count"] / words.reindex(result.index).clip(lower=1) * 10_000
+        return result.sort_values("Count", ascending=False).reset_index()
+
+def build_text_index(file_paths, path=DEFAULT_TEXT_INDEX, workers=1):
+    """
+    Count words and index the text of every file in one pass, save the
+    index, and return (results, timings) like process_xml.process_files.
+    """
+    file_paths = sorted(file_paths)
+    timings = {}
+    extracted = {}
+    if workers > 1:
+        largest_first = sorted(file_paths, key=os.path.getsize, reverse=True)
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            for file_path, (result, timing) in zip(largest_first, executor.map(_timed_extract_text, largest_first)):
+                extracted[file_path], timings[file_path] = result, timing
+    else:
+        for file_path in file_paths:
+            print(f"Indexing {os.path.basename(file_path)}...")
+            extracted[file_path], timings[file_path] = _timed_extract_text(file_path)
+
+    index = TextIndex.from_extracted([(file_path, extracted[file_path]) for file_path in file_paths])
+    index.save(path)
+    print(f"[INFO] Saved {len(index.terms)} terms in {len(index)} documents from {len(file_paths)} files to {path}")
+    return {file_path: extracted[file_path][0] for file_path in file_paths}, timings
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the full-text index of regulation text.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build = subparsers.add_parser("build", help="Index every XML file in the data directory")
+    build.add_argument("--data-dir", default="data", help="Directory of title XML files (default: data)")
+    build.add_argument("--output", default=DEFAULT_TEXT_INDEX, help=f"Index file (default: {DEFAULT_TEXT_INDEX})")
+    build.add_argument("--workers", type=int, default=1, help="Worker processes (default: 1)")
+
+    search = subparsers.add_parser("search", help="Documents mentioning a term or phrase")
+    frequency = subparsers.add_parser("frequency", help="Occurrences of a term or phrase per agency, title, ...")
+    frequency.add_argument("--by", choices=GROUP_FIELDS, default="agency", help="Grouping (default: agency)")
+    frequency.add_argument("--agencies", default=AGENCIES_FILE,
+                           help=f"agencies.json used to attribute chapters (default: {AGENCIES_FILE})")
+    for query in (search, frequency):
+        query.add_argument("query", help="A term, or a phrase in quotes")
+        query.add_argument("--index", default=DEFAULT_TEXT_INDEX, help=f"Index file (default: {DEFAULT_TEXT_INDEX})")
+        query.add_argument("--top", type=int, default=20, help="Rows to print (default: 20)")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        file_paths = [os.path.join(args.data_dir, filename) for filename in os.listdir(args.data_dir)
+                      if is_xml_file(filename)]
+        build_text_index(file_paths, args.output, args.workers)
+        return
+
+    index = TextIndex.load(args.index)
+    start = time.perf_counter()
+    if args.command == "search":
+        result = index.search(args.query)
+    else:
+        result = index.frequency(args.query, args.by, load_agency_lookup(args.agencies) if args.by == "agency" else None)
+    print(f"[INFO] {len(result)} rows in {(time.perf_counter() - start) * 1000:.1f}ms")
+    print(result.head(args.top).to_string(index=False))
+
+if __name__ == "__main__":
+    main()
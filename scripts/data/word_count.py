@@ -0,0 +1,76 @@
+import numpy as np
+
+# Characters str.split() splits on. None lie above U+3000.
+WHITESPACE = [chr(code) for code in range(0x3001) if chr(code).isspace()]
+
+# Whitespace bytes (single-byte characters), as a lookup table over byte values
+_SPACE_TABLE = np.zeros(256, dtype=bool)
+_SPACE_TABLE[[ord(char) for char in WHITESPACE if ord(char) < 0x80]] = True
+
+# UTF-8 encodings of the multi-byte whitespace characters, and their lead bytes
+_MULTIBYTE_SPACES = [char.encode("utf-8") for char in WHITESPACE if ord(char) >= 0x80]
+_LEAD_TABLE = np.zeros(256, dtype=bool)
+_LEAD_TABLE[[sequence[0] for sequence in _MULTIBYTE_SPACES]] = True
+
+# Bytes of text collected before WordCounter counts them
+DEFAULT_BATCH_SIZE = 1 << 22
+
+def count_words(text):
+    """Reference word count: the number of tokens str.split() would return."""
+    return len(text.split())
+
+def count_words_utf8(data):
+    """
+    Count the words in UTF-8 encoded bytes without building any tokens.
+
+    Gives exactly len(data.decode("utf-8").split()): every byte is classified
+    as whitespace or not with a lookup table (multi-byte whitespace such as
+    U+00A0 is marked byte by byte), and words are counted as the positions
+    where whitespace is followed by anything else.
+    """
+    codes = np.frombuffer(data, dtype=np.uint8)
+    if not len(codes):
+        return 0
+    space = _SPACE_TABLE[codes]
+    if not data.isascii():
+        leads = np.flatnonzero(_LEAD_TABLE[codes])
+        for sequence in _MULTIBYTE_SPACES:
+            at = leads[codes[leads] == sequence[0]]
+            at = at[at + len(sequence) <= len(codes)]
+            for offset in range(1, len(sequence)):
+                at = at[codes[at + offset] == sequence[offset]]
+            for offset in range(len(sequence)):
+                space[at + offset] = True
+    return int(np.count_nonzero(space[:-1] & ~space[1:])) + (not space[0])
+
+class WordCounter:
+    """
+    Collect UTF-8 text buffers and count their words in batches.
+
+    Buffers are joined with newlines, so words never run across two of them,
+    and counted with count_words_utf8 once `batch_size` bytes have built up.
+    """
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.parts = []
+        self.size = 0
+        self.words = 0
+
+    def add(self, data):
+        self.parts.append(data)
+        self.size += len(data)
+        if self.size >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.parts:
+            self.words += count_words_utf8(b"\n".join(self.parts))
+            self.parts = []
+            self.size = 0
+
+    def take(self):
+        """Return the words counted so far and start again from zero."""
+        self.flush()
+        words, self.words = self.words, 0
+        return words
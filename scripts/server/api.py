@@ -0,0 +1,224 @@
+import os
+import re
+import sys
+import asyncio
+import hashlib
+import argparse
+from datetime import datetime
+from functools import lru_cache
+from email.utils import formatdate, parsedate_to_datetime
+
+import uvicorn
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse
+from fastapi.staticfiles import StaticFiles
+
+# Get the project root directory (two levels up from this script)
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "scripts", "data"))
+
+from agency_lookup import load_agency_lookup
+from div_index import DivIndex
+from process_xml import agency_totals
+from results_store import ResultsStore
+
+PORT = 8000
+STORE_PATH = os.environ.get("ECFR_STORE", os.path.join(PROJECT_ROOT, "data", "results.sqlite"))
+AGENCIES_PATH = os.environ.get("ECFR_AGENCIES", os.path.join(PROJECT_ROOT, "data", "agencies.json"))
+DATA_DIR = os.environ.get("ECFR_DATA_DIR", os.path.join(PROJECT_ROOT, "data"))
+STATIC_DIR = os.path.join(PROJECT_ROOT, "docs")
+MAX_PAGE_SIZE = 1000
+
+# Full-title snapshots as saved by the downloaders; chapter-scoped downloads
+# (title-N-chapter-X-DATE.xml) do not match
+_TITLE_FILE = re.compile(r"^title-(?P<title>[^-]+)-(?P<date>\d{4}-\d{2}-\d{2})\.xml$")
+
+app = FastAPI(title="eCFR word count API")
+
+def store_version(path=None):
+    """
+    Version of the results store: the newest mtime and total size of the
+    database and its WAL file. Changes whenever the processing step writes.
+    """
+    path = path or STORE_PATH
+    mtime_ns, size = 0, 0
+    for candidate in (path, path + "-wal"):
+        if os.path.exists(candidate):
+            stat = os.stat(candidate)
+            mtime_ns = max(mtime_ns, stat.st_mtime_ns)
+            size += stat.st_size
+    return mtime_ns, size
+
+def agencies_version(path=None):
+    """mtime of agencies.json, or 0 without one. Changes whenever the downloaders save it."""
+    path = path or AGENCIES_PATH
+    return os.stat(path).st_mtime_ns if os.path.exists(path) else 0
+
+@lru_cache(maxsize=4)
+def agency_lookup(mtime_ns):
+    """
+    Exact chapter -> agency attribution from agencies.json as of mtime_ns
+    (None without one), reloaded when the file changes.
+    """
+    return load_agency_lookup(AGENCIES_PATH)
+
+@lru_cache(maxsize=256)
+def compute_aggregate(kind, version, agencies=0, date=None, title=None, agency=None):
+    """
+    Compute one aggregate from the results store. Cached per store version
+    and agencies.json version, so entries for older versions simply age
+    out of the LRU. Without a date, agencies, titles and chapters describe
+    the latest snapshot in the store rather than summing every year.
+    """
+    with ResultsStore(STORE_PATH) as store:
+        if kind == "years":
+            query = "SELECT date, SUM(word_count) AS WordCount FROM word_counts"
+            params = ()
+            if agency is not None:
+                query += " WHERE agency = ?"
+                params = (agency,)
+            rows = store.conn.execute(query + " GROUP BY date ORDER BY date", params).fetchall()
+            return tuple({"date": row[0], "wordCount": row[1]} for row in rows)
+
+        if date is None:
+            date = (store.dates() or [None])[-1]
+        df = store.chapter_rows(date)
+
+    if kind == "agencies":
+        totals = agency_totals(df, agency_lookup(agencies)).sort_values("WordCount", ascending=False)
+        return tuple({"agency": row.Agency, "wordCount": int(row.WordCount)}
+                     for row in totals.itertuples())
+    if kind == "titles":
+        totals = df.groupby("Title", sort=False)["WordCount"].sum()
+        return tuple({"title": title, "wordCount": int(count)} for title, count in totals.items())
+    if kind == "chapters":
+        if title is not None:
+            df = df[df["Title"] == title]
+        return tuple({"title": row.Title, "chapter": row.Chapter, "agency": row.Agency,
+                      "date": row.Date, "wordCount": int(row.WordCount)} for row in df.itertuples())
+    raise ValueError(f"Unknown aggregate: {kind}")
+
+def title_file(title, date=None):
+    """
+    The downloaded full-title XML of a title on a snapshot date, or its
+    latest snapshot by date; None if there is none.
+    """
+    snapshots = {}
+    for filename in os.listdir(DATA_DIR) if os.path.isdir(DATA_DIR) else []:
+        match = _TITLE_FILE.match(filename)
+        if not match or match.group("title") != str(title) or date and match.group("date") != date:
+            continue
+        try:
+            snapshots[datetime.strptime(match.group("date"), "%Y-%m-%d")] = filename
+        except ValueError:
+            continue
+    return os.path.join(DATA_DIR, snapshots[max(snapshots)]) if snapshots else None
+
+@lru_cache(maxsize=64)
+def div_index(file_path, size, mtime_ns):
+    """
+    The DIV offset index of a title file, kept in memory per file version.
+    Only the first request for a new file scans it (or loads its sidecar).
+    """
+    return DivIndex.for_file(file_path)
+
+def find_section(title, level, n, date=None, node=None, text=False):
+    file_path = title_file(title, date)
+    if file_path is None:
+        raise HTTPException(status_code=404, detail=f"No XML for title {title}" + (f" on {date}" if date else ""))
+    stat = os.stat(file_path)
+    index = div_index(file_path, stat.st_size, stat.st_mtime_ns)
+    return os.path.basename(file_path), [index.describe(i, text) for i in index.find(level, n, node=node)]
+
+async def cached_response(request, kind, limit, offset, **params):
+    """
+    Serve a paginated aggregate with ETag/Last-Modified validators.
+
+    Clients revalidating with If-None-Match or If-Modified-Since get a 304
+    without the aggregate being computed at all.
+    """
+    version = store_version()
+    if version == (0, 0):
+        return JSONResponse({"detail": f"Results store not found: {STORE_PATH}"}, status_code=503)
+    agencies = agencies_version()
+    modified_ns = max(version[0], agencies)
+
+    tag = hashlib.sha1(repr((version, agencies, kind, sorted(params.items()), limit, offset)).encode()).hexdigest()
+    etag = f'W/"{tag}"'
+    last_modified = formatdate(modified_ns / 1e9, usegmt=True)
+    headers = {"ETag": etag, "Last-Modified": last_modified, "Cache-Control": "no-cache"}
+
+    if_none_match = request.headers.get("if-none-match")
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_none_match is not None:
+        if etag in [value.strip() for value in if_none_match.split(",")] or if_none_match.strip() == "*":
+            return Response(status_code=304, headers=headers)
+    elif if_modified_since is not None:
+        try:
+            if int(modified_ns / 1e9) <= parsedate_to_datetime(if_modified_since).timestamp():
+                return Response(status_code=304, headers=headers)
+        except (TypeError, ValueError):
+            pass
+
+    items = await asyncio.to_thread(compute_aggregate, kind, version, agencies, **params)
+    body = {
+        "total": len(items),
+        "limit": limit,
+        "offset": offset,
+        "items": list(items[offset:offset + limit]),
+    }
+    return JSONResponse(body, headers=headers)
+
+@app.get("/api/agencies")
+async def agencies(request: Request, date: str = None,
+                   limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE), offset: int = Query(0, ge=0)):
+    """Agency word count totals, largest first."""
+    return await cached_response(request, "agencies", limit, offset, date=date)
+
+@app.get("/api/titles")
+async def titles(request: Request, date: str = None,
+                 limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE), offset: int = Query(0, ge=0)):
+    """Word count totals per title."""
+    return await cached_response(request, "titles", limit, offset, date=date)
+
+@app.get("/api/chapters")
+async def chapters(request: Request, title: str = None, date: str = None,
+                   limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE), offset: int = Query(0, ge=0)):
+    """Chapter-level word counts, optionally for a single title."""
+    return await cached_response(request, "chapters", limit, offset, date=date, title=title)
+
+@app.get("/api/years")
+async def years(request: Request, agency: str = None,
+                limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE), offset: int = Query(0, ge=0)):
+    """Word count totals per snapshot date, overall or for one agency."""
+    return await cached_response(request, "years", limit, offset, agency=agency)
+
+@app.get("/api/section")
+async def section(title: str, n: str, level: int = Query(8, ge=1, le=9), date: str = None,
+                  node: str = None, text: bool = False):
+    """
+    One DIV of a title (a section by default, level 5 for a part, 3 for a
+    chapter) read straight from its byte range in the downloaded XML, with
+    its word count and optionally its paragraph text.
+    """
+    file_name, items = await asyncio.to_thread(find_section, title, level, n, date, node, text)
+    if not items:
+        raise HTTPException(status_code=404, detail=f"No DIV{level} N={n!r} in {file_name}")
+    return {"file": file_name, "total": len(items), "items": items}
+
+# Serve the dashboard itself; mounted last so the API routes take precedence
+if os.path.isdir(STATIC_DIR):
+    app.mount("/", StaticFiles(directory=STATIC_DIR, html=True), name="dashboard")
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the eCFR dashboard and word count API.")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to bind (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=PORT, help=f"Port to listen on (default: {PORT})")
+    args = parser.parse_args()
+
+    print(f"Serving API from store: {STORE_PATH}")
+    print(f"Server running at: http://localhost:{args.port}")
+    uvicorn.run(app, host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+import os
+import re
+import json
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+from collections import Counter
+
+from aiohttp import web
+
+# Fixture XML bundled with the dashboard
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "docs", "data")
+
+# Port the standalone server listens on; point the scripts at it with
+# ECFR_BASE_URL=http://127.0.0.1:8081 or --base-url
+PORT = 8081
+
+# Date listed in versions.json for fixtures that carry no date of their own
+FIXTURE_DATE = "2023-01-01"
+
+# Bytes written per chunk when a response is throttled to a bandwidth
+CHUNK_SIZE = 1 << 16
+
+# Fixture files: the bundled ECFR-title1.xml, or title-1-2023-01-01.xml as
+# saved by the downloaders
+_FIXTURE_NAME = re.compile(r"^(?:ECFR-title(?P<title>\d+)|title-(?P<recorded>\d+)-(?P<date>\d{4}-\d{2}-\d{2}))\.xml$")
+
+class FakeEcfrServer:
+    """
+    Local stand-in for the eCFR versioner API, for offline tests and load
+    tests.
+
+    Serves /api/versioner/v1/full/{date}/title-{N}.xml from the fixture
+    directory: title-N-{date}.xml as recorded by the downloaders if there is
+    one, otherwise ECFR-titleN.xml. /api/versioner/v1/versions.json comes
+    from the `versions` list and /api/admin/v1/agencies.json from the
+    `agencies` list, which tests can edit between runs. The JSON listings
+    carry an ETag (and Cache-Control max-age when `max_age` is set) and
+    answer a matching If-None-Match with 304.
+
+    Faults for retry and load testing: the first `throttle_first` requests
+    for each URL are answered with 429, and after that a random
+    `throttle_rate` of requests get 429 and `error_rate` get 503, both with
+    Retry-After `retry_after`. Every response is delayed by `latency`
+    seconds plus up to `jitter` more, and XML bodies are sent at
+    `bandwidth` bytes per second when it is set. `seed` makes the faults
+    reproducible. Request counts, statuses, per-request service times and
+    the peak number of concurrent requests are recorded for assertions.
+    """
+
+    def __init__(self, fixture_dir=DATA_DIR, throttle_first=0, latency=0.0, max_age=None, jitter=0.0,
+                 bandwidth=None, error_rate=0.0, throttle_rate=0.0, retry_after=0, seed=None):
+        self.fixture_dir = fixture_dir
+        self.throttle_first = throttle_first
+        self.latency = latency
+        self.max_age = max_age
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.versions = []
+        self.agencies = []
+        self.requests = Counter()
+        self.statuses = Counter()
+        self.service_times = []
+        self.sent_bytes = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.runner = None
+        self.base_url = None
+
+        self.app = web.Application()
+        self.app.router.add_get("/api/versioner/v1/full/{date}/title-{title}.xml", self.title_xml)
+        self.app.router.add_get("/api/versioner/v1/versions.json", self.versions_json)
+        self.app.router.add_get("/api/admin/v1/agencies.json", self.agencies_json)
+
+    def fixture_path(self, title, date=None):
+        if date is not None:
+            recorded = os.path.join(self.fixture_dir, f"title-{title}-{date}.xml")
+            if os.path.exists(recorded):
+                return recorded
+        return os.path.join(self.fixture_dir, f"ECFR-title{title}.xml")
+
+    def load_fixtures(self):
+        """
+        Fill `versions` with one entry per fixture title and date, newest
+        first, and `agencies` from the fixture directory's agencies.json,
+        or with one agency per title when there is none.
+        """
+        versions = set()
+        for filename in os.listdir(self.fixture_dir):
+            match = _FIXTURE_NAME.match(filename)
+            if match:
+                title = int(match.group("title") or match.group("recorded"))
+                versions.add((match.group("date") or FIXTURE_DATE, title))
+        self.versions = [{"date": date, "title": title} for date, title in sorted(versions, reverse=True)]
+
+        agencies_path = os.path.join(self.fixture_dir, "agencies.json")
+        if os.path.exists(agencies_path):
+            with open(agencies_path, "r", encoding="utf-8") as f:
+                self.agencies = json.load(f).get("agencies", [])
+        else:
+            titles = sorted({version["title"] for version in self.versions})
+            self.agencies = [{"name": f"Title {title} Agency", "slug": f"title-{title}-agency",
+                              "cfr_references": [{"title": title}]} for title in titles]
+        return self
+
+    def _fault(self, key):
+        """The throttling or error response this request gets, if any."""
+        headers = {"Retry-After": str(self.retry_after)}
+        if self.requests[key] <= self.throttle_first:
+            return web.Response(status=429, headers=headers)
+        roll = self.random.random()
+        if roll < self.throttle_rate:
+            return web.Response(status=429, headers=headers)
+        if roll < self.throttle_rate + self.error_rate:
+            return web.Response(status=503, headers=headers)
+        return None
+
+    async def _delay(self):
+        delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0.0)
+        await asyncio.sleep(delay)
+
+    async def title_xml(self, request):
+        key = request.path_qs
+        self.requests[key] += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        start = time.perf_counter()
+        status = 500
+        try:
+            await self._delay()
+            fault = self._fault(key)
+            if fault is not None:
+                status = fault.status
+                return fault
+            path = self.fixture_path(request.match_info["title"], request.match_info["date"])
+            if not os.path.exists(path):
+                status = 404
+                raise web.HTTPNotFound()
+            status = 200
+            if not self.bandwidth:
+                self.sent_bytes += os.path.getsize(path)
+                return web.FileResponse(path, headers={"Content-Type": "application/xml"})
+            return await self.stream_file(request, path)
+        finally:
+            self.in_flight -= 1
+            self.statuses[status] += 1
+            self.service_times.append((status, time.perf_counter() - start))
+
+    async def stream_file(self, request, path):
+        """Send a file in chunks paced to `bandwidth` bytes per second."""
+        response = web.StreamResponse(headers={"Content-Type": "application/xml"})
+        response.content_length = os.path.getsize(path)
+        await response.prepare(request)
+        start = time.perf_counter()
+        sent = 0
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                await response.write(chunk)
+                sent += len(chunk)
+                self.sent_bytes += len(chunk)
+                ahead = sent / self.bandwidth - (time.perf_counter() - start)
+                if ahead > 0:
+                    await asyncio.sleep(ahead)
+        await response.write_eof()
+        return response
+
+    async def json_listing(self, request, payload):
+        key = request.path_qs
+        self.requests[key] += 1
+        await self._delay()
+        fault = self._fault(key)
+        if fault is not None:
+            self.statuses[fault.status] += 1
+            return fault
+        body = json.dumps(payload).encode("utf-8")
+        headers = {"ETag": '"' + hashlib.sha256(body).hexdigest()[:16] + '"'}
+        if self.max_age is not None:
+            headers["Cache-Control"] = f"max-age={self.max_age}"
+        if request.headers.get("If-None-Match") == headers["ETag"]:
+            self.statuses[304] += 1
+            return web.Response(status=304, headers=headers)
+        self.statuses[200] += 1
+        return web.Response(body=body, content_type="application/json", headers=headers)
+
+    async def versions_json(self, request):
+        return await self.json_listing(request, {"versions": self.versions})
+
+    async def agencies_json(self, request):
+        return await self.json_listing(request, {"agencies": self.agencies})
+
+    async def start(self, host="127.0.0.1", port=0):
+        self.runner = web.AppRunner(self.app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}"
+        return self.base_url
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+def add_fault_arguments(parser):
+    """Latency, bandwidth and fault options shared by the server and the download load test."""
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response (default: 0)")
+    parser.add_argument("--jitter", type=float, default=0.0,
+                        help="Up to this many more seconds added at random (default: 0)")
+    parser.add_argument("--bandwidth-mb", type=float,
+                        help="Send each XML body at this many MB/s (default: unthrottled)")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="Fraction of requests answered with 503 (default: 0)")
+    parser.add_argument("--throttle-rate", type=float, default=0.0,
+                        help="Fraction of requests answered with 429 (default: 0)")
+    parser.add_argument("--throttle-first", type=int, default=0,
+                        help="Answer the first N requests for each URL with 429 (default: 0)")
+    parser.add_argument("--retry-after", type=int, default=0,
+                        help="Retry-After seconds sent with 429/503 (default: 0)")
+    parser.add_argument("--seed", type=int, help="Random seed for reproducible faults")
+
+def server_from_args(args, fixture_dir=DATA_DIR):
+    return FakeEcfrServer(fixture_dir, throttle_first=args.throttle_first, latency=args.latency,
+                          jitter=args.jitter,
+                          bandwidth=args.bandwidth_mb * (1 << 20) if args.bandwidth_mb else None,
+                          error_rate=args.error_rate, throttle_rate=args.throttle_rate,
+                          retry_after=args.retry_after, seed=args.seed)
+
+async def serve(server, host, port):
+    base_url = await server.start(host, port)
+    print(f"[INFO] Fake eCFR server at {base_url} serving {len(server.versions)} title versions "
+          f"and {len(server.agencies)} agencies from {server.fixture_dir}")
+    print(f"[INFO] Run the downloaders with ECFR_BASE_URL={base_url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve fixture or recorded eCFR responses locally.")
+    parser.add_argument("--fixture-dir", default=DATA_DIR,
+                        help="ECFR-title*.xml fixtures, or a data directory of downloaded "
+                             "title-N-DATE.xml files and agencies.json to replay (default: docs/data)")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to bind (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=PORT, help=f"Port to listen on (default: {PORT})")
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    server = server_from_args(args, args.fixture_dir).load_fixtures()
+    try:
+        asyncio.run(serve(server, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    print(f"[INFO] Served {sum(server.requests.values())} requests: "
+          + ", ".join(f"{status}: {count}" for status, count in sorted(server.statuses.items())))
+
+if __name__ == "__main__":
+    main()
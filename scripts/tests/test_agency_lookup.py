@@ -0,0 +1,111 @@
+import os
+import sys
+
+import pandas as pd
+
+# Make the processing scripts importable
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(SCRIPTS_DIR, "data"))
+
+from agency_lookup import AgencyLookup, normalize_chapters
+from process_xml import COLUMNS, agency_totals
+
+def reference_totals(lookup, df):
+    """Agency totals from attribute() and a pandas groupby, as totals() was first written."""
+    attributed = lookup.attribute(df)
+    attributed = attributed[attributed["WordCount"] != 0]
+    return attributed.groupby("Agency")["WordCount"].sum().reset_index()
+
+# Configuration
+DATA_DIR = os.path.join(os.path.dirname(SCRIPTS_DIR), "docs", "data")
+
+# A small agencies.json in the admin API's shape, referencing chapters of
+# the bundled output_chapter.xlsx
+AGENCIES = [
+    {"name": "Federal Trade Commission", "slug": "federal-trade-commission",
+     "cfr_references": [{"title": 16, "chapter": "I"}]},
+    {"name": "Department of Defense", "slug": "defense-department",
+     "cfr_references": [{"title": 32, "subtitle": "A"}, {"title": 32, "chapter": "I"}],
+     "children": [
+         {"name": "Office of the Secretary of Defense", "slug": "secretary-of-defense",
+          "cfr_references": [{"title": 32, "chapter": "I"}]},
+     ]},
+    {"name": "Executive Office of the President", "slug": "executive-office-of-the-president",
+     "cfr_references": [{"title": 3}]},
+]
+
+def main():
+    df = pd.read_excel(os.path.join(DATA_DIR, "output_chapter.xlsx"), dtype={"Title": str, "Chapter": str})
+    df = df.reindex(columns=COLUMNS, fill_value="")
+    lookup = AgencyLookup.from_agencies(AGENCIES)
+    failures = []
+
+    normalized = normalize_chapters(pd.Series(["CHAPTER I", "I", " chapter iv", "CHAPTER 1", "CHAPTER V [RESERVED]"]))
+    if normalized.tolist() != ["I", "I", "IV", "1", "V"]:
+        failures.append(f"chapter normalization gave {normalized.tolist()}")
+
+    attributed = lookup.attribute(df)
+
+    # Title 16 chapter I goes to the FTC, title 32 chapter I to both the
+    # parent and the child that reference it, title 3 to its title-level owner
+    def agencies_of(title, chapter):
+        rows = attributed[(attributed["Title"] == title) & (attributed["Chapter"] == chapter)]
+        return sorted(set(rows["Agency"]))
+    if agencies_of("title16", "CHAPTER I") != ["Federal Trade Commission"]:
+        failures.append(f"title 16 chapter I attributed to {agencies_of('title16', 'CHAPTER I')}")
+    if agencies_of("title32", "CHAPTER I") != ["Department of Defense", "Office of the Secretary of Defense"]:
+        failures.append(f"title 32 chapter I attributed to {agencies_of('title32', 'CHAPTER I')}")
+    title3 = attributed[attributed["Title"] == "title3"]
+    if len(title3) == 0 or set(title3["Agency"]) != {"Executive Office of the President"}:
+        failures.append(f"title 3 attributed to {sorted(set(title3['Agency']))}")
+
+    # Other chapters keep their HEAD agency (in the API's casing where it
+    # lists the same agency), and no row is lost
+    unmatched = attributed[~attributed["Matched"]]
+    expected = df[~df["Title"].isin(["title3"]) &
+                  ~((df["Title"] == "title16") & (df["Chapter"] == "CHAPTER I")) &
+                  ~((df["Title"] == "title32") & (df["Chapter"] == "CHAPTER I"))]
+    expected = expected.assign(Agency=lookup.canonical_names(expected["Agency"]))
+    if not unmatched[COLUMNS].reset_index(drop=True).equals(expected.reset_index(drop=True)):
+        failures.append("unmatched rows were changed or dropped")
+    shared = df[(df["Title"] == "title32") & (df["Chapter"] == "CHAPTER I")]["WordCount"].sum()
+    if attributed["WordCount"].sum() != df["WordCount"].sum() + shared:
+        failures.append("attributed word counts do not add up")
+
+    totals = dict(agency_totals(df, lookup).itertuples(index=False))
+    ftc = df[(df["Title"] == "title16") & (df["Chapter"] == "CHAPTER I")]["WordCount"].sum()
+    ftc += expected[expected["Agency"] == "Federal Trade Commission"]["WordCount"].sum()
+    if totals.get("Federal Trade Commission") != ftc:
+        failures.append(f"FTC total {totals.get('Federal Trade Commission')}, expected {ftc}")
+
+    # An unmatched chapter whose HEAD names a known agency in upper case
+    # totals under the API's name, not as a second agency
+    mixed = pd.DataFrame([["title16", "CHAPTER I", "FEDERAL TRADE COMMISSION", 100, ""],
+                          ["title16", "CHAPTER IX", "FEDERAL  TRADE COMMISSION", 20, ""],
+                          ["title16", "CHAPTER X", "BUREAU OF SOMETHING ELSE", 5, ""]], columns=COLUMNS)
+    mixed_totals = dict(agency_totals(mixed, lookup).itertuples(index=False))
+    if mixed_totals != {"Federal Trade Commission": 120, "BUREAU OF SOMETHING ELSE": 5}:
+        failures.append(f"mixed matched and unmatched rows totalled {mixed_totals}")
+
+    # The dictionary-encoded totals match attribute() and groupby exactly,
+    # including rows shared by several agencies and zero-count rows
+    for name, rows in [("fixture", df), ("mixed", mixed), ("empty", df.iloc[:0])]:
+        if not agency_totals(rows, lookup).equals(reference_totals(lookup, rows)):
+            failures.append(f"{name} agency totals differ from attribute() and groupby")
+
+    # Without a lookup the HEAD names are still combined as before
+    combined = agency_totals(df)
+    workbook = pd.read_excel(os.path.join(DATA_DIR, "output_agency_words.xlsx"))
+    if dict(combined.itertuples(index=False)) != dict(workbook.itertuples(index=False)):
+        failures.append("agency_totals without a lookup changed")
+
+    print("\n[SUMMARY]")
+    print(f"Rows: {len(df)}, attributed: {len(attributed)} ({len(unmatched)} kept their HEAD agency)")
+    print(f"Failures: {len(failures)}")
+    for failure in failures:
+        print(f"[ERROR] {failure}")
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
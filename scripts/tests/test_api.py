@@ -0,0 +1,146 @@
+import os
+import sys
+import json
+import time
+import socket
+import tempfile
+import threading
+
+import requests
+import uvicorn
+
+# Make the API server importable
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(SCRIPTS_DIR, "server"))
+
+import api
+from results_store import ResultsStore
+
+ROWS = [["1", "CHAPTER I", "ADMINISTRATIVE COMMITTEE OF THE FEDERAL REGISTER", 100, "2023-01-01"],
+        ["1", "CHAPTER II", "OFFICE OF THE FEDERAL REGISTER", 40, "2023-01-01"],
+        ["2", "CHAPTER I", "OFFICE OF MANAGEMENT AND BUDGET", 7, "2023-01-01"]]
+
+def save_agencies(path, name):
+    """agencies.json attributing title 1 chapter I to `name`."""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"agencies": [{"name": name, "cfr_references": [{"title": 1, "chapter": "I"}]}]}, f)
+
+def start_api():
+    """Serve the app with uvicorn on a free port in a background thread."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(api.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    deadline = time.time() + 30
+    while not server.started and time.time() < deadline:
+        time.sleep(0.05)
+    return server, f"http://127.0.0.1:{port}"
+
+def touch(data_dir, filename):
+    with open(os.path.join(data_dir, filename), "w", encoding="utf-8") as f:
+        f.write("<ECFR/>")
+
+def check_title_file(failures):
+    """Only full-title snapshots are served, the latest by date unless one is given."""
+    with tempfile.TemporaryDirectory() as data_dir:
+        for filename in ["title-1-2022-06-01.xml", "title-1-2023-01-01.xml", "title-1-chapter-I-2023-01-01.xml",
+                         "title-1-chapter-II-2024-01-01.xml", "title-10-2025-01-01.xml", "title-1-2024-13-01.xml"]:
+            touch(data_dir, filename)
+        api.DATA_DIR = data_dir
+
+        cases = [
+            (("1",), "title-1-2023-01-01.xml"),
+            (("1", "2022-06-01"), "title-1-2022-06-01.xml"),
+            (("1", "2024-01-01"), None),
+            (("10",), "title-10-2025-01-01.xml"),
+            (("2",), None),
+        ]
+        for args, expected in cases:
+            found = api.title_file(*args)
+            if (found and os.path.basename(found)) != expected:
+                failures.append(f"title_file{args} gave {found}, expected {expected}")
+
+def check_responses(failures):
+    """Aggregates, revalidation, and invalidation when the store or agencies.json changes."""
+    with tempfile.TemporaryDirectory() as data_dir:
+        api.STORE_PATH = os.path.join(data_dir, "results.sqlite")
+        api.AGENCIES_PATH = os.path.join(data_dir, "agencies.json")
+        api.DATA_DIR = data_dir
+        with ResultsStore(api.STORE_PATH) as store:
+            store.upsert_rows(ROWS, "title-1-2023-01-01.xml")
+        save_agencies(api.AGENCIES_PATH, "Administrative Committee")
+
+        server, base_url = start_api()
+        try:
+            titles = requests.get(f"{base_url}/api/titles").json()
+            if {item["title"]: item["wordCount"] for item in titles["items"]} != {"1": 140, "2": 7}:
+                failures.append(f"/api/titles gave {titles}")
+            page = requests.get(f"{base_url}/api/chapters", params={"limit": 1, "offset": 1}).json()
+            if page["total"] != 3 or [item["chapter"] for item in page["items"]] != ["CHAPTER II"]:
+                failures.append(f"/api/chapters page gave {page}")
+
+            response = requests.get(f"{base_url}/api/agencies")
+            totals = {item["agency"]: item["wordCount"] for item in response.json()["items"]}
+            if totals.get("Administrative Committee") != 100:
+                failures.append(f"/api/agencies gave {totals}")
+            etag = response.headers.get("ETag")
+            revalidated = requests.get(f"{base_url}/api/agencies", headers={"If-None-Match": etag})
+            if revalidated.status_code != 304:
+                failures.append(f"matching If-None-Match gave {revalidated.status_code}")
+
+            # A store write changes the ETag and the totals
+            with ResultsStore(api.STORE_PATH) as store:
+                store.upsert_rows([["2", "CHAPTER I", "OFFICE OF MANAGEMENT AND BUDGET", 9, "2023-01-01"]],
+                                  "title-2-2023-01-01.xml")
+            response = requests.get(f"{base_url}/api/titles", headers={"If-None-Match": etag})
+            if response.status_code != 200 or response.headers.get("ETag") == etag:
+                failures.append(f"store write left the response cached ({response.status_code})")
+            elif {item["title"]: item["wordCount"] for item in response.json()["items"]}.get("2") != 9:
+                failures.append(f"/api/titles after a store write gave {response.json()}")
+
+            # So does refreshing agencies.json, without restarting the server
+            etag = requests.get(f"{base_url}/api/agencies").headers.get("ETag")
+            time.sleep(0.01)
+            save_agencies(api.AGENCIES_PATH, "Renamed Committee")
+            response = requests.get(f"{base_url}/api/agencies", headers={"If-None-Match": etag})
+            totals = {item["agency"]: item["wordCount"] for item in response.json()["items"]} \
+                if response.status_code == 200 else {}
+            if totals.get("Renamed Committee") != 100 or "Administrative Committee" in totals:
+                failures.append(f"/api/agencies after an agencies.json refresh gave {response.status_code} {totals}")
+
+            # With an older snapshot in the store, undated totals are still
+            # those of the latest date, not the sum of both
+            with ResultsStore(api.STORE_PATH) as store:
+                store.upsert_rows([[row[0], row[1], row[2], 1000, "2022-01-01"] for row in ROWS],
+                                  "title-1-2022-01-01.xml")
+            undated = requests.get(f"{base_url}/api/titles").json()["items"]
+            latest = requests.get(f"{base_url}/api/titles", params={"date": "2023-01-01"}).json()["items"]
+            older = requests.get(f"{base_url}/api/titles", params={"date": "2022-01-01"}).json()["items"]
+            if undated != latest or sum(item["wordCount"] for item in older) != 3000:
+                failures.append(f"undated /api/titles gave {undated}, latest date {latest}")
+            undated = requests.get(f"{base_url}/api/agencies").json()["items"]
+            if sum(item["wordCount"] for item in undated) != 149:
+                failures.append(f"undated /api/agencies gave {undated}")
+
+            missing = requests.get(f"{base_url}/api/section", params={"title": "1", "n": "1.1"})
+            if missing.status_code != 404:
+                failures.append(f"/api/section without XML gave {missing.status_code}")
+        finally:
+            server.should_exit = True
+            time.sleep(0.2)
+
+def main():
+    failures = []
+    check_title_file(failures)
+    check_responses(failures)
+
+    print("\n[SUMMARY]")
+    print(f"Failures: {len(failures)}")
+    for failure in failures:
+        print(f"[ERROR] {failure}")
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
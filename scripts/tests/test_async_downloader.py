@@ -0,0 +1,153 @@
+import os
+import sys
+import time
+import asyncio
+import tempfile
+
+# Make the download scripts importable
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(SCRIPTS_DIR, "data"))
+
+from compression import compressed_filename, open_xml
+from download_data import download_all
+from fake_ecfr_server import FakeEcfrServer
+from metrics import METRICS
+
+# Configuration
+TEST_TITLES = [1, 3, 4]
+TEST_YEARS = range(2021, 2024)
+CONCURRENCY = 4
+
+async def run_download(data_dir, compression):
+    """Download the fixture titles from a local fake server."""
+    server = FakeEcfrServer(throttle_first=1, latency=0.05)
+    base_url = await server.start()
+    print(f"[INFO] Fake eCFR server running at {base_url}")
+
+    # A parent and child sharing title 1 should still fetch it only once per year
+    agencies = [
+        {"slug": f"agency-{title}", "cfr_references": [{"title": title}]}
+        for title in TEST_TITLES
+    ]
+    agencies.append({"slug": "child-of-agency-1", "cfr_references": [{"title": TEST_TITLES[0]}]})
+    try:
+        start = time.perf_counter()
+        await download_all(agencies, TEST_YEARS, data_dir, base_url=base_url, compression=compression,
+                           concurrency=CONCURRENCY, rate_limit=50, backoff=0.01)
+        elapsed = time.perf_counter() - start
+    finally:
+        await server.stop()
+    return server, elapsed
+
+def check_download(compression):
+    """Download the fixtures with the given compression and check the files."""
+    METRICS.reset()
+    with tempfile.TemporaryDirectory() as data_dir:
+        server, elapsed = asyncio.run(run_download(data_dir, compression))
+
+        failures = []
+        for title in TEST_TITLES:
+            with open(server.fixture_path(title), "rb") as f:
+                expected = f.read()
+            for year in TEST_YEARS:
+                filename = compressed_filename(f"title-{title}-{year}-01-01.xml", compression)
+                filepath = os.path.join(data_dir, filename)
+                if not os.path.exists(filepath):
+                    failures.append(f"missing {filepath}")
+                    continue
+                with open_xml(filepath) as f:
+                    if f.read() != expected:
+                        failures.append(f"content mismatch in {filepath}")
+
+        # Each URL is throttled once, then served once
+        repeated = [url for url, count in server.requests.items() if count != 2]
+        if repeated:
+            failures.append(f"URLs not fetched exactly once: {repeated}")
+
+        if not os.path.exists(os.path.join(data_dir, "agency_jobs.json")):
+            failures.append("agency_jobs.json was not written")
+
+        leftovers = [name for name in os.listdir(data_dir) if name.endswith(".part")]
+        if leftovers:
+            failures.append(f"temporary files left behind: {leftovers}")
+
+        if server.max_in_flight > CONCURRENCY:
+            failures.append(f"{server.max_in_flight} requests in flight, limit is {CONCURRENCY}")
+
+        # The client's metrics should agree with what the server saw
+        files = len(TEST_TITLES) * len(TEST_YEARS)
+        counters = {name: value for (name, labels), value in METRICS.counters.items() if not labels}
+        responses = {dict(labels)["status"]: value for (name, labels), value in METRICS.counters.items()
+                     if name == "http_responses_total"}
+        if responses != {"429": files, "200": files}:
+            failures.append(f"unexpected response metrics: {responses}")
+        if counters.get("http_retries_total") != files:
+            failures.append(f"expected {files} retries in metrics, got {counters.get('http_retries_total')}")
+        if METRICS.histograms[("http_request_seconds", ())].count != files:
+            failures.append("http_request_seconds does not cover every download")
+        if "http_request_seconds_count" not in METRICS.to_prometheus():
+            failures.append("Prometheus export is missing the request histogram")
+
+    print(f"\n[SUMMARY] compression={compression}")
+    print(f"Files expected: {len(TEST_TITLES) * len(TEST_YEARS)}")
+    print(f"Requests served (including 429 retries): {sum(server.requests.values())}")
+    print(f"Peak concurrent requests: {server.max_in_flight}")
+    print(f"Elapsed: {elapsed:.2f}s")
+    for failure in failures:
+        print(f"[ERROR] {failure}")
+    return failures
+
+async def run_faulty_download(data_dir):
+    """Download the fixture titles from a server that throttles, fails and limits bandwidth at random."""
+    server = FakeEcfrServer(error_rate=0.2, throttle_rate=0.2, bandwidth=8 << 20, jitter=0.02, seed=7)
+    base_url = await server.start()
+    agencies = [{"slug": f"agency-{title}", "cfr_references": [{"title": title}]} for title in TEST_TITLES]
+    try:
+        await download_all(agencies, TEST_YEARS, data_dir, base_url=base_url,
+                           concurrency=CONCURRENCY, rate_limit=50, max_retries=10, backoff=0.01)
+    finally:
+        await server.stop()
+    return server
+
+def check_faults():
+    """Random 429/503 responses are retried until every file arrives intact."""
+    METRICS.reset()
+    failures = []
+    with tempfile.TemporaryDirectory() as data_dir:
+        server = asyncio.run(run_faulty_download(data_dir))
+        for title in TEST_TITLES:
+            with open(server.fixture_path(title), "rb") as f:
+                expected = f.read()
+            for year in TEST_YEARS:
+                filepath = os.path.join(data_dir, f"title-{title}-{year}-01-01.xml")
+                if not os.path.exists(filepath):
+                    failures.append(f"missing {filepath} after faults")
+                    continue
+                with open(filepath, "rb") as f:
+                    if f.read() != expected:
+                        failures.append(f"content mismatch in {filepath} after faults")
+
+    # The seeded faults did happen, and the client retried each one
+    faults = server.statuses[429] + server.statuses[503]
+    counters = {name: value for (name, labels), value in METRICS.counters.items() if not labels}
+    if not faults:
+        failures.append("no faults were injected")
+    if counters.get("http_retries_total") != faults:
+        failures.append(f"{faults} faults but {counters.get('http_retries_total')} retries")
+
+    print("\n[SUMMARY] faults")
+    print(f"Responses: {dict(sorted(server.statuses.items()))}")
+    for failure in failures:
+        print(f"[ERROR] {failure}")
+    return failures
+
+def main():
+    failures = []
+    for compression in ("none", "gzip"):
+        failures.extend(check_download(compression))
+    failures.extend(check_faults())
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import os
+import sys
+import random
+
+import pandas as pd
+
+# Make the processing scripts importable
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(SCRIPTS_DIR, "data"))
+
+from chapter_table import COLUMNS, ChapterTable
+from process_xml import agency_totals, combine_rows
+
+# Configuration
+DATA_DIR = os.path.join(os.path.dirname(SCRIPTS_DIR), "docs", "data")
+AGENCY_NAMES = ["OFFICE", "OFFICE OF PERSONNEL", "OFFICE OF PERSONNEL MANAGEMENT", "COAST GUARD",
+                "COAST GUARD, DEPARTMENT OF HOMELAND SECURITY", "FARM CREDIT", "", "[RESERVED]"]
+
+def pairwise_combine_rows(df):
+    """The original combine_rows loop, kept as the reference for identical output."""
+    combined_data = []
+    for _, group in df.groupby(["Title", "Chapter"]):
+        group = group.copy()
+        for i in range(len(group)):
+            for j in range(i + 1, len(group)):
+                if group.iloc[i]["Agency"] in group.iloc[j]["Agency"] and group.iloc[i]["Agency"] != group.iloc[j]["Agency"]:
+                    group.loc[group.index[i], "WordCount"] += group.loc[group.index[j], "WordCount"]
+                    group.loc[group.index[j], "WordCount"] = -1
+        combined_data.extend(group[group["WordCount"] != -1].values.tolist())
+    return pd.DataFrame(combined_data, columns=df.columns)
+
+def synthetic_rows(seed, count):
+    """Rows with many agency names contained in one another, repeated chapters and several dates."""
+    rng = random.Random(seed)
+    return [[f"{rng.randint(1, 4)}", f"CHAPTER {rng.choice('IVX')}", rng.choice(AGENCY_NAMES),
+             rng.choice([0, 0, 1, 5, 250, 10_000]), rng.choice(["2023-01-01", "2024-01-01"])]
+            for _ in range(count)]
+
+def main():
+    failures = []
+    fixture = pd.read_excel(os.path.join(DATA_DIR, "output_chapter.xlsx"))
+    frames = {"output_chapter.xlsx": fixture}
+    for seed in range(5):
+        frames[f"synthetic {seed}"] = pd.DataFrame(synthetic_rows(seed, 400), columns=COLUMNS)
+
+    for name, df in frames.items():
+        # Row lists and DataFrames encode to the same table
+        rows = df.reindex(columns=COLUMNS, fill_value="").values.tolist()
+        from_rows = ChapterTable.from_rows(rows).to_frame()
+        if not from_rows.equals(pd.DataFrame(rows, columns=COLUMNS)):
+            failures.append(f"{name}: row table does not round-trip")
+
+        expected = pairwise_combine_rows(df)
+        combined = combine_rows(df)
+        if combined.values.tolist() != expected.values.tolist():
+            failures.append(f"{name}: combine_rows differs from the pairwise loop")
+
+        expected_totals = expected[expected["WordCount"] != 0].groupby("Agency")["WordCount"].sum().reset_index()
+        for source, table in (("frame", df), ("table", ChapterTable.from_rows(rows))):
+            totals = agency_totals(table)
+            if totals.values.tolist() != expected_totals.values.tolist():
+                failures.append(f"{name}: agency_totals from a {source} differs from the groupby")
+
+        # Rollups match groupby on every key
+        table = ChapterTable.from_frame(df)
+        for by in ("Title", "Chapter", "Agency"):
+            expected_rollup = df[df["WordCount"] != 0].groupby(by)["WordCount"].sum().reset_index()
+            if table.rollup(by).values.tolist() != expected_rollup.values.tolist():
+                failures.append(f"{name}: rollup by {by} differs from groupby")
+
+    # The bundled agency totals are reproduced exactly
+    workbook = pd.read_excel(os.path.join(DATA_DIR, "output_agency_words.xlsx"))
+    if not agency_totals(fixture).equals(workbook):
+        failures.append("agency_totals differs from output_agency_words.xlsx")
+
+    print("\n[SUMMARY]")
+    print(f"Tables: {len(frames)}, rows: {sum(len(df) for df in frames.values())}")
+    print(f"Failures: {len(failures)}")
+    for failure in failures:
+        print(f"[ERROR] {failure}")
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import os
+import sys
+import random
+
+import numpy as np
+import pandas as pd
+
+# Make the processing scripts importable
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(SCRIPTS_DIR, "data"))
+
+from dashboard_bundle import NGRAM, build_bundle, name_ngrams
+from process_xml import COLUMNS
+
+# Configuration
+DATA_DIR = os.path.join(os.path.dirname(SCRIPTS_DIR), "docs", "data")
+SEARCH_CASES = 500
+
+def search(bundle, term):
+    """What docs/utils/helpers.js filterData returns when given the bundle's index."""
+    term = term.lower()
+    candidates = range(len(bundle["agencies"]))
+    if len(term) >= NGRAM:
+        postings = [np.cumsum(bundle["search"].get(gram, [])) for gram in name_ngrams(term)]
+        candidates = set.intersection(*(set(ids.tolist()) for ids in postings))
+    return sorted(i for i in candidates if term in bundle["agencies"][i].lower())
+
+def main():
+    df = pd.read_excel(os.path.join(DATA_DIR, "output_chapter.xlsx"), dtype={"Title": str, "Chapter": str})
+    df = df.reindex(columns=COLUMNS, fill_value="")
+    expected = pd.read_excel(os.path.join(DATA_DIR, "output_agency_words.xlsx"))
+    bundle = build_bundle(df)
+    failures = []
+
+    # Totals decode to exactly the agency workbook the dashboard used to read
+    totals = dict(zip(bundle["agencies"], bundle["totals"]))
+    if totals != dict(zip(expected["Agency"], expected["WordCount"])):
+        failures.append("totals differ from output_agency_words.xlsx")
+
+    # Per-date and per-title tables add up to the totals
+    by_date = np.array(bundle["byDate"]).reshape(len(bundle["agencies"]), len(bundle["dates"]))
+    if by_date.sum(axis=1).tolist() != bundle["totals"]:
+        failures.append("per-date counts do not add up to the totals")
+    by_title = np.bincount(bundle["byTitle"]["agency"], weights=bundle["byTitle"]["count"],
+                           minlength=len(bundle["agencies"]))
+    if by_title.astype(np.int64).tolist() != bundle["totals"]:
+        failures.append("per-title counts do not add up to the totals")
+
+    # The search index never drops a name a plain substring scan would find
+    rng = random.Random(7)
+    for _ in range(SEARCH_CASES):
+        name = rng.choice(bundle["agencies"])
+        start = rng.randrange(len(name))
+        term = name[start:start + rng.randint(1, 12)]
+        scan = [i for i, agency in enumerate(bundle["agencies"]) if term.lower() in agency.lower()]
+        if search(bundle, term) != scan:
+            failures.append(f"search for {term!r} differs from a substring scan")
+
+    print("\n[SUMMARY]")
+    print(f"Agencies: {len(bundle['agencies'])}, search cases: {SEARCH_CASES}")
+    print(f"Failures: {len(failures)}")
+    for failure in failures[:20]:
+        print(f"[ERROR] {failure}")
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import os
+import sys
+import glob
+import time
+import shutil
+import tempfile
+
+from lxml import etree
+
+# Make the processing scripts importable
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(SCRIPTS_DIR, "data"))
+
+from div_index import DivIndex, div_index_path
+from process_xml import process_xml
+
+# Configuration
+DATA_DIR = os.path.join(os.path.dirname(SCRIPTS_DIR), "docs", "data")
+DIV_TAGS = [f"DIV{level}" for level in range(1, 10)]
+
+def main():
+    failures = []
+    divs = 0
+    with tempfile.TemporaryDirectory() as work_dir:
+        # Copy the fixtures under downloader-style names
+        file_paths = []
+        for fixture in sorted(glob.glob(os.path.join(DATA_DIR, "ECFR-title*.xml"))):
+            title = os.path.basename(fixture)[len("ECFR-title"):-len(".xml")]
+            file_paths.append(os.path.join(work_dir, f"title-{title}-2023-01-01.xml"))
+            shutil.copy(fixture, file_paths[-1])
+
+        for file_path in file_paths:
+            name = os.path.basename(file_path)
+            index = DivIndex.for_file(file_path)
+            if not os.path.exists(div_index_path(file_path)):
+                failures.append(f"{name}: no sidecar written")
+
+            # Every DIV read from its byte range is the DIV of a full parse
+            tree = etree.parse(file_path, etree.XMLParser(remove_comments=True, remove_pis=True))
+            expected = [elem for elem in tree.iter(*DIV_TAGS)]
+            if len(expected) != len(index):
+                failures.append(f"{name}: {len(index)} DIVs indexed, {len(expected)} in the tree")
+                continue
+            positions = {elem: i for i, elem in enumerate(expected)}
+            for i, elem in enumerate(expected):
+                parent = next((positions[a] for a in elem.iterancestors(*DIV_TAGS)), -1)
+                if (index.level[i] != int(elem.tag[3:]) or index.n[i] != elem.get("N", "")
+                        or index.node[i] != elem.get("NODE", "") or index.parent[i] != parent):
+                    failures.append(f"{name}: DIV {i} indexed as level {index.level[i]} N={index.n[i]!r}, "
+                                    f"expected {elem.tag} N={elem.get('N')!r}")
+                elif etree.tostring(index.element(i)) != etree.tostring(elem, with_tail=False):
+                    failures.append(f"{name}: DIV {i} ({elem.tag} N={elem.get('N')!r}) differs when read alone")
+            divs += len(index)
+
+            # Chapter word counts match process_xml
+            counts = [index.describe(i)["wordCount"] for i in index.find(level=3)]
+            if counts != [row[3] for row in process_xml(file_path)]:
+                failures.append(f"{name}: chapter word counts differ from process_xml")
+
+        # A sidecar is reused while the file is unchanged and rebuilt after it changes
+        file_path = file_paths[0]
+        sidecar_mtime = os.stat(div_index_path(file_path)).st_mtime_ns
+        DivIndex.for_file(file_path)
+        if os.stat(div_index_path(file_path)).st_mtime_ns != sidecar_mtime:
+            failures.append("unchanged file's sidecar was rebuilt")
+        with open(file_path, "rb") as f:
+            data = f.read()
+        with open(file_path, "wb") as f:
+            f.write(data.replace(b"<DIV3", b"\n<DIV3", 1))
+        os.utime(file_path, ns=(time.time_ns(), time.time_ns()))
+        index = DivIndex.for_file(file_path)
+        first = index.find(level=3)
+        if len(first) and index.read(first[0])[:5] != b"<DIV3":
+            failures.append("sidecar was not rebuilt after the file changed")
+
+    print("\n[SUMMARY]")
+    print(f"Files: {len(file_paths)}, DIVs checked: {divs}")
+    print(f"Failures: {len(failures)}")
+    for failure in failures:
+        print(f"[ERROR] {failure}")
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import os
+import sys
+import json
+import asyncio
+import tempfile
+
+# Make the download scripts importable
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(SCRIPTS_DIR, "data"))
+
+from download_data import download_jobs
+from download_manifest import MANIFEST_NAME
+from fake_ecfr_server import FakeEcfrServer
+from fetch_plan import FetchJob, job_filename
+
+# Configuration
+TEST_DATE = "2023-01-01"
+TEST_TITLES = [1, 3, 4]
+MISSING_TITLE = 99     # No fixture, so the fake server answers 404
+
+async def run_download(data_dir, verify=False):
+    """Download the test jobs once from a fresh fake server."""
+    server = FakeEcfrServer()
+    base_url = await server.start()
+    jobs = [FetchJob(TEST_DATE, title, None) for title in TEST_TITLES + [MISSING_TITLE]]
+    try:
+        manifest = await download_jobs(jobs, data_dir, base_url=base_url, verify=verify,
+                                       rate_limit=50, backoff=0.01, max_retries=1)
+    finally:
+        await server.stop()
+    return server, manifest
+
+def fetched_titles(server):
+    """Titles the fake server was asked for."""
+    return sorted(int(url.split("title-")[1].split(".")[0]) for url in server.requests)
+
+def main():
+    failures = []
+    with tempfile.TemporaryDirectory() as data_dir:
+        # First run: everything but the missing title downloads
+        server, manifest = asyncio.run(run_download(data_dir))
+        statuses = {name: entry["status"] for name, entry in manifest.entries.items()}
+        expected = {job_filename(FetchJob(TEST_DATE, title, None)): "complete" for title in TEST_TITLES}
+        expected[job_filename(FetchJob(TEST_DATE, MISSING_TITLE, None))] = "failed"
+        if statuses != expected:
+            failures.append(f"first run statuses: {statuses}")
+        if not os.path.exists(os.path.join(data_dir, MANIFEST_NAME)):
+            failures.append("manifest was not saved")
+
+        # Second run: only the failed job is retried
+        server, manifest = asyncio.run(run_download(data_dir))
+        if fetched_titles(server) != [MISSING_TITLE]:
+            failures.append(f"second run fetched {fetched_titles(server)}, expected only the failed job")
+        if manifest.entries[job_filename(FetchJob(TEST_DATE, MISSING_TITLE, None))].get("attempts") != 2:
+            failures.append("failed job attempts were not counted")
+
+        # Truncate one file and alter another in place: both are refetched
+        truncated = os.path.join(data_dir, job_filename(FetchJob(TEST_DATE, TEST_TITLES[0], None)))
+        with open(truncated, "r+b") as f:
+            f.truncate(os.path.getsize(truncated) // 2)
+        altered = os.path.join(data_dir, job_filename(FetchJob(TEST_DATE, TEST_TITLES[1], None)))
+        stat = os.stat(altered)
+        with open(altered, "r+b") as f:
+            f.write(b"<!-- tampered -->")
+        os.utime(altered, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        server, manifest = asyncio.run(run_download(data_dir, verify=True))
+        if fetched_titles(server) != sorted([TEST_TITLES[0], TEST_TITLES[1], MISSING_TITLE]):
+            failures.append(f"third run fetched {fetched_titles(server)}, expected the damaged files")
+
+        # A file left from before the manifest existed is adopted if complete, refetched if not
+        with open(os.path.join(data_dir, MANIFEST_NAME), "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        os.remove(os.path.join(data_dir, MANIFEST_NAME))
+        with open(truncated, "r+b") as f:
+            f.truncate(os.path.getsize(truncated) - 10)
+        server, manifest = asyncio.run(run_download(data_dir))
+        if fetched_titles(server) != [TEST_TITLES[0], MISSING_TITLE]:
+            failures.append(f"legacy run fetched {fetched_titles(server)}, expected the truncated file")
+        if manifest.stats["adopted"] != len(TEST_TITLES) - 1:
+            failures.append(f"adopted {manifest.stats['adopted']} legacy files")
+        sha = {name: entry.get("sha256") for name, entry in manifest.entries.items()}
+        if any(sha[name] != entry.get("sha256") for name, entry in saved.items() if entry["status"] == "complete"):
+            failures.append("checksums changed between runs")
+
+        leftovers = [name for name in os.listdir(data_dir) if name.endswith(".part")]
+        if leftovers:
+            failures.append(f"temporary files left behind: {leftovers}")
+
+    print("\n[SUMMARY]")
+    print(f"Failures: {len(failures)}")
+    for failure in failures:
+        print(f"[ERROR] {failure}")
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import os
+import sys
+import shutil
+import tempfile
+
+import pandas as pd
+from lxml import etree
+
+# Make the processing scripts importable
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(SCRIPTS_DIR, "data"))
+
+from history import changed_sections, snapshot_totals, yearly_deltas
+from process_xml import COLUMNS
+from section_index import SectionIndex
+
+# Configuration
+FIXTURE = os.path.join(os.path.dirname(SCRIPTS_DIR), "docs", "data", "ECFR-title1.xml")
+ADDED_WORDS = "three added words"
+
+def edit_first_section(source, target):
+    """Copy a title with words added to the first paragraph of its first section; returns that section's N."""
+    tree = etree.parse(source)
+    section = tree.find(".//DIV8")
+    paragraph = section.find(".//P")
+    paragraph.text = (paragraph.text or "") + " " + ADDED_WORDS
+    tree.write(target, encoding="utf-8", xml_declaration=True)
+    return section.get("N")
+
+def check_changed_sections(failures):
+    with tempfile.TemporaryDirectory() as work_dir:
+        paths = {date: os.path.join(work_dir, f"title-1-{date}.xml") for date in ["2021-01-01", "2022-01-01"]}
+        for path in paths.values():
+            shutil.copy(FIXTURE, path)
+        edited = os.path.join(work_dir, "title-1-2023-01-01.xml")
+        section_n = edit_first_section(FIXTURE, edited)
+        index = SectionIndex.from_files(list(paths.values()) + [edited])
+
+        # Identical snapshots: nothing changed, every DIV skipped
+        changes, skipped = changed_sections(index, "1", "2021-01-01", "2022-01-01")
+        divs = int(((index.titles[index.title_code] == "1") & (index.dates[index.date_code] == "2022-01-01")).sum())
+        if len(changes) or skipped != divs:
+            failures.append(f"identical snapshots gave {len(changes)} changes, {skipped} of {divs} DIVs skipped")
+
+        # One edited section: exactly that section and its ancestors changed,
+        # each by the words added
+        changes, _ = changed_sections(index, "1", "2022-01-01", "2023-01-01")
+        rows = [row for row in range(len(index)) if index.dates[index.date_code[row]] == "2023-01-01"
+                and index.level[row] == 8 and index.n[row] == section_n]
+        expected = []
+        row = rows[0] if rows else -1
+        while row >= 0:
+            expected.append((int(index.level[row]), str(index.n[row])))
+            row = index.parent[row]
+        found = sorted(zip(changes["Level"], changes["N"]))
+        if found != sorted(expected):
+            failures.append(f"edited section {section_n} reported {found}, expected {sorted(expected)}")
+        if set(changes["Status"]) != {"changed"} or set(changes["Delta"]) != {len(ADDED_WORDS.split())}:
+            failures.append(f"edited section gave statuses {set(changes['Status'])}, deltas {set(changes['Delta'])}")
+
+def check_deltas(failures):
+    df = pd.DataFrame([
+        ["1", "CHAPTER I", "AGENCY A", 100, "2022-01-01"],
+        ["1", "CHAPTER II", "AGENCY B", 50, "2022-01-01"],
+        ["1", "CHAPTER I", "AGENCY A", 130, "2023-01-01"],
+        ["1", "CHAPTER II", "AGENCY B", 20, "2023-01-01"],
+        ["1", "CHAPTER III", "AGENCY C", 10, "2023-01-01"],
+    ], columns=COLUMNS)
+
+    totals = snapshot_totals(df)
+    by_key = {(row.Agency, row.Date): row.WordCount for row in totals.itertuples()}
+    if by_key != {("AGENCY A", "2022-01-01"): 100, ("AGENCY B", "2022-01-01"): 50, ("AGENCY A", "2023-01-01"): 130,
+                  ("AGENCY B", "2023-01-01"): 20, ("AGENCY C", "2023-01-01"): 10}:
+        failures.append(f"snapshot_totals gave {by_key}")
+
+    deltas = yearly_deltas(df).set_index("Agency")
+    if set(deltas["Date"]) != {"2023-01-01"}:
+        failures.append(f"deltas cover dates {set(deltas['Date'])}")
+    expected = {"AGENCY A": (30, 30.0), "AGENCY B": (-30, -60.0), "AGENCY C": (10, None)}
+    for agency, (delta, pct) in expected.items():
+        row = deltas.loc[agency]
+        if row["Delta"] != delta or (not pd.isna(row["PctChange"]) if pct is None else row["PctChange"] != pct):
+            failures.append(f"{agency}: delta {row['Delta']} ({row['PctChange']}%), expected {delta} ({pct}%)")
+
+    chapters = yearly_deltas(df, by="chapter")
+    if sorted(chapters["Delta"]) != [-30, 10, 30]:
+        failures.append(f"chapter deltas gave {sorted(chapters['Delta'])}")
+
+def main():
+    failures = []
+    check_changed_sections(failures)
+    check_deltas(failures)
+
+    print("\n[SUMMARY]")
+    print(f"Failures: {len(failures)}")
+    for failure in failures:
+        print(f"[ERROR] {failure}")
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
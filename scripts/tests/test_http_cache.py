@@ -0,0 +1,120 @@
+import os
+import sys
+import asyncio
+import tempfile
+
+# Make the download scripts importable
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(SCRIPTS_DIR, "data"))
+
+from download_data import download_jobs, get_agencies
+from fake_ecfr_server import FakeEcfrServer
+from fetch_plan import FetchJob
+from http_cache import HttpCache
+from refresh_latest import fetch_versions
+from test_incremental_refresh import start_server_thread, stop_server_thread
+
+# Configuration
+TEST_DATE = "2023-01-01"
+TEST_TITLES = [1, 3, 4]
+AGENCIES_PATH = "/api/admin/v1/agencies.json"
+VERSIONS_PATH = "/api/versioner/v1/versions.json"
+
+def check_agencies(server, cache_dir):
+    """agencies.json: fresh hits cost nothing, stale ones a 304, changes a 200."""
+    failures = []
+    server.agencies = [{"name": "Agency A", "cfr_references": [{"title": 1, "chapter": "I"}]}]
+
+    cache = HttpCache(cache_dir)
+    first = get_agencies(server.base_url, cache)
+    second = get_agencies(server.base_url, cache)
+    if first != second or server.requests[AGENCIES_PATH] != 1:
+        failures.append(f"fresh entry was refetched ({server.requests[AGENCIES_PATH]} requests)")
+
+    # A zero TTL makes the stored entry stale, so it is revalidated
+    cache = HttpCache(cache_dir, ttl=0)
+    if get_agencies(server.base_url, cache) != first or cache.stats["revalidated"] != 1:
+        failures.append(f"stale entry was not revalidated: {cache.stats}")
+
+    server.agencies = server.agencies + [{"name": "Agency B", "cfr_references": []}]
+    if len(get_agencies(server.base_url, cache)) != 2 or cache.stats["misses"] != 1:
+        failures.append(f"changed agencies were not refetched: {cache.stats}")
+    if server.requests[AGENCIES_PATH] != 3:
+        failures.append(f"agencies requested {server.requests[AGENCIES_PATH]} times, expected 3")
+    return failures
+
+def check_versions(server, cache_dir):
+    """versions.json through EcfrClient, honouring the server's max-age."""
+    failures = []
+    server.versions = [{"title": title, "date": TEST_DATE} for title in TEST_TITLES]
+    cache = HttpCache(cache_dir)
+    for _ in range(2):
+        versions = asyncio.run(fetch_versions(server.base_url, cache))
+    if versions != server.versions or server.requests[VERSIONS_PATH] != 1:
+        failures.append(f"versions requested {server.requests[VERSIONS_PATH]} times, expected 1")
+
+    # max-age=0 from the server overrides the local TTL
+    server.max_age = 0
+    cache = HttpCache(cache_dir + "-max-age")
+    server.versions = server.versions[:1]
+    asyncio.run(fetch_versions(server.base_url, cache))
+    versions = asyncio.run(fetch_versions(server.base_url, cache))
+    server.max_age = None
+    if versions != server.versions or cache.stats != {"fresh": 0, "revalidated": 1, "misses": 1, "evicted": 0}:
+        failures.append(f"max-age=0 responses were not revalidated: {cache.stats}")
+    return failures
+
+def check_eviction(cache_dir):
+    """Least recently used entries go once the bodies exceed max_bytes."""
+    cache = HttpCache(cache_dir, max_bytes=2500)
+    for name in "abc":
+        cache.store(f"http://example/{name}", None, b"x" * 1000, {})
+        cache.lookup("http://example/a")
+    kept = [name for name in "abc" if cache.lookup(f"http://example/{name}")]
+    if kept != ["a", "c"] or cache.stats["evicted"] != 1:
+        return [f"eviction kept {kept}, expected the recently used a and c"]
+    return []
+
+async def check_revalidate(data_dir):
+    """--revalidate asks about every complete file and keeps unchanged ones."""
+    failures = []
+    server = FakeEcfrServer()
+    base_url = await server.start()
+    jobs = [FetchJob(TEST_DATE, title, None) for title in TEST_TITLES]
+    try:
+        await download_jobs(jobs, data_dir, base_url=base_url, rate_limit=50)
+        mtimes = {name: os.stat(os.path.join(data_dir, name)).st_mtime_ns
+                  for name in os.listdir(data_dir) if name.endswith(".xml")}
+        manifest = await download_jobs(jobs, data_dir, base_url=base_url, revalidate=True, rate_limit=50)
+    finally:
+        await server.stop()
+    if manifest.stats["unchanged"] != len(TEST_TITLES) or sum(server.requests.values()) != 2 * len(TEST_TITLES):
+        failures.append(f"revalidation stats {manifest.stats}, requests {dict(server.requests)}")
+    for name, mtime in mtimes.items():
+        if os.stat(os.path.join(data_dir, name)).st_mtime_ns != mtime:
+            failures.append(f"{name} was rewritten despite a 304")
+    return failures
+
+def main():
+    server = FakeEcfrServer()
+    loop = start_server_thread(server)
+    failures = []
+    try:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            failures += check_agencies(server, os.path.join(cache_dir, "agencies"))
+            failures += check_versions(server, os.path.join(cache_dir, "versions"))
+            failures += check_eviction(os.path.join(cache_dir, "eviction"))
+        with tempfile.TemporaryDirectory() as data_dir:
+            failures += asyncio.run(check_revalidate(data_dir))
+    finally:
+        stop_server_thread(server, loop)
+
+    print("\n[SUMMARY]")
+    print(f"Failures: {len(failures)}")
+    for failure in failures:
+        print(f"[ERROR] {failure}")
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
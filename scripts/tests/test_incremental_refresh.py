@@ -0,0 +1,113 @@
+import os
+import sys
+import asyncio
+import tempfile
+import threading
+
+import pandas as pd
+
+# Make the processing scripts importable
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(SCRIPTS_DIR, "data"))
+
+from process_xml import process_xml
+from refresh_latest import refresh
+from results_store import ResultsStore
+from fake_ecfr_server import FakeEcfrServer
+
+# Configuration
+TEST_TITLES = [1, 3, 4]
+
+def start_server_thread(server):
+    """Run the fake server on its own event loop so refresh() can use asyncio.run."""
+    loop = asyncio.new_event_loop()
+    ready = threading.Event()
+
+    def run():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(server.start())
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    ready.wait()
+    return loop
+
+def stop_server_thread(server, loop):
+    asyncio.run_coroutine_threadsafe(server.stop(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+
+def xml_requests(server):
+    """Titles fetched from the full/ endpoint so far."""
+    return sum(count for url, count in server.requests.items() if url.endswith(".xml"))
+
+def main():
+    server = FakeEcfrServer()
+    server.versions = [{"title": title, "date": "2023-01-01"} for title in TEST_TITLES]
+    loop = start_server_thread(server)
+    failures = []
+
+    try:
+        with tempfile.TemporaryDirectory() as data_dir:
+            # First run: nothing recorded yet, so every title is fetched
+            refreshed = refresh(data_dir, base_url=server.base_url)
+            if refreshed != [str(title) for title in TEST_TITLES]:
+                failures.append(f"first run refreshed {refreshed}")
+            chapter_file = os.path.join(data_dir, "output_chapter.xlsx")
+            before = pd.read_excel(chapter_file, dtype={"Title": str})
+
+            # Second run: no new versions, so nothing is fetched
+            fetched = xml_requests(server)
+            refreshed = refresh(data_dir, base_url=server.base_url)
+            if refreshed or xml_requests(server) != fetched:
+                failures.append(f"unchanged run refreshed {refreshed}")
+
+            # An earlier year of title 3 kept in the same workbook must survive
+            # the refresh of its latest snapshot
+            history = before[before["Title"] == "3"].assign(Date="2022-01-01", WordCount=7)
+            before = pd.concat([before, history], ignore_index=True)
+            before.to_excel(chapter_file, index=False)
+
+            # Third run: only title 3 was amended
+            server.versions.append({"title": 3, "date": "2023-06-01"})
+            refreshed = refresh(data_dir, base_url=server.base_url)
+            if refreshed != ["3"] or xml_requests(server) != fetched + 1:
+                failures.append(f"amended run refreshed {refreshed}")
+            if os.path.exists(os.path.join(data_dir, "title-3-2023-01-01.xml")):
+                failures.append("superseded title 3 XML was not removed")
+
+            after = pd.read_excel(chapter_file, dtype={"Title": str, "Date": str})
+            untouched = before[before["Title"] != "3"].reset_index(drop=True)
+            if not after[after["Title"] != "3"].reset_index(drop=True).equals(untouched):
+                failures.append("rows of unchanged titles were modified")
+            title_3 = after[after["Title"] == "3"]
+            expected = process_xml(os.path.join(data_dir, "title-3-2023-06-01.xml"))
+            if title_3[title_3["Date"] == "2023-06-01"]["WordCount"].tolist() != [row[3] for row in expected]:
+                failures.append("title 3 rows were not recomputed")
+            if (title_3["Date"] == "2023-01-01").any():
+                failures.append("superseded title 3 rows were kept")
+            kept = title_3[title_3["Date"] == "2022-01-01"]
+            if len(kept) != len(history) or (kept["WordCount"] != 7).any():
+                failures.append(f"title 3 history kept {len(kept)} of {len(history)} rows")
+
+            # Fourth run: title 3 amended again. The store, like the XML
+            # directory, holds only the latest snapshot of each title
+            server.versions.append({"title": 3, "date": "2023-09-01"})
+            refresh(data_dir, base_url=server.base_url)
+            with ResultsStore(os.path.join(data_dir, "results.sqlite")) as store:
+                stored = dict(store.conn.execute("SELECT title, GROUP_CONCAT(DISTINCT date) FROM word_counts "
+                                                 "GROUP BY title").fetchall())
+            if stored != {"1": "2023-01-01", "3": "2023-09-01", "4": "2023-01-01"}:
+                failures.append(f"results store holds snapshots {stored}")
+    finally:
+        stop_server_thread(server, loop)
+
+    print("\n[SUMMARY]")
+    print(f"Title XML requests: {xml_requests(server)}")
+    for failure in failures:
+        print(f"[ERROR] {failure}")
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import os
+import sys
+import json
+import argparse
+import tempfile
+
+# Make the processing scripts importable
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(SCRIPTS_DIR, "data"))
+
+from metrics import METRICS, Metrics, add_metrics_arguments, instrumented_run
+
+def sample_metrics():
+    """A registry with a labelled counter, a gauge and a three-value histogram."""
+    metrics = Metrics()
+    metrics.inc("http_requests_total", status=200)
+    metrics.inc("http_requests_total", 2, status=200)
+    metrics.inc("http_requests_total", status=404)
+    metrics.inc("parsed_files_total", title='say "hi"\n')
+    metrics.set("queue_depth", 4)
+    for seconds in [0.003, 0.2, 120.0]:
+        metrics.observe("file_parse_seconds", seconds, engine="fast")
+    return metrics
+
+def check_prometheus(failures):
+    lines = sample_metrics().to_prometheus().splitlines()
+    expected = [
+        "# TYPE http_requests_total counter",
+        'http_requests_total{status="200"} 3',
+        'http_requests_total{status="404"} 1',
+        'parsed_files_total{title="say \\"hi\\"\\n"} 1',
+        "# TYPE queue_depth gauge",
+        "queue_depth 4",
+        "# TYPE file_parse_seconds histogram",
+        'file_parse_seconds_bucket{engine="fast",le="0.005"} 1',
+        'file_parse_seconds_bucket{engine="fast",le="0.25"} 2',
+        'file_parse_seconds_bucket{engine="fast",le="60.0"} 2',
+        'file_parse_seconds_bucket{engine="fast",le="300.0"} 3',
+        'file_parse_seconds_bucket{engine="fast",le="+Inf"} 3',
+        'file_parse_seconds_sum{engine="fast"} 120.203',
+        'file_parse_seconds_count{engine="fast"} 3',
+    ]
+    for line in expected:
+        if line not in lines:
+            failures.append(f"Prometheus output lacks {line!r}")
+    if lines.index("# TYPE file_parse_seconds histogram") > lines.index('file_parse_seconds_count{engine="fast"} 3'):
+        failures.append("histogram TYPE line follows its samples")
+
+def check_jsonl(failures):
+    with tempfile.TemporaryDirectory() as work_dir:
+        path = os.path.join(work_dir, "metrics.jsonl")
+        metrics = sample_metrics()
+        metrics.write(path)
+        metrics.write(path)
+        with open(path, "r", encoding="utf-8") as f:
+            records = [json.loads(line) for line in f]
+
+    # Each write appends one record per series
+    if len(records) != 10:
+        failures.append(f"two JSONL writes gave {len(records)} records, expected 10")
+    by_name = {(record["name"], json.dumps(record["labels"], sort_keys=True)): record for record in records[:5]}
+    counter = by_name.get(("http_requests_total", '{"status": "200"}'), {})
+    if counter.get("type") != "counter" or counter.get("value") != 3:
+        failures.append(f"JSONL counter record {counter}")
+    histogram = by_name.get(("file_parse_seconds", '{"engine": "fast"}'), {})
+    if (histogram.get("count"), histogram.get("min"), histogram.get("max")) != (3, 0.003, 120.0) \
+            or histogram.get("buckets", [[None]])[-1] != ["+Inf", 3]:
+        failures.append(f"JSONL histogram record {histogram}")
+
+def check_reset(failures):
+    metrics = sample_metrics()
+    metrics.reset()
+    if metrics.counters or metrics.gauges or metrics.histograms or metrics.to_prometheus() != "\n":
+        failures.append("reset() left series behind")
+
+def check_instrumented_run(failures):
+    parser = argparse.ArgumentParser()
+    add_metrics_arguments(parser)
+    with tempfile.TemporaryDirectory() as work_dir:
+        path = os.path.join(work_dir, "run.prom")
+        profile_path = os.path.join(work_dir, "run.prof")
+        args = parser.parse_args(["--metrics", path, "--profile", profile_path])
+
+        # The body's own series and its stage timer are saved
+        METRICS.reset()
+        with instrumented_run(args, "sample") as metrics:
+            metrics.inc("sample_items_total", 5)
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+        for line in ["sample_items_total 5", 'stage_seconds_count{stage="sample"} 1']:
+            if line not in text.splitlines():
+                failures.append(f"instrumented_run metrics lack {line!r}")
+        if not os.path.exists(profile_path):
+            failures.append("instrumented_run did not save the profile")
+
+        # ... even when the body fails
+        METRICS.reset()
+        os.remove(path)
+        try:
+            with instrumented_run(args, "failing"):
+                METRICS.inc("sample_items_total")
+                raise RuntimeError("failing")
+        except RuntimeError:
+            pass
+        if not os.path.exists(path):
+            failures.append("instrumented_run did not save metrics after a failure")
+        else:
+            with open(path, "r", encoding="utf-8") as f:
+                if 'stage_seconds_count{stage="failing"} 1' not in f.read():
+                    failures.append("failed run's stage timer was not saved")
+        METRICS.reset()
+
+def main():
+    failures = []
+    check_prometheus(failures)
+    check_jsonl(failures)
+    check_reset(failures)
+    check_instrumented_run(failures)
+
+    print("\n[SUMMARY]")
+    print(f"Failures: {len(failures)}")
+    for failure in failures:
+        print(f"[ERROR] {failure}")
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
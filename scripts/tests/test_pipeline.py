@@ -0,0 +1,122 @@
+import os
+import sys
+import asyncio
+import tempfile
+
+# Make the processing scripts importable
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(SCRIPTS_DIR, "data"))
+
+from fetch_plan import FetchJob
+from pipeline import Pipeline, Stage, run_stages
+from process_xml import COUNTING_VERSION, process_files
+from row_cache import RowCache
+from fake_ecfr_server import FakeEcfrServer
+
+async def run_pipeline(data_dir, workers=2, queue_size=None, cache=None):
+    """Fetch every fixture title from a slow fake server and run the whole pipeline on it."""
+    server = FakeEcfrServer(latency=0.05, bandwidth=4 << 20).load_fixtures()
+    base_url = await server.start()
+    jobs = [FetchJob(version["date"], str(version["title"]), None) for version in server.versions]
+    pipeline = Pipeline(jobs, data_dir, base_url, workers=workers, queue_size=queue_size, cache=cache, concurrency=4,
+                        store_path=os.path.join(data_dir, "results.sqlite"),
+                        agencies_path=os.path.join(data_dir, "agencies.json"), rate_limit=0, backoff=0.01)
+    try:
+        await pipeline.run()
+    finally:
+        await server.stop()
+    return pipeline, len(jobs)
+
+async def broken_files(data_dir):
+    """
+    Parse truncated XML with one worker and a one-file queue: the run must
+    fail with the parse error instead of leaving fetch waiting on the queue.
+    """
+    for title in [91, 92, 93]:
+        with open(os.path.join(data_dir, f"title-{title}-2023-01-01.xml"), "w", encoding="utf-8") as f:
+            f.write("<not xml")
+    pipeline = Pipeline([], data_dir, "http://127.0.0.1:9", workers=1, queue_size=1,
+                        store_path=os.path.join(data_dir, "results.sqlite"))
+    try:
+        await asyncio.wait_for(pipeline.run(), timeout=60)
+    except asyncio.TimeoutError:
+        return "hung"
+    except Exception as e:
+        return type(e).__name__
+    return None
+
+async def failing_graph():
+    """A graph whose middle stage fails: the stage after it must not run."""
+    ran = []
+
+    def stage(name, fail=False):
+        async def run():
+            ran.append(name)
+            if fail:
+                raise RuntimeError(name)
+        return run
+
+    try:
+        await run_stages([Stage("first", stage("first"), []), Stage("second", stage("second", True), ["first"]),
+                          Stage("third", stage("third"), ["second"])])
+    except RuntimeError:
+        return ran
+    return None
+
+def main():
+    failures = []
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        pipeline, jobs = asyncio.run(run_pipeline(data_dir, queue_size=1))
+        if pipeline.counts["fetched"] != jobs or pipeline.counts["failed"]:
+            failures.append(f"fetched {pipeline.counts['fetched']} of {jobs} titles")
+
+        # Same rows as parsing the downloaded files after the fact
+        expected, _ = process_files(list(pipeline.results))
+        if pipeline.results != expected:
+            failures.append("pipeline rows differ from process_files")
+        if list(pipeline.results) != sorted(pipeline.results):
+            failures.append("results are not in sorted filename order")
+
+        # Parsing overlapped downloading, and the queue stayed bounded
+        spans = pipeline.spans
+        if pipeline.first_parsed is None or pipeline.first_parsed >= spans["fetch"][1]:
+            failures.append(f"first file parsed at {pipeline.first_parsed}, after fetching ended "
+                            f"at {spans['fetch'][1]:.2f}s")
+        if pipeline.peak_queue > 1:
+            failures.append(f"queue held {pipeline.peak_queue} files with queue_size 1")
+        if spans["aggregate"][0] < spans["parse"][1] or spans["export"][0] < spans["aggregate"][1]:
+            failures.append(f"stages ran out of order: {spans}")
+
+        for name in ["results.sqlite", "output_chapter.xlsx", "output_agency_words.xlsx", "dashboard_bundle.json"]:
+            if not os.path.exists(os.path.join(data_dir, name)):
+                failures.append(f"{name} was not written")
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        # With a row cache, a second run parses nothing and returns the same rows
+        cache_dir = os.path.join(data_dir, ".cache", "rows")
+        first, _ = asyncio.run(run_pipeline(data_dir, cache=RowCache(cache_dir, COUNTING_VERSION)))
+        second, jobs = asyncio.run(run_pipeline(data_dir, cache=RowCache(cache_dir, COUNTING_VERSION)))
+        if second.counts["cache_hits"] != jobs or second.timings or second.results != first.results:
+            failures.append(f"cached run hit {second.counts['cache_hits']} of {jobs} titles, "
+                            f"parsed {len(second.timings)}")
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        outcome = asyncio.run(broken_files(data_dir))
+        if outcome in ["hung", None]:
+            failures.append(f"pipeline over broken XML {'hung' if outcome else 'did not fail'}")
+
+    ran = asyncio.run(failing_graph())
+    if ran != ["first", "second"]:
+        failures.append(f"failing graph ran {ran}")
+
+    print("\n[SUMMARY]")
+    print("Stages: " + ", ".join(f"{name} {start:.2f}-{end:.2f}s" for name, (start, end) in spans.items()))
+    print(f"Failures: {len(failures)}")
+    for failure in failures:
+        print(f"[ERROR] {failure}")
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import os
+import sys
+import glob
+import time
+
+# Make the processing scripts importable
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(SCRIPTS_DIR, "data"))
+
+from process_xml import ENGINES, process_files, process_xml
+
+# Configuration
+DATA_DIR = os.path.join(os.path.dirname(SCRIPTS_DIR), "docs", "data")
+
+def compare_engines(file_path):
+    """Run every word-count engine on one file and compare its rows with bs4's."""
+    rows, times = {}, {}
+    for engine in ["bs4"] + sorted(set(ENGINES) - {"bs4"}):
+        start = time.perf_counter()
+        rows[engine] = process_xml(file_path, engine)
+        times[engine] = time.perf_counter() - start
+
+    timings = ", ".join(f"{engine} {seconds:.2f}s" for engine, seconds in times.items())
+    print(f"[INFO] {os.path.basename(file_path)}: {len(rows['bs4'])} rows, {timings}")
+    ok = True
+    for engine, engine_rows in rows.items():
+        if engine_rows != rows["bs4"]:
+            print(f"[ERROR] {engine} disagrees with bs4 on {file_path}")
+            print(f"  bs4:  {rows['bs4']}")
+            print(f"  {engine}: {engine_rows}")
+            ok = False
+    return ok
+
+def compare_workers(files, workers=3):
+    """Process every file serially and with a worker pool; the results must match exactly."""
+    serial, serial_timings = process_files(files, workers=1)
+    pooled, pooled_timings = process_files(files, workers=workers)
+    print(f"[INFO] process_files: {sum(len(rows) for rows in serial.values())} rows with 1 and {workers} workers")
+    ok = True
+    if list(pooled) != list(serial) or sorted(pooled_timings) != sorted(serial_timings):
+        print(f"[ERROR] {workers} workers returned files {list(pooled)}, one worker {list(serial)}")
+        ok = False
+    for file_path, rows in serial.items():
+        if pooled.get(file_path) != rows:
+            print(f"[ERROR] {workers} workers disagree with one worker on {file_path}")
+            ok = False
+    return ok
+
+def main():
+    files = sorted(glob.glob(os.path.join(DATA_DIR, "ECFR-title*.xml")))
+    if not files:
+        print(f"[ERROR] No bundled XML files found in {DATA_DIR}")
+        return
+
+    mismatches = [f for f in files if not compare_engines(f)]
+    if not compare_workers(files):
+        mismatches.append("process_files workers")
+
+    print("\n[SUMMARY]")
+    print(f"Files compared: {len(files)}")
+    print(f"Mismatches: {len(mismatches)}")
+    if mismatches:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import os
+import sys
+import tempfile
+
+# Make the processing scripts importable
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(SCRIPTS_DIR, "data"))
+
+from results_store import ResultsStore
+
+def stored(path):
+    with ResultsStore(path) as store:
+        df = store.chapter_rows()
+    return sorted(map(tuple, df[["Title", "Chapter", "Agency", "WordCount", "Date"]].values.tolist()))
+
+def main():
+    failures = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        path = os.path.join(work_dir, "results.sqlite")
+
+        # First run: title 1 has chapters I and II; title 2 is written too
+        with ResultsStore(path) as store:
+            store.upsert_rows([["1", "I", "A", 10, "2023-01-01"], ["1", "II", "B", 5, "2023-01-01"],
+                               ["1", "I", "A", 1, "2022-01-01"]], "title-1.xml")
+            store.upsert_rows([["2", "I", "C", 7, "2023-01-01"]], "title-2.xml")
+
+        # Rerun: chapter II of title 1 is gone and chapter I changed. A
+        # chapter-scoped download of the same title and date in the same run
+        # is summed with it, as the spreadsheet totals would be.
+        with ResultsStore(path) as store:
+            store.upsert_rows([["1", "I", "A", 12, "2023-01-01"], ["1", "I", "A", 3, "2023-01-01"]], "title-1.xml")
+            store.upsert_rows([["1", "I", "A", 4, "2023-01-01"]], "title-1-chapter-I.xml")
+
+        expected = [("1", "I", "A", 1, "2022-01-01"), ("1", "I", "A", 19, "2023-01-01"),
+                    ("2", "I", "C", 7, "2023-01-01")]
+        if stored(path) != expected:
+            failures.append(f"store holds {stored(path)}, expected {expected}")
+
+        # Another run replaces the summed rows rather than adding to them
+        with ResultsStore(path) as store:
+            store.upsert_rows([["1", "I", "A", 15, "2023-01-01"]], "title-1.xml")
+        if ("1", "I", "A", 15, "2023-01-01") not in stored(path):
+            failures.append(f"second rerun left {stored(path)}")
+
+    print("\n[SUMMARY]")
+    print(f"Failures: {len(failures)}")
+    for failure in failures:
+        print(f"[ERROR] {failure}")
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
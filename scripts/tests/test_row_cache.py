@@ -0,0 +1,115 @@
+import os
+import sys
+import shutil
+import tempfile
+
+# Make the processing scripts importable
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(SCRIPTS_DIR, "data"))
+
+import process_xml
+from process_xml import COUNTING_VERSION, process_files
+from row_cache import DEFAULT_CACHE_DIR, RowCache
+
+# Configuration
+DATA_DIR = os.path.join(os.path.dirname(SCRIPTS_DIR), "docs", "data")
+FIXTURES = {"1": "ECFR-title1.xml", "3": "ECFR-title3.xml", "4": "ECFR-title4.xml"}
+
+def copy_fixtures(xml_dir):
+    paths = []
+    for title, fixture in FIXTURES.items():
+        paths.append(os.path.join(xml_dir, f"title-{title}-2023-01-01.xml"))
+        shutil.copy(os.path.join(DATA_DIR, fixture), paths[-1])
+    return paths
+
+def cached_entries(cache_dir):
+    return [name for name in os.listdir(cache_dir) if name.endswith(".json.gz")] if os.path.isdir(cache_dir) else []
+
+def check_hits_and_misses(failures):
+    with tempfile.TemporaryDirectory() as work_dir:
+        cache_dir = os.path.join(work_dir, "cache")
+        paths = copy_fixtures(work_dir)
+        expected, _ = process_files(paths)
+
+        # First run parses and stores every file, the second parses none
+        cache = RowCache(cache_dir, COUNTING_VERSION)
+        first, _ = process_files(paths, cache=cache)
+        if cache.stats["misses"] != len(paths) or cache.stats["stores"] != len(paths):
+            failures.append(f"first run: {cache.stats}")
+        cache = RowCache(cache_dir, COUNTING_VERSION)
+        second, timings = process_files(paths, cache=cache)
+        if cache.stats["stat_hits"] != len(paths) or timings:
+            failures.append(f"second run: {cache.stats}, parsed {sorted(timings)}")
+        if first != expected or second != expected:
+            failures.append("cached rows differ from parsed rows")
+
+        # Same bytes with a new mtime: found by content hash
+        os.utime(paths[0], ns=(0, 0))
+        cache = RowCache(cache_dir, COUNTING_VERSION)
+        process_files(paths, cache=cache)
+        if cache.stats["hash_hits"] != 1 or cache.stats["misses"]:
+            failures.append(f"touched file: {cache.stats}")
+
+        # Changed content misses
+        with open(paths[1], "a", encoding="utf-8") as f:
+            f.write("\n")
+        cache = RowCache(cache_dir, COUNTING_VERSION)
+        _, timings = process_files(paths, cache=cache)
+        if cache.stats["misses"] != 1 or sorted(timings) != [paths[1]]:
+            failures.append(f"edited file: {cache.stats}, parsed {sorted(timings)}")
+
+        # So does every file under another counting version
+        cache = RowCache(cache_dir, COUNTING_VERSION + "-next")
+        _, timings = process_files(paths, cache=cache)
+        if cache.stats["misses"] != len(paths) or len(timings) != len(paths):
+            failures.append(f"new counting version: {cache.stats}")
+
+        # Identical content under another name is a hit, restamped with
+        # that name's title and date
+        renamed = os.path.join(work_dir, "title-99-2024-06-01.xml")
+        shutil.copy(paths[0], renamed)
+        cache = RowCache(cache_dir, COUNTING_VERSION)
+        results, timings = process_files([renamed], cache=cache)
+        rows = results[renamed]
+        if timings or cache.stats["hash_hits"] != 1:
+            failures.append(f"renamed copy: {cache.stats}, parsed {sorted(timings)}")
+        if {(row[0], row[4]) for row in rows} != {("99", "2024-06-01")}:
+            failures.append(f"renamed copy rows stamped {sorted({(row[0], row[4]) for row in rows})}")
+        if [row[1:4] for row in rows] != [row[1:4] for row in expected[paths[0]]]:
+            failures.append("renamed copy rows differ beyond title and date")
+
+def check_clear_cache(failures):
+    """--clear-cache empties the cache; --no-cache then leaves it empty."""
+    cwd = os.getcwd()
+    argv = sys.argv
+    with tempfile.TemporaryDirectory() as work_dir:
+        try:
+            os.chdir(work_dir)
+            os.makedirs("data")
+            copy_fixtures("data")
+            sys.argv = ["process_xml.py", "--no-excel"]
+            process_xml.main()
+            if len(cached_entries(DEFAULT_CACHE_DIR)) != len(FIXTURES):
+                failures.append(f"cached run left {cached_entries(DEFAULT_CACHE_DIR)}")
+            sys.argv = ["process_xml.py", "--no-excel", "--clear-cache", "--no-cache"]
+            process_xml.main()
+            if cached_entries(DEFAULT_CACHE_DIR) or os.path.exists(os.path.join(DEFAULT_CACHE_DIR, "index.json")):
+                failures.append(f"--clear-cache left {os.listdir(DEFAULT_CACHE_DIR)}")
+        finally:
+            os.chdir(cwd)
+            sys.argv = argv
+
+def main():
+    failures = []
+    check_hits_and_misses(failures)
+    check_clear_cache(failures)
+
+    print("\n[SUMMARY]")
+    print(f"Failures: {len(failures)}")
+    for failure in failures:
+        print(f"[ERROR] {failure}")
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import os
+import sys
+import glob
+import shutil
+import tempfile
+
+import numpy as np
+
+# Make the processing scripts importable
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(SCRIPTS_DIR, "data"))
+
+from process_xml import process_xml
+from section_index import MAX_LEVEL, SectionIndex
+
+# Configuration
+DATA_DIR = os.path.join(os.path.dirname(SCRIPTS_DIR), "docs", "data")
+
+def main():
+    failures = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        # Copy the fixtures under downloader-style names
+        file_paths = []
+        for fixture in sorted(glob.glob(os.path.join(DATA_DIR, "ECFR-title*.xml"))):
+            title = os.path.basename(fixture)[len("ECFR-title"):-len(".xml")]
+            file_paths.append(os.path.join(work_dir, f"title-{title}-2023-01-01.xml"))
+            shutil.copy(fixture, file_paths[-1])
+        index = SectionIndex.from_files(file_paths, workers=2)
+
+        # Rolled up to DIV3, every file reproduces its process_xml chapter counts
+        for file_path in file_paths:
+            title = os.path.basename(file_path).split("-")[1]
+            expected = [row[3] for row in process_xml(file_path)]
+            rollup = index.rollup(3, title=title, date="2023-01-01")["WordCount"].tolist()
+            if rollup != expected:
+                failures.append(f"{os.path.basename(file_path)}: DIV3 rollup {rollup[:5]}..., "
+                                f"process_xml {expected[:5]}...")
+
+        # Parents and ancestors always sit at shallower levels
+        has_parent = index.parent >= 0
+        if (index.level[index.parent[has_parent]] >= index.level[has_parent]).any():
+            failures.append("a DIV's parent is not at a shallower level")
+        for level in range(1, MAX_LEVEL + 1):
+            owners = index.ancestors[:, level]
+            own = index.level == level
+            if (owners[own] != np.flatnonzero(own)).any():
+                failures.append(f"level-{level} DIVs are not their own level-{level} ancestor")
+            inside = (owners >= 0) & ~own
+            if (index.level[owners[inside]] != level).any() or (index.level[inside] <= level).any():
+                failures.append(f"level-{level} ancestors are not at level {level} above their rows")
+
+        # save/load round-trips every array
+        path = os.path.join(work_dir, "sections.npz")
+        index.save(path)
+        loaded = SectionIndex.load(path)
+        if set(loaded.arrays) != set(index.arrays):
+            failures.append(f"loaded arrays {sorted(loaded.arrays)}, saved {sorted(index.arrays)}")
+        for name, value in index.arrays.items():
+            if name in loaded.arrays and not np.array_equal(loaded.arrays[name], value):
+                failures.append(f"{name} changed in a save/load round trip")
+        if not loaded.rollup(5).equals(index.rollup(5)):
+            failures.append("rollup changed after a save/load round trip")
+
+    print("\n[SUMMARY]")
+    print(f"Files: {len(file_paths)}, DIVs: {len(index)}")
+    print(f"Failures: {len(failures)}")
+    for failure in failures:
+        print(f"[ERROR] {failure}")
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
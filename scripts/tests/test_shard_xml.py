@@ -0,0 +1,67 @@
+import os
+import sys
+import glob
+import shutil
+import tempfile
+
+# Make the processing scripts importable
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(SCRIPTS_DIR, "data"))
+
+from process_xml import process_files, process_xml
+from shard_xml import SHARD_ENGINES, load_plan, merge_shard_rows, plan_shards, process_shard, save_plan
+
+# Configuration
+DATA_DIR = os.path.join(os.path.dirname(SCRIPTS_DIR), "docs", "data")
+SHARD_SIZES = [20_000, 150_000]    # Small enough to split chapters at DIV5 boundaries
+
+def main():
+    failures = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        # Copy the fixtures under downloader-style names
+        file_paths = []
+        for fixture in sorted(glob.glob(os.path.join(DATA_DIR, "ECFR-title*.xml"))):
+            title = os.path.basename(fixture)[len("ECFR-title"):-len(".xml")]
+            file_paths.append(os.path.join(work_dir, f"title-{title}-2023-01-01.xml"))
+            shutil.copy(fixture, file_paths[-1])
+
+        split_parts = 0
+        for file_path in file_paths:
+            expected = process_xml(file_path)
+            for shard_bytes in SHARD_SIZES:
+                shards = plan_shards(file_path, shard_bytes)
+                if not shards:
+                    continue
+                split_parts += sum(not piece.whole for shard in shards for piece in shard.pieces)
+
+                # A plan survives the round trip through JSON, as when shards run elsewhere
+                plan_path = os.path.join(work_dir, "plan.json")
+                save_plan(shards, plan_path)
+                if load_plan(plan_path) != shards:
+                    failures.append(f"{file_path}: plan changed when saved and loaded")
+
+                for engine in sorted(SHARD_ENGINES):
+                    rows = merge_shard_rows(file_path, [process_shard(shard, engine) for shard in shards])
+                    if rows != expected:
+                        failures.append(f"{os.path.basename(file_path)}: {engine} with {len(shards)} "
+                                        f"shards of {shard_bytes} bytes differs from the whole file")
+            print(f"[INFO] {os.path.basename(file_path)}: {len(expected)} chapters")
+        if not split_parts:
+            failures.append("no chapter was split at DIV5 boundaries")
+
+        # Sharded work units through the process pool give the same results
+        expected, _ = process_files(file_paths, workers=1)
+        sharded, _ = process_files(file_paths, workers=2, shard_bytes=SHARD_SIZES[1])
+        if sharded != expected:
+            failures.append("process_files with shards differs from whole files")
+
+    print("\n[SUMMARY]")
+    print(f"Files: {len(file_paths)}, chapters split into DIV5 pieces: {split_parts}")
+    print(f"Failures: {len(failures)}")
+    for failure in failures:
+        print(f"[ERROR] {failure}")
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,16 @@
 import requests
 from bs4 import BeautifulSoup
 import os
+import sys
 import pandas as pd
 from datetime import datetime
 
+# Share combine_rows with the processing script
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data"))
+from process_xml import combine_rows
+
 # Update this to the correct API base URL
-BASE_URL = "https://www.ecfr.gov"
+BASE_URL = os.environ.get("ECFR_BASE_URL", "https://www.ecfr.gov")  # Or a fake_ecfr_server.py URL
 
 def get_latest_date():
     """Get the latest available date from the eCFR API."""
@@ -57,29 +62,6 @@ def process_xml(file_path):
 
     return data
 
-def combine_rows(df):
-    """Combine rows where one agency is contained within another."""
-    # Group by 'Title' and 'Chapter'
-    grouped = df.groupby(['Title', 'Chapter'])
-
-    # Iterate through groups
-    combined_data = []
-    for name, group in grouped:
-        # Find rows where 'Agency' is fully contained in another row
-        for i in range(len(group)):
-            for j in range(i + 1, len(group)):
-                if group.iloc[i]['Agency'] in group.iloc[j]['Agency'] and group.iloc[i]['Agency'] != group.iloc[j]['Agency']:
-                    # Add WordCounts and update the longer row
-                    group.loc[group.index[i], 'WordCount'] += group.loc[group.index[j], 'WordCount']
-                    group.loc[group.index[j], 'WordCount'] = -1  # Mark for deletion
-
-        # Remove rows marked for deletion
-        combined_data.extend(group[group['WordCount'] != -1].values.tolist())
-
-    # Create a new DataFrame from the combined data
-    combined_df = pd.DataFrame(combined_data, columns=df.columns)
-    return combined_df
-
 def main():
     # Create test directory
     test_dir = "test_output"
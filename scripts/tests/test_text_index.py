@@ -0,0 +1,103 @@
+import os
+import re
+import sys
+import glob
+import shutil
+import tempfile
+from collections import Counter
+
+from lxml import etree
+
+# Make the processing scripts importable
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(SCRIPTS_DIR, "data"))
+
+from agency_lookup import AgencyLookup
+from process_xml import process_files
+from text_index import TextIndex, build_text_index, tokenize
+
+# Configuration
+DATA_DIR = os.path.join(os.path.dirname(SCRIPTS_DIR), "docs", "data")
+TERMS = ["the", "shall", "agency", "section", "nonexistentterm"]
+PHRASES = ["federal register", "small business", "shall not", "of the", "the the"]
+
+def paragraph_tokens(file_path):
+    """Token lists of every outermost P inside a DIV3, keyed by section, parsed independently."""
+    sections = {}
+    tree = etree.parse(file_path)
+    for p in tree.iter("P"):
+        ancestors = list(p.iterancestors())
+        if not any(a.tag == "DIV3" for a in ancestors) or any(a.tag == "P" for a in ancestors):
+            continue
+        key = tuple(next((a.get("N", "") for a in ancestors if a.tag == tag), "") for tag in ("DIV3", "DIV5", "DIV8"))
+        sections.setdefault(key, []).append(tokenize("".join(p.itertext())))
+    return sections
+
+def main():
+    failures = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        # Copy the fixtures under downloader-style names
+        file_paths = []
+        for fixture in sorted(glob.glob(os.path.join(DATA_DIR, "ECFR-title*.xml"))):
+            title = os.path.basename(fixture)[len("ECFR-title"):-len(".xml")]
+            file_paths.append(os.path.join(work_dir, f"title-{title}-2023-01-01.xml"))
+            shutil.copy(fixture, file_paths[-1])
+
+        # Word counts come out of the indexing pass unchanged
+        index_path = os.path.join(work_dir, "text_index.npz")
+        results, _ = build_text_index(file_paths, index_path)
+        expected, _ = process_files(file_paths)
+        if results != expected:
+            failures.append("rows from the indexing pass differ from process_files")
+        index = TextIndex.load(index_path)
+
+        # Brute-force counts per (title, chapter, part, section)
+        term_counts, phrase_counts = Counter(), Counter()
+        for file_path in file_paths:
+            title = results[file_path][0][0] if results[file_path] else ""
+            for key, paragraphs in paragraph_tokens(file_path).items():
+                for tokens in paragraphs:
+                    for term in TERMS:
+                        term_counts[(term, title) + key] += tokens.count(term)
+                    text = " ".join(tokens)
+                    for phrase in PHRASES:
+                        # Overlapping matches, as the index counts them
+                        phrase_counts[(phrase, title) + key] += len(re.findall(rf"(?=\b{phrase}\b)", text))
+
+        def check(query, counts):
+            found = index.search(query)
+            got = {(query, row.Title, row.Chapter, row.Part, row.Section): row.Count
+                   for row in found.itertuples(index=False)}
+            want = {key: count for key, count in counts.items() if key[0] == query and count}
+            if got != want:
+                failures.append(f"{query!r}: {sum(got.values())} occurrences in {len(got)} sections, "
+                                f"expected {sum(want.values())} in {len(want)}")
+        for term in TERMS:
+            check(term, term_counts)
+        for phrase in PHRASES:
+            check(phrase, phrase_counts)
+
+        # Frequencies per group add up to the search results, and agencies
+        # are attributed through an AgencyLookup like agency_totals
+        total = index.search("section")["Count"].sum()
+        for by in ("agency", "title", "chapter", "date"):
+            if index.frequency("section", by)["Count"].sum() != total:
+                failures.append(f"frequency by {by} does not add up to {total}")
+        title = index.titles[0]
+        lookup = AgencyLookup.from_agencies([{"name": "Test Agency", "cfr_references": [{"title": int(title)}]}])
+        attributed = index.frequency("section", "agency", lookup)
+        in_title = index.search("section").query("Title == @title")["Count"].sum()
+        test_agency = attributed.loc[attributed["Agency"] == "Test Agency", "Count"].sum()
+        if test_agency != in_title:
+            failures.append(f"Test Agency has {test_agency} occurrences, expected {in_title} in title {title}")
+
+    print("\n[SUMMARY]")
+    print(f"Files: {len(file_paths)}, terms: {len(index.terms)}, documents: {len(index)}")
+    print(f"Failures: {len(failures)}")
+    for failure in failures:
+        print(f"[ERROR] {failure}")
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import os
+import sys
+import glob
+import random
+
+# Make the processing scripts importable
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(SCRIPTS_DIR, "data"))
+
+from lxml import etree
+
+from word_count import WHITESPACE, WordCounter, count_words, count_words_utf8
+
+# Configuration
+DATA_DIR = os.path.join(os.path.dirname(SCRIPTS_DIR), "docs", "data")
+RANDOM_CASES = 2000
+
+def check_whitespace_table():
+    """The table must hold every character str.isspace() accepts."""
+    expected = [chr(code) for code in range(sys.maxunicode + 1) if chr(code).isspace()]
+    if WHITESPACE != expected:
+        return [f"whitespace table differs from str.isspace(): {sorted(set(expected) ^ set(WHITESPACE))}"]
+    return []
+
+def check_random_text():
+    """Random mixes of words, ASCII and Unicode whitespace and multi-byte letters."""
+    rng = random.Random(13)
+    alphabet = WHITESPACE + list("abc§—é中") + ["Â", "‐", "、"]
+    failures = []
+    for _ in range(RANDOM_CASES):
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 40)))
+        if count_words_utf8(text.encode("utf-8")) != count_words(text):
+            failures.append(f"count mismatch for {text!r}")
+    return failures
+
+def check_bundled_paragraphs():
+    """Batched counts over every <P> of the bundled titles match str.split()."""
+    failures = []
+    for file_path in sorted(glob.glob(os.path.join(DATA_DIR, "ECFR-title*.xml"))):
+        expected = 0
+        counter = WordCounter(batch_size=1 << 16)
+        for _, elem in etree.iterparse(file_path, events=("end",), tag="P"):
+            expected += count_words("".join(elem.itertext()))
+            counter.add(etree.tostring(elem, method="text", encoding="utf-8", with_tail=False))
+        counted = counter.take()
+        print(f"[INFO] {os.path.basename(file_path)}: {expected} words")
+        if counted != expected:
+            failures.append(f"{file_path}: batched count {counted}, expected {expected}")
+    return failures
+
+def main():
+    failures = check_whitespace_table() + check_random_text() + check_bundled_paragraphs()
+
+    print("\n[SUMMARY]")
+    print(f"Random cases: {RANDOM_CASES}")
+    print(f"Failures: {len(failures)}")
+    for failure in failures[:20]:
+        print(f"[ERROR] {failure}")
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()